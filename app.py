@@ -1,25 +1,55 @@
+from warmup import warmup                 # Tempi di avvio e warm-up in background (importato per primo)
 import os
-import vertexai                           # Libreria per Google Vertex AI
-from vertexai.generative_models import GenerativeModel  # Modello AI Gemini
-from flask import Flask, request, jsonify # Flask per web server
+import json
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Flask, request, jsonify, Response, stream_with_context, g, session # Flask per web server
 from flask_cors import CORS               # Per permettere richieste da browser
-from database import init_database, save_conversation, get_recent_conversations  # Funzioni database
+from datetime import datetime
+from database import init_database, get_conversations_page, get_pool  # Funzioni database
+from conversation_writer import conversation_writer  # Salvataggio asincrono delle conversazioni
 from config import Config                 # Configurazioni (database, project ID, etc.)
-from secure_config import secure_config   # Configurazione sicura A2A
-from mcp_web_scraper import get_website_context  # MCP per consultare il sito web
+from secure_config import secure_config, DATABASE_SECRETS  # Configurazione sicura A2A
+from page_cache import CachedPage          # Pagina del sito letta una volta per le domande in blocco
+from mcp_web_scraper import get_scraper, get_website_context, page_cache, scraper_flight, scraper_upstream, start_background_crawl  # MCP per consultare il sito web
+from faq import format_faq_list           # FAQ della startup
+from intent_router import get_intent_router  # Sceglie tra FAQ, solo modello e sito web
+from response_cache import ResponseCache  # Cache delle risposte del modello
+from prompt_builder import PromptBuilder  # Prompt con budget di token
+from batch import BatchRun, parse_jsonl  # Domande in blocco
+from retention import conversation_archive, get_history_page, iter_history, retention_job, start_retention_job  # Archivio delle conversazioni vecchie
+from session_store import SessionHistory, create_session_store, new_session_id, session_secret, valid_session_id  # Sessioni
+from resilience import SingleFlight, Upstream, UpstreamBusy  # Limiti e coalescenza delle chiamate a Gemini
+from metrics import span, record_tokens, record_prompt, start_trace, end_trace, metrics_response, stats_collector, SamplingProfiler  # Metriche /metrics
 
 
-# Inizializza Vertex AI con autenticazione automatica
-vertexai.init(project=Config.PROJECT_ID, location=Config.LOCATION) # Connessione a Google Cloud
-model = GenerativeModel("gemini-2.5-flash") # Carica il modello AI Gemini
+# Modello AI Gemini: creato al primo uso da get_model() (o dal warm-up), non all'import
+model = None
+_model_lock = threading.Lock()
 
-SYSTEM_PROMPT = """
+def get_model():
+    """
+    Restituisce il modello Gemini, inizializzando Vertex AI al primo uso
+    Thread-safe: se più richieste arrivano insieme il modello viene creato una volta sola
+    """
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                with span('model_init'):
+                    import vertexai                           # Libreria per Google Vertex AI
+                    from vertexai.generative_models import GenerativeModel
+                    vertexai.init(project=Config.PROJECT_ID, location=Config.LOCATION) # Connessione a Google Cloud
+                    # Le istruzioni fisse vanno come system_instruction: il prompt di ogni richiesta
+                    # contiene solo contesto e domanda
+                    model = GenerativeModel("gemini-2.5-flash", system_instruction=SYSTEM_PROMPT)
+    return model
+
+SYSTEM_PROMPT = f"""
 1. Rispondi SOLO alle seguenti FAQ della startup tech o domande generali che si riferiscono a startup e che possono essere risposte con una frase delle seguenti:
-   - "Che prodotto sviluppate?" → "Sviluppiamo soluzioni AI"
-   - "Dove avete la sede?" → "Siamo una startup di Milano con team remoto"
-   - "Come funziona il vostro prodotto?" → "Utilizziamo Vertex AI di Google"
-   - "Chi può usare il prodotto?" → "Aziende che gestiscono grandi volumi di documenti"
-   - "Quanto costa?" → "Offriamo piani personalizzati in base al numero delle richieste/volume dell'azienda"
+{format_faq_list()}
 
 2. Se l'utente chiede qualcosa NON nelle FAQ sopra, consulta il sito web Alomana per trovare informazioni aggiuntive.
 
@@ -30,60 +60,478 @@ SYSTEM_PROMPT = """
     # - Se chiedi altro, dice "Mi dispiace, posso rispondere solo alle FAQ"
     # - Non inventa informazioni
 
+# Contesto dal sito compresso entro il budget di token prima di ogni chiamata
+prompt_builder = PromptBuilder(SYSTEM_PROMPT, context_budget=Config.PROMPT_CONTEXT_BUDGET,
+                               history_budget=Config.PROMPT_HISTORY_BUDGET)
+
+# Ultimi turni di ogni sessione, passati al modello a ogni domanda
+session_store = create_session_store()
+
+# Storia delle sessioni sconosciute letta dal database con un tempo massimo
+# (SESSION_RESTORE_TIMEOUT): con MySQL lento o giù la richiesta prosegue senza storia
+# invece di aspettare il timeout del pool e quello di connessione
+session_restore_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='session-restore')
+
+# Cache delle risposte: domande ripetute non richiamano il modello
+response_cache = ResponseCache(ttl=Config.RESPONSE_CACHE_TTL, max_bytes=Config.RESPONSE_CACHE_MAX_BYTES)
+
+# Chiamate a Gemini: concorrenza e rate limitati (evita i 429 di Vertex nei picchi),
+# retry con backoff sugli errori temporanei; prompt identici in corso condividono una chiamata
+model_upstream = Upstream(
+    'model',
+    max_concurrency=Config.MODEL_MAX_CONCURRENCY,
+    rate=Config.MODEL_RATE,
+    burst=Config.MODEL_BURST,
+    max_retries=Config.UPSTREAM_MAX_RETRIES,
+    backoff_base=Config.UPSTREAM_BACKOFF_BASE,
+    backoff_max=Config.UPSTREAM_BACKOFF_MAX,
+    deadline=Config.MODEL_DEADLINE,
+    queue_timeout=Config.UPSTREAM_QUEUE_TIMEOUT
+)
+model_flight = SingleFlight('model')
+
 app = Flask(__name__) # Crea l'applicazione Flask
 CORS(app) # Permette richieste da browser (per l'interfaccia web)
 
+# La sessione di conversazione viaggia in un cookie firmato con SESSION_SECRET e non leggibile
+# da JavaScript: il client non può scegliere né leggere l'ID di sessione di un altro utente
+SESSION_COOKIE_CONFIG = {
+    'SESSION_COOKIE_NAME': 'chat_session',
+    'SESSION_COOKIE_HTTPONLY': True,
+    'SESSION_COOKIE_SAMESITE': 'Lax',
+    'SESSION_COOKIE_SECURE': Config.SESSION_COOKIE_SECURE,
+}
+app.secret_key = session_secret()
+app.config.update(SESSION_COOKIE_CONFIG)
+
+# Statistiche interne esportate come gauge su /metrics
+stats_collector.add('writer', conversation_writer.stats)
+stats_collector.add('db_pool', lambda: get_pool().stats())
+stats_collector.add('page_cache', page_cache.stats)
+stats_collector.add('response_cache', lambda: response_cache.stats())
+stats_collector.add('warmup', warmup.stats)
+stats_collector.add('sessions', session_store.stats)
+stats_collector.add('model_upstream', lambda: {**model_upstream.stats(), **model_flight.stats()})
+stats_collector.add('scraper_upstream', lambda: {**scraper_upstream.stats(), **scraper_flight.stats()})
+stats_collector.add('archive', lambda: {**conversation_archive.stats(), **retention_job.stats()})
+
+@app.before_request
+def begin_request_timing():
+    # Tempi per fase della richiesta (vedi metrics.span)
+    g.trace, g.trace_token = start_trace(request.endpoint or 'unknown')
+    # Profiler a campionamento su richiesta: header X-Profile: 1 o ?profile=1
+    g.profiler = None
+    if Config.PROFILING_ENABLED and (request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'):
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def remember_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_timing(exc):
+    # Con stream_with_context il teardown può essere chiamato due volte: chiudiamo una volta sola
+    if getattr(g, 'profiler', None) is not None:
+        g.profiler.stop(request.path)
+        g.profiler = None
+    if getattr(g, 'trace', None) is not None:
+        end_trace(g.trace, g.trace_token, 500 if exc else getattr(g, 'status', 200))
+        g.trace = None
+
+def route_message(user_message):
+    """
+    Sceglie il percorso della domanda: FAQ diretta, solo modello o sito web + modello
+    """
+    with span('intent_route'):
+        route = get_intent_router().route(user_message)
+    print(f"🧭 Intento: {route.intent} (similarità {route.score:.2f})")
+    return route
+
+def get_context(user_message, route=None, page=None):
+    """
+    Restituisce il contesto dal sito web per la domanda ("" se non serve)
+    """
+    # Se la domanda riguarda il sito, consultalo con MCP
+    route = route or route_message(user_message)
+    if not needs_site(route):
+        return ""
+    with span('website_context'):
+        website_context = get_website_context(user_message, page)
+    print(f"Contesto dal sito web: {website_context[:200]}...")
+    return website_context
+
+def needs_site(route):
+    """Vero se la domanda va completata con il contenuto del sito (condiviso con async_app.py)"""
+    if route.intent == 'site':
+        print("Domanda non nelle FAQ base, consultando il sito web...")
+        return True
+    return False
+
+def build_prompt(user_message, website_context="", history=None):
+    """
+    Costruisce il prompt per Gemini: storia della sessione, contesto dal sito (compresso) e domanda
+    Le FAQ e le istruzioni sono già nel modello come system_instruction
+    """
+    with span('prompt_build'):
+        built = prompt_builder.build(user_message, website_context, history)
+    record_prompt(built.tokens)
+    return built.text
+
+def session_from_cookie(cookie):
+    """
+    ID di sessione dal cookie firmato (flask.session o quart.session); senza cookie valido
+    ne crea uno nuovo. La sessione nasce qui, al primo messaggio: aprire la pagina non
+    occupa lo store
+    
+    Returns:
+        (session_id, True se la sessione è nuova)
+    """
+    session_id = cookie.get('id')
+    if valid_session_id(session_id):
+        return session_id, False
+    session_id = new_session_id()
+    cookie['id'] = session_id
+    return session_id, True
+
+def resolve_session(cookie):
+    """
+    Sessione della richiesta e la sua storia; una sessione nuova non viene cercata nel database
+    
+    Returns:
+        (session_id, storia della sessione)
+    """
+    session_id, new = session_from_cookie(cookie)
+    return session_id, SessionHistory() if new else load_history(session_id)
+
+def load_history(session_id):
+    """
+    Storia della sessione dallo store; se manca (altro worker, riavvio) riprende
+    gli ultimi turni salvati nel database
+    """
+    history = session_store.get(session_id)
+    if history is not None:
+        return history
+    future = session_restore_executor.submit(get_conversations_page, limit=session_store.window,
+                                             session_id=session_id)
+    # Se il database non risponde la storia vuota non va nello store: al prossimo
+    # messaggio riproviamo invece di perdere per sempre i turni salvati
+    try:
+        with span('session_restore'):
+            rows, _ = future.result(timeout=Config.SESSION_RESTORE_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        print(f"⚠️ Storia della sessione non recuperata entro {Config.SESSION_RESTORE_TIMEOUT}s, continuo senza")
+        return SessionHistory()
+    except Exception as e:
+        print(f"⚠️ Impossibile recuperare la sessione dal database: {e}")
+        return SessionHistory()
+    history = SessionHistory("", tuple((row['user_message'], row['ai_response']) for row in reversed(rows)))
+    session_store.put(session_id, history)
+    return history
+
+def remember_turn(session_id, user_message, ai_response, user_ip):
+    """Aggiunge il turno alla sessione e lo mette in coda per il database"""
+    session_store.append(session_id, user_message, ai_response)
+    # 🔥 SALVA NEL DATABASE (in coda, scritto in background a gruppi)
+    conversation_writer.enqueue(user_message, ai_response, user_ip, session_id)
+
 @app.route('/chat', methods=['POST']) # Route per ricevere messaggi
 def chat():
     try:
         user_message = request.json['message'] # Prende il messaggio dall'utente
         user_ip = request.remote_addr # Prende l'IP dell'utente
+        session_id, history = resolve_session(session)
         
         print(f"Ricevuto messaggio: {user_message}")
-        
-        # Controlla se la domanda è nelle FAQ base
-        faq_keywords = ['prodotto', 'sede', 'funziona', 'chi può', 'costo', 'quanto costa']
-        is_faq = any(keyword in user_message.lower() for keyword in faq_keywords)
-        
-        # Se non è una FAQ base, consulta il sito web con MCP
-        website_context = ""
-        if not is_faq:
-            print("Domanda non nelle FAQ base, consultando il sito web...")
-            website_context = get_website_context(user_message)
-            print(f"Contesto dal sito web: {website_context[:200]}...")
-        
-        # Chiama Vertex AI con il contesto del sito web
-        full_prompt = f"{SYSTEM_PROMPT}\n\n"
-        if website_context:
-            full_prompt += f"Informazioni dal sito web Alomana:\n{website_context}\n\n"
-        full_prompt += f"Utente: {user_message}\nAssistente:"
-        
-        print(f"Chiamando Vertex AI...")
-        response = model.generate_content(full_prompt) # Genera la risposta dell'AI
-        ai_response = response.text # Prende la risposta
+        ai_response = answer_message(user_message, history) # Genera la risposta dell'AI
         print(f"Risposta AI: {ai_response}")
         
-        # 🔥 SALVA NEL DATABASE
-        save_conversation(user_message, ai_response, user_ip) # Salva tutto nel database
+        remember_turn(session_id, user_message, ai_response, user_ip)
         
         return jsonify({'response': ai_response}) # Restituisce la risposta in JSON
     
+    except UpstreamBusy as e:
+        print(f"⚠️ {e}")
+        return busy_response(e)
     except Exception as e:
         print(f"Errore nel chat: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'Errore interno: {str(e)}'}), 500
 
+def answer_message(user_message, history=None, page=None):
+    """
+    Risposta a una domanda: FAQ, cache delle risposte o Gemini
+    
+    Args:
+        page: pagina del sito già letta (domande in blocco), altrimenti presa dalla cache
+    """
+    ai_response, website_context, cache_key = lookup_answer(user_message, history, page)
+    if ai_response is None:
+        full_prompt = build_prompt(user_message, website_context, history)
+        print("Chiamando Vertex AI...")
+        ai_response = generate_answer(full_prompt, cache_key)
+    return ai_response
+
+def generate_answer(full_prompt, cache_key):
+    """
+    Risposta di Gemini entro i limiti di model_upstream
+    Se lo stesso prompt è già in corso per un'altra richiesta aspetta quella risposta
+    invece di chiamare di nuovo il modello
+    """
+    def call():
+        response = model_upstream.call(lambda: get_model().generate_content(full_prompt))
+        record_tokens(response)
+        response_cache.put(cache_key, response.text)
+        return response.text
+    
+    with span('model_call'):
+        return model_flight.do(cache_key, call)
+
+def busy_response(error):
+    """503 con Retry-After quando Gemini è saturo"""
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response, 503
+
+def lookup_answer(user_message, history=None, page=None):
+    """
+    Cerca una risposta senza chiamare il modello: FAQ (anche riformulata) o cache delle risposte
+    La storia della sessione fa parte della chiave: la stessa domanda in un'altra
+    conversazione può avere un'altra risposta
+    
+    Returns:
+        (risposta o None, contesto dal sito web, chiave di cache)
+    """
+    route = route_message(user_message)
+    if route.intent == 'faq':
+        return faq_lookup(route)
+    return cached_lookup(user_message, get_context(user_message, route, page), history)
+
+def faq_lookup(route):
+    """Esito di lookup_answer() per una FAQ riconosciuta (condiviso con async_app.py)"""
+    print("FAQ riconosciuta, risposta diretta senza chiamare il modello")
+    return route.answer, "", None
+
+def cached_lookup(user_message, website_context, history=None):
+    """Esito di lookup_answer() dato il contesto: risposta in cache (o None) e chiave di cache"""
+    with span('response_cache'):
+        history_text = history.as_text() if history else ""
+        cache_key = response_cache.make_key(user_message, SYSTEM_PROMPT, website_context + history_text)
+        cached = response_cache.get(cache_key)
+    if cached is not None:
+        print("Risposta trovata in cache")
+    return cached, website_context, cache_key
+
+def sse_event(data, event=None):
+    """Formatta un evento Server-Sent Events"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/chat/stream', methods=['POST']) # Come /chat ma invia i token man mano (SSE)
+def chat_stream():
+    try:
+        user_message = request.json['message']
+        user_ip = request.remote_addr
+        session_id, history = resolve_session(session)
+        print(f"Ricevuto messaggio (stream): {user_message}")
+        cached_response, website_context, cache_key = lookup_answer(user_message, history)
+    except Exception as e:
+        print(f"Errore nel chat stream: {e}")
+        return jsonify({'error': f'Errore interno: {str(e)}'}), 500
+    
+    def generate():
+        if cached_response is not None:
+            # Risposta già pronta: un solo evento con tutto il testo
+            remember_turn(session_id, user_message, cached_response, user_ip)
+            yield sse_event({'token': cached_response})
+            yield sse_event({'response': cached_response}, event='done')
+            return
+        
+        parts = []
+        try:
+            full_prompt = build_prompt(user_message, website_context, history)
+            chunk = None
+            # Lo stream occupa uno slot finché non finisce; non viene ritentato
+            with span('model_call'), model_upstream.slot():
+                for chunk in get_model().generate_content(full_prompt, stream=True):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # Chunk senza testo (es. solo metadati)
+                    if text:
+                        parts.append(text)
+                        yield sse_event({'token': text})
+            record_tokens(chunk)  # L'ultimo chunk contiene il conteggio dei token
+            ai_response = ''.join(parts)
+            print(f"Risposta AI (stream): {ai_response}")
+            response_cache.put(cache_key, ai_response)
+            # Salva solo quando la risposta è completa
+            remember_turn(session_id, user_message, ai_response, user_ip)
+            yield sse_event({'response': ai_response}, event='done')
+        except UpstreamBusy as e:
+            print(f"⚠️ {e}")
+            yield sse_event({'error': str(e), 'retry_after': e.retry_after}, event='error')
+        except Exception as e:
+            print(f"Errore durante lo streaming: {e}")
+            yield sse_event({'error': f'Errore interno: {str(e)}'}, event='error')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/chat/batch', methods=['POST']) # Domande in blocco: JSONL in ingresso, NDJSON in uscita
+def chat_batch():
+    try:
+        options = parse_batch_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    lines = request.get_data(as_text=True).splitlines()
+    if len(lines) > Config.BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'Massimo {Config.BATCH_MAX_QUESTIONS} domande per richiesta'}), 413
+    print(f"Blocco di {len(lines)} domande ({options['workers']} worker)")
+    return Response(batch_lines(lines, user_ip=request.remote_addr, **options), mimetype='application/x-ndjson')
+
+def parse_batch_args(args):
+    """
+    Legge i parametri di /chat/batch: workers, persist (true/false)
+    
+    Raises:
+        ValueError se un parametro non è valido
+    """
+    workers = int(args.get('workers', Config.BATCH_WORKERS))
+    if not 1 <= workers <= Config.BATCH_MAX_WORKERS:
+        raise ValueError(f"workers deve essere tra 1 e {Config.BATCH_MAX_WORKERS}")
+    persist = args.get('persist', 'true').lower()
+    if persist not in ('true', 'false'):
+        raise ValueError("persist deve essere true o false")
+    return {'workers': workers, 'persist': persist == 'true'}
+
+def run_batch(lines, workers=Config.BATCH_WORKERS, persist=True, user_ip=None):
+    """
+    Esegue un blocco di domande (righe JSONL) e restituisce (BatchRun, risultati man mano)
+    La pagina del sito viene letta una volta per tutto il blocco; ogni domanda è
+    indipendente (nessuna sessione) e passa per FAQ, cache delle risposte e Gemini come /chat
+    """
+    scraper = get_scraper()
+    # Sito irraggiungibile: pagina vuota (informazioni di fallback) invece di riprovare a ogni domanda
+    page = scraper.get_page() or CachedPage(scraper.website_url, "", {})
+    
+    def answer(message):
+        ai_response = answer_message(message, page=page)
+        if persist:
+            conversation_writer.enqueue(message, ai_response, user_ip)
+        return ai_response
+    
+    batch = BatchRun(answer, workers=workers)
+    return batch, batch.run(parse_jsonl(lines))
+
+def batch_lines(lines, workers=Config.BATCH_WORKERS, persist=True, user_ip=None):
+    """Una riga JSON per risposta, poi una riga con il riepilogo del blocco"""
+    batch, results = run_batch(lines, workers, persist, user_ip)
+    for count, result in enumerate(results, 1):
+        yield json.dumps(result, ensure_ascii=False) + '\n'
+        if count % 100 == 0:
+            print(f"⏳ Blocco: {batch.stats()}")
+    summary = batch.stats()
+    print(f"✅ Blocco completato: {summary}")
+    yield json.dumps({'summary': summary}) + '\n'
+
+def parse_history_args(args):
+    """
+    Legge i parametri di /history: limit, cursor, since, until (ISO 8601), ip, session_id, format
+    
+    Raises:
+        ValueError se un parametro non è valido
+    """
+    limit = int(args.get('limit', 20))
+    if not 1 <= limit <= 100:
+        raise ValueError("limit deve essere tra 1 e 100")
+    fmt = args.get('format', 'json')
+    if fmt not in ('json', 'ndjson'):
+        raise ValueError("format deve essere json o ndjson")
+    since = args.get('since')
+    until = args.get('until')
+    return {
+        'limit': limit,
+        'cursor': args.get('cursor'),
+        'since': datetime.fromisoformat(since) if since else None,
+        'until': datetime.fromisoformat(until) if until else None,
+        'user_ip': args.get('ip'),
+        'session_id': args.get('session_id'),
+        'format': fmt,
+    }
+
+# Campi restituiti da /history: l'endpoint è pubblico, IP e ID di sessione restano interni
+# (servono solo ai filtri e all'archivio)
+HISTORY_FIELDS = ('user_message', 'ai_response', 'timestamp')
+
+def public_conversation(row):
+    """Riga di /history con i soli campi pubblici"""
+    return {field: row[field] for field in HISTORY_FIELDS}
+
+def ndjson_lines(conversations):
+    """Una riga JSON per conversazione (export in streaming)"""
+    for conversation in conversations:
+        yield json.dumps(public_conversation(conversation), ensure_ascii=False) + '\n'
+
 @app.route('/history', methods=['GET'])
 def get_history():
-    conversations = get_recent_conversations(20) # Prende le ultime 20 conversazioni
-    return jsonify({'conversations': conversations}) # Le restituisce in JSON
+    try:
+        params = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if params['format'] == 'ndjson':
+        # Export completo in streaming: le righe non vengono mai caricate tutte in memoria
+        rows = iter_history(params['since'], params['until'], params['user_ip'], params['session_id'])
+        return Response(stream_with_context(ndjson_lines(rows)), mimetype='application/x-ndjson')
+    
+    try:
+        conversations, next_cursor = get_history_page(
+            params['limit'], params['cursor'], params['since'], params['until'], params['user_ip'],
+            params['session_id']
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'conversations': [public_conversation(row) for row in conversations],
+                    'next_cursor': next_cursor}) # Le restituisce in JSON
 
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify(collect_stats())
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Istogrammi di latenza per fase e contatori in formato Prometheus
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
 
-@app.route('/', methods=['GET'])
-def home():
-    return '''
+@app.route('/ready', methods=['GET'])
+def ready():
+    # Readiness: 200 quando il warm-up è finito, 503 mentre è in corso (stato di ogni fase nel corpo)
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+def collect_stats():
+    # Statistiche interne: coda di scrittura, pool database e cache del sito
+    return {
+        'writer': conversation_writer.stats(),
+        'db_pool': get_pool().stats(),
+        'page_cache': page_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'sessions': session_store.stats(),
+        'model_upstream': {**model_upstream.stats(), **model_flight.stats()},
+        'scraper_upstream': {**scraper_upstream.stats(), **scraper_flight.stats()},
+        'archive': {**conversation_archive.stats(), **retention_job.stats()},
+    }
+
+
+# Pagina della chat; __SESSION_ID__ viene sostituito a ogni caricamento
+HOME_PAGE = '''
     <!DOCTYPE html>
     <html>
     <head>
@@ -113,6 +561,17 @@ def home():
             const chatForm = document.getElementById('chatForm');
             const messageInput = document.getElementById('messageInput');
             const chat = document.getElementById('chat');
+            const sendButton = chatForm.querySelector('button');
+            
+            // Nodi creati con textContent: il testo dell'utente e del modello non viene mai interpretato come HTML
+            function addMessage(className, text) {
+                const div = document.createElement('div');
+                div.className = className + ' message';
+                div.textContent = text;
+                chat.appendChild(div);
+                chat.scrollTop = chat.scrollHeight;
+                return div;
+            }
             
             chatForm.addEventListener('submit', async (e) => {
                 e.preventDefault();
@@ -120,24 +579,54 @@ def home():
                 if (!message) return;
                 
                 // Aggiungi messaggio utente
-                chat.innerHTML += `<div class="user message">${message}</div>`;
+                addMessage('user', message);
                 messageInput.value = '';
-                chat.scrollTop = chat.scrollHeight;
                 
-                // Invia a AI
+                // Una domanda alla volta: il form resta disattivato finché la risposta non è finita
+                messageInput.disabled = true;
+                sendButton.disabled = true;
+                
+                // Invia a AI e mostra la risposta man mano che arrivano i token
+                const aiMessage = addMessage('ai', '');
                 try {
-                    const response = await fetch('/chat', {
+                    const response = await fetch('/chat/stream', {
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ message: message })
+                        body: JSON.stringify({ message: message })  // La sessione viaggia nel cookie
                     });
-                    const data = await response.json();
-                    
-                    // Aggiungi risposta AI
-                    chat.innerHTML += `<div class="ai message">${data.response}</div>`;
-                    chat.scrollTop = chat.scrollHeight;
+                    if (!response.ok) {
+                        const data = await response.json();
+                        throw new Error(data.error);
+                    }
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        // Ogni evento SSE termina con una riga vuota
+                        const events = buffer.split('\n\n');
+                        buffer = events.pop();
+                        for (const raw of events) {
+                            let eventName = 'message';
+                            let payload = '';
+                            for (const line of raw.split('\n')) {
+                                if (line.startsWith('event: ')) eventName = line.slice(7);
+                                if (line.startsWith('data: ')) payload += line.slice(6);
+                            }
+                            const data = JSON.parse(payload);
+                            if (eventName === 'error') throw new Error(data.error);
+                            if (data.token) aiMessage.textContent += data.token;
+                        }
+                        chat.scrollTop = chat.scrollHeight;
+                    }
                 } catch (error) {
-                    chat.innerHTML += `<div class="ai message">Errore: ${error.message}</div>`;
+                    aiMessage.textContent = `Errore: ${error.message}`;
+                } finally {
+                    messageInput.disabled = false;
+                    sendButton.disabled = false;
+                    messageInput.focus();
                 }
             });
         </script>
@@ -145,19 +634,79 @@ def home():
     </html>
     '''
 
+@app.route('/', methods=['GET'])
+def home():
+    # Ogni caricamento della pagina inizia una nuova conversazione: il cookie viene tolto e
+    # la sessione nasce al primo messaggio (chi apre solo la pagina non occupa lo store)
+    session.pop('id', None)
+    return HOME_PAGE
+
+
+def startup():
+    """
+    Operazioni di avvio da fare una volta sola (nel master Gunicorn prima del fork)
+    """
+    # Verifica autenticazione A2A
+    print("🔐 Verificando autenticazione A2A...")
+    if secure_config.verify_authentication():
+        print("✅ Autenticazione A2A verificata con successo!")
+    else:
+        print("⚠️ Autenticazione A2A non disponibile, usando fallback...")
+    
+    # Precarica i segreti del database in parallelo
+    secure_config.prefetch()
+    
+    # Inizializza database all'avvio
+    print("Inizializzazione database...")
+    init_database() # Inizializza il database
+    print("Database inizializzato!")
+
+def warm_site_cache():
+    # Scarica e indicizza la pagina del sito prima della prima domanda
+    if get_scraper().get_page() is None:
+        raise RuntimeError("sito web non raggiungibile")
+
+def start_worker():
+    """
+    Avvia le risorse di ogni processo worker (thread e connessioni non sopravvivono al fork)
+    """
+    secure_config.reset_client()
+    secure_config.start_background_refresh()
+    conversation_writer.start()
+    
+    # Risorse lente preparate in background: il worker accetta subito richieste, /ready dice quando è pronto
+    warmup.add('model', get_model)
+    warmup.add('intent_router', get_intent_router)
+    warmup.add('secrets', lambda: secure_config.prefetch(secure_config.missing_secrets(DATABASE_SECRETS)))
+    warmup.add('db_pool', lambda: get_pool().fill(), after='secrets')
+    warmup.add('site_cache', warm_site_cache)
+    warmup.start()
+    
+    # Crawl del sito in background per l'indice di ricerca
+    if Config.CRAWL_ENABLED:
+        start_background_crawl()
+    
+    # Archiviazione delle conversazioni più vecchie di RETENTION_HOT_DAYS giorni
+    if Config.RETENTION_HOT_DAYS > 0:
+        start_retention_job()
+
+def stop_worker():
+    """
+    Chiusura ordinata del worker: svuota la coda delle conversazioni e chiude il pool
+    """
+    conversation_writer.shutdown()
+    get_pool().close()
+
+warmup.imported('app.py')
+
 if __name__ == '__main__':
+    # Server di sviluppo Flask (in produzione: gunicorn -c gunicorn.conf.py app:app)
     try:
-        # Verifica autenticazione A2A
-        print("🔐 Verificando autenticazione A2A...")
-        if secure_config.verify_authentication():
-            print("✅ Autenticazione A2A verificata con successo!")
-        else:
-            print("⚠️ Autenticazione A2A non disponibile, usando fallback...")
+        startup()
+        start_worker()
         
-        # Inizializza database all'avvio
-        print("Inizializzazione database...")
-        init_database() # Inizializza il database
-        print("Database inizializzato!")
+        # SIGTERM (Cloud Run) chiude il processo passando da atexit, così la coda viene svuotata
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
         
         # Usa la porta da variabile d'ambiente (Cloud Run) o default 8080 (locale)
         port = int(os.environ.get('PORT', 8080))
@@ -167,4 +716,4 @@ if __name__ == '__main__':
         print(f"Errore durante l'avvio: {e}")
         import traceback
         traceback.print_exc()
-        raise
\ No newline at end of file
+        raise
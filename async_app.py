@@ -0,0 +1,266 @@
+"""
+Versione asincrona (ASGI) del chatbot
+Stessa logica di app.py, ma download del sito, chiamata a Gemini e lettura del database
+non occupano un thread per richiesta: un solo processo gestisce centinaia di chat in corso.
+
+Avvio:
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py async_app:app
+"""
+
+import asyncio
+from quart import Quart, request, jsonify, Response, g, session
+from quart_cors import cors
+
+import app as sync_app  # FAQ, prompt, cache delle risposte, modello e avvio condivisi
+from app import (SESSION_COOKIE_CONFIG, batch_lines, build_prompt, busy_response, cached_lookup, faq_lookup,
+                 load_history, model_flight, model_upstream, ndjson_lines, needs_site, parse_batch_args,
+                 parse_history_args, public_conversation, remember_turn, route_message, response_cache,
+                 session_from_cookie, sse_event)
+from config import Config
+from mcp_web_scraper import get_website_context_async, close_async_session
+from metrics import span, record_tokens, start_trace, end_trace, metrics_response
+from resilience import UpstreamBusy
+from retention import get_history_page, iter_history
+from session_store import SessionHistory
+from warmup import warmup
+
+app = cors(Quart(__name__))
+# Stesso cookie di sessione firmato di app.py (stessa chiave)
+app.secret_key = sync_app.app.secret_key
+app.config.update(SESSION_COOKIE_CONFIG)
+
+
+async def resolve_session_async(cookie):
+    """Come app.resolve_session(), con l'eventuale lettura dal database in un thread"""
+    session_id, new = session_from_cookie(cookie)
+    if new:
+        return session_id, SessionHistory()
+    return session_id, await asyncio.to_thread(load_history, session_id)
+
+
+async def lookup_answer_async(user_message, history=None):
+    """
+    Come app.lookup_answer() (stesse funzioni di routing e cache), ma il sito web
+    viene consultato senza bloccare l'event loop
+
+    Returns:
+        (risposta o None, contesto dal sito web, chiave di cache)
+    """
+    route = route_message(user_message)
+    if route.intent == 'faq':
+        return faq_lookup(route)
+    website_context = ""
+    if needs_site(route):
+        with span('website_context'):
+            website_context = await get_website_context_async(user_message)
+        print(f"Contesto dal sito web: {website_context[:200]}...")
+    return cached_lookup(user_message, website_context, history)
+
+
+async def get_model_async():
+    """Come app.get_model(), ma la prima inizializzazione di Vertex AI non blocca l'event loop"""
+    if sync_app.model is None:
+        return await asyncio.to_thread(sync_app.get_model)
+    return sync_app.model
+
+
+async def generate_answer_async(full_prompt, cache_key):
+    """Come app.generate_answer(), con la chiamata asincrona a Gemini"""
+    model = await get_model_async()
+
+    async def call():
+        response = await model_upstream.call_async(lambda: model.generate_content_async(full_prompt))
+        record_tokens(response)
+        response_cache.put(cache_key, response.text)
+        return response.text
+
+    with span('model_call'):
+        return await model_flight.do_async(cache_key, call)
+
+
+@app.before_request
+async def begin_request_timing():
+    g.trace, g.trace_token = start_trace(request.endpoint or 'unknown')
+
+
+@app.after_request
+async def finish_request_timing(response):
+    if getattr(g, 'trace', None) is not None:
+        end_trace(g.trace, g.trace_token, response.status_code)
+        g.trace = None
+    return response
+
+
+@app.after_serving
+async def shutdown():
+    await close_async_session()
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    try:
+        data = await request.get_json()
+        user_message = data['message']
+        user_ip = request.remote_addr
+        session_id, history = await resolve_session_async(session)
+
+        print(f"Ricevuto messaggio: {user_message}")
+        ai_response, website_context, cache_key = await lookup_answer_async(user_message, history)
+
+        if ai_response is None:
+            full_prompt = build_prompt(user_message, website_context, history)
+            print("Chiamando Vertex AI (async)...")
+            ai_response = await generate_answer_async(full_prompt, cache_key)
+        print(f"Risposta AI: {ai_response}")
+
+        # Il database è già asincrono (coda write-behind), ma con SESSION_BACKEND=redis
+        # l'aggiornamento della sessione (WATCH/MULTI) è bloccante: lo facciamo in un thread
+        await asyncio.to_thread(remember_turn, session_id, user_message, ai_response, user_ip)
+
+        return jsonify({'response': ai_response})
+
+    except UpstreamBusy as e:
+        print(f"⚠️ {e}")
+        return busy_response(e)
+    except Exception as e:
+        print(f"Errore nel chat: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Errore interno: {str(e)}'}), 500
+
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    try:
+        data = await request.get_json()
+        user_message = data['message']
+        user_ip = request.remote_addr
+        session_id, history = await resolve_session_async(session)
+        print(f"Ricevuto messaggio (stream): {user_message}")
+        cached_response, website_context, cache_key = await lookup_answer_async(user_message, history)
+    except Exception as e:
+        print(f"Errore nel chat stream: {e}")
+        return jsonify({'error': f'Errore interno: {str(e)}'}), 500
+
+    async def generate():
+        if cached_response is not None:
+            await asyncio.to_thread(remember_turn, session_id, user_message, cached_response, user_ip)
+            yield sse_event({'token': cached_response})
+            yield sse_event({'response': cached_response}, event='done')
+            return
+
+        parts = []
+        try:
+            full_prompt = build_prompt(user_message, website_context, history)
+            chunk = None
+            model = await get_model_async()
+            # Lo stream occupa uno slot finché non finisce; non viene ritentato
+            with span('model_call'):
+                async with model_upstream.slot_async():
+                    stream = await model.generate_content_async(full_prompt, stream=True)
+                    async for chunk in stream:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # Chunk senza testo (es. solo metadati)
+                        if text:
+                            parts.append(text)
+                            yield sse_event({'token': text})
+            record_tokens(chunk)  # L'ultimo chunk contiene il conteggio dei token
+            ai_response = ''.join(parts)
+            print(f"Risposta AI (stream): {ai_response}")
+            response_cache.put(cache_key, ai_response)
+            await asyncio.to_thread(remember_turn, session_id, user_message, ai_response, user_ip)
+            yield sse_event({'response': ai_response}, event='done')
+        except UpstreamBusy as e:
+            print(f"⚠️ {e}")
+            yield sse_event({'error': str(e), 'retry_after': e.retry_after}, event='error')
+        except Exception as e:
+            print(f"Errore durante lo streaming: {e}")
+            yield sse_event({'error': f'Errore interno: {str(e)}'}, event='error')
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/chat/batch', methods=['POST'])
+async def chat_batch():
+    try:
+        options = parse_batch_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    lines = (await request.get_data(as_text=True)).splitlines()
+    if len(lines) > Config.BATCH_MAX_QUESTIONS:
+        return jsonify({'error': f'Massimo {Config.BATCH_MAX_QUESTIONS} domande per richiesta'}), 413
+    print(f"Blocco di {len(lines)} domande ({options['workers']} worker)")
+
+    # Il blocco usa il pool di worker a thread di app.py: leggiamo i risultati senza bloccare l'event loop
+    results = batch_lines(lines, user_ip=request.remote_addr, **options)
+
+    async def stream():
+        while True:
+            line = await asyncio.to_thread(next, results, None)
+            if line is None:
+                return
+            yield line
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
+@app.route('/history', methods=['GET'])
+async def get_history():
+    try:
+        params = parse_history_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Le query usano il pool sincrono: le eseguiamo in un thread per non bloccare l'event loop
+    if params['format'] == 'ndjson':
+        lines = ndjson_lines(iter_history(params['since'], params['until'], params['user_ip'],
+                                          params['session_id']))
+
+        async def stream():
+            while True:
+                line = await asyncio.to_thread(next, lines, None)
+                if line is None:
+                    return
+                yield line
+
+        return Response(stream(), mimetype='application/x-ndjson')
+
+    try:
+        conversations, next_cursor = await asyncio.to_thread(
+            get_history_page,
+            params['limit'], params['cursor'], params['since'], params['until'], params['user_ip'],
+            params['session_id']
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'conversations': [public_conversation(row) for row in conversations], 'next_cursor': next_cursor})
+
+
+@app.route('/stats', methods=['GET'])
+async def get_stats():
+    return jsonify(sync_app.collect_stats())
+
+
+@app.route('/ready', methods=['GET'])
+async def ready():
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    body, content_type = metrics_response()
+    return Response(body, content_type=content_type)
+
+
+@app.route('/', methods=['GET'])
+async def home():
+    # Come app.home(): nuova conversazione a ogni caricamento, sessione creata al primo messaggio
+    session.pop('id', None)
+    return sync_app.HOME_PAGE
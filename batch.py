@@ -0,0 +1,141 @@
+"""
+Domande in blocco (endpoint /chat/batch e batch_runner.py)
+
+Ogni riga del file JSONL è una domanda: {"id": "q1", "message": "Quanto costa?"}
+(id facoltativo, "question" accettato al posto di "message"). Le domande vengono
+eseguite da un numero limitato di worker con lo stesso percorso di /chat, e i
+risultati escono man mano che sono pronti (non nell'ordine del file: c'è "index").
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+
+from resilience import UpstreamBusy
+
+
+class BatchItem(NamedTuple):
+    """Una domanda del file (error se la riga non è valida)"""
+    index: int
+    id: Optional[str]
+    message: Optional[str]
+    error: Optional[str] = None
+
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[BatchItem]:
+    """Domande da righe JSONL; le righe vuote vengono saltate, quelle non valide diventano errori"""
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+            if isinstance(data, str):
+                data = {'message': data}
+            message = data.get('message', data.get('question'))
+            if not isinstance(message, str) or not message.strip():
+                raise ValueError("manca il campo message")
+            item_id = data.get('id')
+            yield BatchItem(index, None if item_id is None else str(item_id), message)
+        except (ValueError, AttributeError) as e:
+            yield BatchItem(index, None, None, f"riga non valida: {e}")
+        index += 1
+
+
+class BatchRun:
+    """
+    Esecuzione di un blocco di domande con un pool di worker limitato
+
+    Args:
+        answer: funzione messaggio -> risposta (stesso percorso di /chat)
+        workers: domande in parallelo
+        busy_retries: tentativi quando Gemini è saturo (UpstreamBusy): un blocco può aspettare
+    """
+
+    def __init__(self, answer: Callable[[str], str], workers: int = 8, busy_retries: int = 5):
+        self.answer = answer
+        self.workers = workers
+        self.busy_retries = busy_retries
+        self.started = time.perf_counter()
+        self.done = 0
+        self.ok = 0
+        self.errors = 0
+        self.latencies_ms = []
+        self._lock = threading.Lock()
+
+    def _answer(self, item: BatchItem) -> dict:
+        start = time.perf_counter()
+        result = {'index': item.index, 'id': item.id, 'message': item.message}
+        for attempt in range(self.busy_retries + 1):
+            try:
+                result['response'] = self.answer(item.message)
+                break
+            except UpstreamBusy as e:
+                if attempt == self.busy_retries:
+                    result['error'] = str(e)
+                    break
+                time.sleep(e.retry_after)
+            except Exception as e:
+                result['error'] = f"Errore interno: {e}"
+                break
+        result['ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return self._record(result)
+
+    def _record(self, result: dict) -> dict:
+        with self._lock:
+            self.done += 1
+            if 'error' in result:
+                self.errors += 1
+            else:
+                self.ok += 1
+                self.latencies_ms.append(result['ms'])
+        return result
+
+    def run(self, items: Iterable[BatchItem]) -> Iterator[dict]:
+        """
+        Esegue le domande e restituisce i risultati appena pronti
+        Al massimo 2 × workers domande sono in coda: anche un file enorme non viene caricato tutto
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='batch')
+        pending = set()
+        try:
+            for item in items:
+                if item.error:
+                    yield self._record({'index': item.index, 'id': item.id, 'error': item.error, 'ms': 0.0})
+                    continue
+                pending.add(executor.submit(self._answer, item))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            # Se il client si disconnette non eseguiamo le domande ancora in coda
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Avanzamento e throughput del blocco"""
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            latencies = sorted(self.latencies_ms)
+            done, ok, errors = self.done, self.ok, self.errors
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            'done': done,
+            'ok': ok,
+            'errors': errors,
+            'elapsed_s': round(elapsed, 2),
+            'questions_per_s': round(done / elapsed, 1) if elapsed > 0 else 0.0,
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': latencies[-1] if latencies else 0.0,
+        }
@@ -0,0 +1,87 @@
+"""
+Esegue un file di domande con lo stesso percorso di /chat, senza passare da HTTP
+(per confrontare le risposte prima e dopo una modifica al prompt)
+
+Uso:
+    python batch_runner.py domande.jsonl [-o risposte.jsonl] [--workers 4] [--no-persist]
+                           [--stub-model] [--model-latency 0.05] [--progress 2]
+
+- domande.jsonl: una domanda per riga, {"id": "q1", "message": "..."} (vedi batch.py)
+- le risposte vengono scritte man mano, una riga JSON per domanda (stdout se manca -o)
+- avanzamento e throughput su stderr ogni --progress secondi, riepilogo finale su stderr
+- --no-persist: le risposte non vengono salvate nel database
+- --stub-model: modello finto locale (benchmarks/offline_stubs.py), senza Google Cloud né
+  database né rate limit: per provare il runner o misurarne il throughput offline (implica --no-persist)
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('questions', help="file JSONL con le domande ('-' per stdin)")
+    parser.add_argument('-o', '--output', help="file JSONL per le risposte (default: stdout)")
+    parser.add_argument('--workers', type=int, default=None, help="domande in parallelo (default BATCH_WORKERS)")
+    parser.add_argument('--no-persist', action='store_true', help="non salvare le risposte nel database")
+    parser.add_argument('--stub-model', action='store_true', help="modello finto locale, nessuna chiamata a Vertex AI")
+    parser.add_argument('--model-latency', type=float, default=0.05, help="secondi per risposta del modello finto")
+    parser.add_argument('--progress', type=float, default=2.0, help="secondi tra due righe di avanzamento")
+    args = parser.parse_args()
+
+    if args.stub_model:
+        sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+        import offline_stubs
+        offline_stubs.install()
+        offline_stubs.StubGenerativeModel.latency = args.model_latency
+        args.no_persist = True
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    questions = sys.stdin if args.questions == '-' else open(args.questions, encoding='utf-8')
+
+    # Il log dell'app va su stderr: stdout può contenere le risposte
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as chat_app
+        from config import Config
+        from conversation_writer import conversation_writer
+        from database import get_pool
+
+        if args.stub_model:
+            chat_app.model = offline_stubs.StubGenerativeModel(system_instruction=chat_app.SYSTEM_PROMPT)
+            chat_app.model_upstream.bucket.rate = 0  # la quota di Vertex non vale per il modello finto
+        persist = not args.no_persist
+        if persist:
+            conversation_writer.start()
+
+        batch, results = chat_app.run_batch(questions, workers=args.workers or Config.BATCH_WORKERS,
+                                            persist=persist)
+        last_report = time.monotonic()
+        try:
+            for result in results:
+                output.write(json.dumps(result, ensure_ascii=False) + '\n')
+                output.flush()
+                if time.monotonic() - last_report >= args.progress:
+                    last_report = time.monotonic()
+                    stats = batch.stats()
+                    print(f"⏳ {stats['done']} domande ({stats['questions_per_s']}/s, errori {stats['errors']}, "
+                          f"p95 {stats['p95_ms']}ms)")
+        finally:
+            if persist:
+                conversation_writer.shutdown()
+                get_pool().close()
+            if output is not sys.stdout:
+                output.close()
+
+        print(f"✅ Completato: {json.dumps(batch.stats())}")
+        if persist:
+            print(f"💾 Conversazioni salvate: {conversation_writer.stats()['written']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Benchmark offline del percorso di una richiesta di chat
+
+Uso:
+    python benchmarks/bench_chat.py [--concurrency 1 4 16] [--paragraphs 20 200 2000]
+                                    [--requests 200] [--model-latency 0.02]
+                                    [--label baseline] [--output results.json]
+
+Gira senza rete né credenziali (vedi offline_stubs.py):
+- Gemini è un modello finto con latenza fissa
+- il sito è un server HTTP locale con pagine di dimensione crescente
+- MySQL è sostituito da SQLite dietro lo stesso ConnectionPool
+- Secret Manager è un client in memoria
+
+Sezioni misurate:
+- chat: POST /chat (Flask test client) per scenario, concorrenza e dimensione pagina;
+  throughput, p50/p95/p99 e memoria allocata per richiesta (tracemalloc)
+- scraper: search_website_for_query() a freddo (download + parsing + indice) e con cache
+- database: save_conversations(), get_conversations_page() e iter_conversations()
+- secrets: get_secret() a freddo e dalla cache
+
+Ogni misura stampa una riga JSON; con --output l'intero run viene salvato su file
+per confrontare le esecuzioni (--label distingue i run).
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import offline_stubs  # noqa: E402
+
+offline_stubs.install()
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as chat_app  # noqa: E402
+    import database  # noqa: E402
+    import mcp_web_scraper  # noqa: E402
+    from conversation_writer import conversation_writer  # noqa: E402
+    from secure_config import DATABASE_SECRETS, SecureConfig  # noqa: E402
+
+# Numeri unici anche tra livelli diversi, così 'site' non trova mai la risposta in cache
+_request_ids = itertools.count()
+
+# Scenari: messaggio per l'i-esima richiesta
+SCENARIOS = {
+    # FAQ esatta: nessun sito, nessun modello
+    'faq': lambda i: "Quanto costa?",
+    # Domanda sul sito, sempre diversa: ricerca nel sito + modello a ogni richiesta
+    'site': lambda i: f"Quali servizi offrite alle aziende? (richiesta {next(_request_ids)})",
+    # Stessa domanda ripetuta: dopo la prima risposta serve la cache delle risposte
+    'cached': lambda i: "Come gestite la sicurezza dei documenti?",
+}
+
+QUERIES = [
+    "Quali servizi offrite alle aziende?",
+    "Dove si trova il team di Alomana?",
+    "Come gestite la sicurezza dei documenti?",
+    "Avete integrazione con il cloud?",
+    "Come posso contattare il supporto?",
+]
+
+_stdout = sys.stdout
+_results = []
+
+
+def emit(record):
+    """Stampa una riga JSON sullo stdout originale e la conserva per --output"""
+    _results.append(record)
+    _stdout.write(json.dumps(record) + "\n")
+    _stdout.flush()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(latencies_ms):
+    return {
+        'p50_ms': round(percentile(latencies_ms, 50), 3),
+        'p95_ms': round(percentile(latencies_ms, 95), 3),
+        'p99_ms': round(percentile(latencies_ms, 99), 3),
+        'mean_ms': round(statistics.mean(latencies_ms), 3) if latencies_ms else 0.0,
+    }
+
+
+def use_site(url):
+    """Punta lo scraper sul sito locale e svuota le cache"""
+    mcp_web_scraper._scraper = mcp_web_scraper.MCPWebScraper(url)
+    mcp_web_scraper.page_cache.clear()
+    chat_app.response_cache.clear()
+
+
+_local = threading.local()
+
+
+def post_chat(message):
+    client = getattr(_local, 'client', None)
+    if client is None:
+        # Senza cookie: ogni richiesta è la prima domanda di un utente diverso
+        client = _local.client = chat_app.app.test_client(use_cookies=False)
+    start = time.perf_counter()
+    response = client.post('/chat', json={'message': message})
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, response.status_code == 200
+
+
+def bench_chat(scenario, concurrency, requests_count, paragraphs):
+    message_for = SCENARIOS[scenario]
+    post_chat(message_for(-1))  # riscaldamento: sito in cache come in produzione
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: post_chat(message_for(i)), range(requests_count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [ms for ms, ok in results if ok]
+    emit({
+        'section': 'chat',
+        'scenario': scenario,
+        'paragraphs': paragraphs,
+        'concurrency': concurrency,
+        'requests': requests_count,
+        'errors': requests_count - len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        **summarize(latencies),
+    })
+
+
+def bench_chat_memory(scenario, requests_count, paragraphs):
+    """Memoria per richiesta, in sequenza: picco e memoria rimasta allocata (tracemalloc)"""
+    message_for = SCENARIOS[scenario]
+    post_chat(message_for(-1))
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for i in range(requests_count):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            post_chat(message_for(i))
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append((peak - before) / 1024)
+            retained.append((after - before) / 1024)
+    finally:
+        tracemalloc.stop()
+    emit({
+        'section': 'chat_memory',
+        'scenario': scenario,
+        'paragraphs': paragraphs,
+        'requests': requests_count,
+        'peak_kb_mean': round(statistics.mean(peaks), 1),
+        'peak_kb_max': round(max(peaks), 1),
+        'retained_kb_mean': round(statistics.mean(retained), 1),
+    })
+
+
+def bench_scraper(site, paragraphs, rounds):
+    scraper = mcp_web_scraper.get_scraper()
+    mcp_web_scraper.page_cache.clear()
+
+    start = time.perf_counter()
+    scraper.search_website_for_query(QUERIES[0])
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        scraper.search_website_for_query(QUERIES[i % len(QUERIES)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    emit({
+        'section': 'scraper',
+        'paragraphs': paragraphs,
+        'html_bytes': len(site.pages['/']),
+        'cold_ms': round(cold_ms, 3),
+        'queries': rounds,
+        **summarize(latencies),
+    })
+
+
+def bench_database(rows, batch_size, page_size):
+    base = datetime(2024, 1, 1)
+    records = [{
+        'user_message': f"Domanda {i}",
+        'ai_response': "Risposta di prova " * 20,
+        'user_ip': f"10.0.0.{i % 50}",
+        'timestamp': (base + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S'),
+    } for i in range(rows)]
+
+    start = time.perf_counter()
+    for i in range(0, rows, batch_size):
+        database.save_conversations(records[i:i + batch_size])
+    insert_s = time.perf_counter() - start
+    emit({
+        'section': 'db_insert',
+        'rows': rows,
+        'batch_size': batch_size,
+        'rows_per_s': round(rows / insert_s, 1),
+    })
+
+    latencies, cursor, pages = [], None, 0
+    while True:
+        start = time.perf_counter()
+        _, cursor = database.get_conversations_page(limit=page_size, cursor=cursor)
+        latencies.append((time.perf_counter() - start) * 1000)
+        pages += 1
+        if cursor is None or pages >= 200:
+            break
+    emit({'section': 'db_page', 'page_size': page_size, 'pages': pages, **summarize(latencies)})
+
+    start = time.perf_counter()
+    streamed = sum(1 for _ in database.iter_conversations())
+    emit({
+        'section': 'db_stream',
+        'rows': streamed,
+        'rows_per_s': round(streamed / (time.perf_counter() - start), 1),
+    })
+
+
+def bench_secrets(rounds):
+    secrets = {name: f"valore-{name}" for name in DATABASE_SECRETS}
+    config = SecureConfig(client=offline_stubs.FakeSecretManager(secrets))
+
+    start = time.perf_counter()
+    config.prefetch()
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    latencies = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        config.get_secret('db-password', 'DB_PASSWORD')
+        latencies.append((time.perf_counter() - start) * 1000)
+    emit({'section': 'secrets', 'prefetch_ms': round(cold_ms, 3), 'gets': rounds, **summarize(latencies)})
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=offline_stubs.ROOT).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[20, 200, 2000],
+                        help="dimensioni della pagina del sito locale, in paragrafi")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help="richieste per livello di concorrenza")
+    parser.add_argument('--memory-requests', type=int, default=30)
+    parser.add_argument('--model-latency', type=float, default=0.02, help="secondi per risposta del modello finto")
+    parser.add_argument('--db-rows', type=int, default=5000)
+    parser.add_argument('--label', default='')
+    parser.add_argument('--output', help="file JSON con tutti i risultati")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', DeprecationWarning)  # adattatori datetime di sqlite3
+    offline_stubs.StubGenerativeModel.latency = args.model_latency
+    offline_stubs.StubGenerativeModel.first_token_latency = args.model_latency / 4
+    chat_app.model = offline_stubs.StubGenerativeModel(system_instruction=chat_app.SYSTEM_PROMPT)
+    chat_app.model_upstream.bucket.rate = 0  # la quota di Vertex non vale per il modello finto
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as app_log:
+        offline_stubs.use_sqlite(os.path.join(tmp, 'bench.db'), max_size=max(args.concurrency) + 2)
+        conversation_writer.start()
+
+        for paragraphs in args.paragraphs:
+            pages = {'/': offline_stubs.make_html(paragraphs, seed=paragraphs)}
+            with offline_stubs.FixtureSite(pages) as site:
+                use_site(site.url)
+                bench_scraper(site, paragraphs, rounds=100)
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        bench_chat(scenario, concurrency, args.requests, paragraphs)
+                    bench_chat_memory(scenario, args.memory_requests, paragraphs)
+                app_log.seek(0)
+                app_log.truncate()
+
+        conversation_writer.shutdown()
+        bench_database(args.db_rows, batch_size=50, page_size=50)
+        bench_secrets(rounds=1000)
+        database.get_pool().close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'label': args.label,
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'model_latency_s': args.model_latency,
+                'results': _results,
+            }, f, indent=2)
+        _stdout.write(f"Risultati salvati in {args.output}\n")
+
+
+if __name__ == '__main__':
+    main()
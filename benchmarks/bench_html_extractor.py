@@ -0,0 +1,165 @@
+"""
+Benchmark: estrazione del testo HTML con i backend di html_extractor.py
+
+Uso:
+    python benchmarks/bench_html_extractor.py [--sizes 0.1 1 10] [--backends bs4 stdlib lxml selectolax]
+                                              [--repeat 5] [--max-bytes 0]
+
+Per ogni dimensione (MB) genera una pagina sintetica con menu, titoli, paragrafi,
+elenchi, tabelle, script e stili, e per ogni backend misura in un processo separato:
+- tempo di estrazione (mediana di --repeat esecuzioni)
+- picco di memoria (RSS massimo durante il parsing meno quello prima, con la pagina già in memoria)
+- blocchi estratti e frasi indicizzabili (split_passages)
+
+bs4 è il percorso precedente (BeautifulSoup con html.parser). I backend non installati
+vengono saltati. --max-bytes > 0 applica il limite di HTML_MAX_BYTES.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = (
+    "alomana startup soluzioni intelligenza artificiale milano servizi aziende documenti dati "
+    "piattaforma clienti team tecnologia vertex cloud automazione processi analisi modelli "
+    "sicurezza integrazione contatti email supporto prezzi piani volume richieste prodotto"
+).split()
+
+
+def sentence(rng, low=8, high=20):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize() + '.'
+
+
+def make_page(size_mb: float, seed: int = 42) -> bytes:
+    """Pagina HTML di circa size_mb megabyte con la struttura tipica di un sito aziendale"""
+    rng = random.Random(seed)
+    nav = ''.join(f'<li><a href="/pagina-{i}">{rng.choice(WORDS).capitalize()}</a></li>' for i in range(30))
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Alomana</title>',
+        '<style>' + 'body { margin: 0; } .card { padding: 4px; } ' * 200 + '</style>',
+        '<script>' + 'window.dataLayer = window.dataLayer || []; ' * 200 + '</script>',
+        f'</head><body><header><nav><ul>{nav}</ul></nav></header><main>',
+    ]
+    target = int(size_mb * 1024 * 1024)
+    size = sum(len(part) for part in parts)
+    section = 0
+    while size < target:
+        section += 1
+        items = ''.join(f'<li>{sentence(rng, 3, 8)}</li>' for _ in range(rng.randint(3, 8)))
+        rows = ''.join(f'<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(1, 999)} €</td></tr>' for _ in range(4))
+        paragraphs = ''.join(
+            f'<p>{sentence(rng)} <a href="/dettagli-{section}">{rng.choice(WORDS)}</a> <b>{sentence(rng, 3, 6)}</b></p>'
+            for _ in range(rng.randint(2, 5))
+        )
+        block = (f'<section class="card"><h2>{sentence(rng, 2, 5)}</h2><div><div>{paragraphs}</div></div>'
+                 f'<ul>{items}</ul><table>{rows}</table>'
+                 f'<script>track("sezione-{section}");</script></section>')
+        parts.append(block)
+        size += len(block)
+    parts.append('</main><footer><p>Email: info@alomana.com - Milano</p></footer></body></html>')
+    return ''.join(parts).encode()
+
+
+def _proc_status_kb(field: str):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> int:
+    """Azzera il picco di RSS (Linux) e restituisce l'RSS attuale in KB"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_kb('VmRSS')
+    except OSError:
+        return max_rss_kb()
+
+
+def max_rss_kb() -> int:
+    """Picco di RSS in KB (VmHWM, altrimenti ru_maxrss che non si può azzerare)"""
+    return _proc_status_kb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(backend: str, size_mb: float, repeat: int, max_bytes: int):
+    """Una misura in un processo pulito: memoria e import non condivisi con le altre misure"""
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import html_extractor
+        from site_index import split_passages
+
+    extractor = html_extractor.create_extractor(backend, max_bytes=max_bytes or 1 << 40)
+    html = make_page(size_mb)
+    extractor.extract(b'<p>riscaldamento</p>')  # import lazy del parser fuori dalla misura
+    baseline = reset_peak_rss()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extracted = extractor.extract(html, 'https://alomana.com/')
+        timings.append((time.perf_counter() - start) * 1000)
+        del extracted
+    peak = max_rss_kb()
+    extracted = extractor.extract(html, 'https://alomana.com/')
+    print(json.dumps({
+        'backend': backend,
+        'size_mb': size_mb,
+        'html_bytes': len(html),
+        'parse_ms': round(statistics.median(timings), 1),
+        'peak_rss_mb': round((peak - baseline) / 1024, 1),
+        'blocks': len(extracted.blocks),
+        'passages': len(split_passages(extracted.text)),
+        'text_chars': len(extracted.text),
+        'links': len(extracted.links),
+        'truncated': extracted.truncated,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.1, 1, 10], help="dimensioni delle pagine in MB")
+    parser.add_argument('--backends', nargs='+', default=['bs4', 'stdlib', 'lxml', 'selectolax'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-bytes', type=int, default=0, help="limite di dimensione (0 = nessuno)")
+    parser.add_argument('--child', nargs=2, metavar=('BACKEND', 'SIZE_MB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], float(args.child[1]), args.repeat, args.max_bytes)
+        return
+
+    import html_extractor
+
+    for size_mb in args.sizes:
+        for backend in args.backends:
+            if not html_extractor.BACKENDS[backend].available():
+                print(json.dumps({'backend': backend, 'size_mb': size_mb, 'skipped': 'non installato'}))
+                continue
+            # Le pagine grandi con bs4 richiedono decine di secondi: meno ripetizioni
+            repeat = max(1, args.repeat if size_mb < 5 or backend != 'bs4' else args.repeat // 3)
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', backend, str(size_mb),
+                 '--repeat', str(repeat), '--max-bytes', str(args.max_bytes)],
+                capture_output=True, text=True, check=True
+            )
+            print(result.stdout.strip(), flush=True)
+
+
+if __name__ == '__main__':
+    main()
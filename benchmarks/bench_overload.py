@@ -0,0 +1,258 @@
+"""
+Load test offline: picchi e sovraccarico verso Gemini e il sito
+
+Uso:
+    python benchmarks/bench_overload.py [--burst 64] [--rate 60] [--duration 3]
+                                        [--model-latency 0.2] [--quota 4]
+                                        [--modes unprotected protected] [--output results.json]
+
+Gira senza rete né credenziali (vedi offline_stubs.py). Il modello finto simula la
+quota di Vertex: oltre `--quota` chiamate contemporanee risponde 429.
+
+Scenari:
+- herd: `--burst` richieste identiche nello stesso istante, con cache del sito e delle
+  risposte vuote (thundering herd su sito e modello)
+- overload: domande sempre diverse in arrivo a `--rate` richieste al secondo per
+  `--duration` secondi (carico aperto, oltre la capacità del modello)
+
+Modi:
+- unprotected: nessun limite, nessun retry, nessuna coalescenza
+- protected: i limiti di resilience.py (concorrenza = quota, retry con backoff, 503 rapido)
+
+Per ogni scenario e modo stampa una riga JSON con esiti (200/503/500), p50/p95/p99
+delle risposte riuscite e di tutte, chiamate al modello, 429 ricevuti e download del sito.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import offline_stubs  # noqa: E402
+
+offline_stubs.install()
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import app as chat_app  # noqa: E402
+    import mcp_web_scraper  # noqa: E402
+    from conversation_writer import conversation_writer  # noqa: E402
+    from resilience import SingleFlight, Upstream  # noqa: E402
+
+_stdout = sys.stdout
+_results = []
+_request_ids = itertools.count()
+
+SITE_QUESTION = "Quali servizi offrite alle aziende?"
+
+
+class QuotaExceeded(Exception):
+    """Come google.api_core.exceptions.ResourceExhausted"""
+    code = 429
+
+
+class QuotaModel(offline_stubs.StubGenerativeModel):
+    """Modello finto che risponde 429 oltre `quota` chiamate contemporanee"""
+
+    quota = 4
+    active = 0
+    rejected = 0
+    _lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        cls = type(self)
+        with cls._lock:
+            if cls.active >= cls.quota:
+                cls.rejected += 1
+                raise QuotaExceeded("429 Quota exceeded for aiplatform.googleapis.com")
+            cls.active += 1
+        try:
+            return super().generate_content(prompt, stream=stream, **kwargs)
+        finally:
+            with cls._lock:
+                cls.active -= 1
+
+
+class NoFlight(SingleFlight):
+    """SingleFlight disattivato: ogni richiesta fa la sua chiamata"""
+
+    def do(self, key, fn):
+        return fn()
+
+
+def emit(record):
+    _results.append(record)
+    _stdout.write(json.dumps(record) + "\n")
+    _stdout.flush()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(latencies_ms, prefix=''):
+    return {
+        f'{prefix}p50_ms': round(percentile(latencies_ms, 50), 1),
+        f'{prefix}p95_ms': round(percentile(latencies_ms, 95), 1),
+        f'{prefix}p99_ms': round(percentile(latencies_ms, 99), 1),
+        f'{prefix}mean_ms': round(statistics.mean(latencies_ms), 1) if latencies_ms else 0.0,
+    }
+
+
+def configure(mode, args):
+    """Sostituisce limiti e coalescenza del modello e dello scraper per il modo scelto"""
+    if mode == 'unprotected':
+        unlimited = dict(max_concurrency=10000, rate=0, max_retries=0, queue_timeout=60, deadline=60)
+        chat_app.model_upstream = Upstream('model', **unlimited)
+        mcp_web_scraper.scraper_upstream = Upstream('scraper', **unlimited)
+        chat_app.model_flight = NoFlight('model')
+        mcp_web_scraper.scraper_flight = NoFlight('scraper')
+    else:
+        chat_app.model_upstream = Upstream(
+            'model', max_concurrency=args.quota, rate=0, max_retries=3,
+            backoff_base=0.05, backoff_max=1.0, deadline=10, queue_timeout=args.queue_timeout)
+        mcp_web_scraper.scraper_upstream = Upstream(
+            'scraper', max_concurrency=4, rate=0, max_retries=2,
+            backoff_base=0.05, deadline=10, queue_timeout=args.queue_timeout)
+        chat_app.model_flight = SingleFlight('model')
+        mcp_web_scraper.scraper_flight = SingleFlight('scraper')
+
+
+def reset(site):
+    mcp_web_scraper.page_cache.clear()
+    chat_app.response_cache.clear()
+    QuotaModel.calls = 0
+    QuotaModel.rejected = 0
+    site.requests = 0
+
+
+_local = threading.local()
+
+
+def post_chat(message, scheduled=None):
+    """(latenza dall'arrivo previsto in ms, status HTTP)"""
+    client = getattr(_local, 'client', None)
+    if client is None:
+        client = _local.client = chat_app.app.test_client()
+    start = scheduled or time.perf_counter()
+    response = client.post('/chat', json={'message': message})
+    return (time.perf_counter() - start) * 1000, response.status_code
+
+
+def run_herd(executor, burst):
+    barrier = threading.Barrier(burst)
+
+    def one(_):
+        barrier.wait()
+        return post_chat(SITE_QUESTION)
+
+    start = time.perf_counter()
+    results = list(executor.map(one, range(burst)))
+    return results, time.perf_counter() - start
+
+
+def run_overload(executor, rate, duration):
+    """Carico aperto: le richieste partono all'orario previsto anche se le precedenti sono in coda"""
+    futures = []
+    start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = start + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        message = f"{SITE_QUESTION} (richiesta {next(_request_ids)})"
+        futures.append(executor.submit(post_chat, message, scheduled))
+    results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def report(scenario, mode, results, elapsed, site):
+    ok = [ms for ms, status in results if status == 200]
+    statuses = [status for _, status in results]
+    emit({
+        'scenario': scenario,
+        'mode': mode,
+        'requests': len(results),
+        'ok': len(ok),
+        'busy_503': statuses.count(503),
+        'errors_500': statuses.count(500),
+        'goodput_rps': round(len(ok) / elapsed, 1),
+        **summarize(ok),
+        **summarize([ms for ms, _ in results], prefix='all_'),
+        'model_calls': QuotaModel.calls,
+        'model_429': QuotaModel.rejected,
+        'site_fetches': site.requests,
+        'model_upstream': chat_app.model_upstream.stats(),
+        'model_flight': chat_app.model_flight.stats(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--burst', type=int, default=64, help="richieste identiche simultanee (herd)")
+    parser.add_argument('--rate', type=float, default=60, help="richieste al secondo (overload)")
+    parser.add_argument('--duration', type=float, default=3, help="secondi di carico (overload)")
+    parser.add_argument('--model-latency', type=float, default=0.2)
+    parser.add_argument('--site-latency', type=float, default=0.1)
+    parser.add_argument('--quota', type=int, default=4, help="chiamate contemporanee accettate dal modello")
+    parser.add_argument('--queue-timeout', type=float, default=0.5, help="attesa massima di uno slot (protected)")
+    parser.add_argument('--modes', nargs='+', choices=['unprotected', 'protected'],
+                        default=['unprotected', 'protected'])
+    parser.add_argument('--output', help="file JSON con tutti i risultati")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', DeprecationWarning)  # adattatori datetime di sqlite3
+    QuotaModel.latency = args.model_latency
+    QuotaModel.quota = args.quota
+    chat_app.model = QuotaModel(system_instruction=chat_app.SYSTEM_PROMPT)
+    workers = max(args.burst, int(args.rate * args.duration)) + 8
+
+    pages = {'/': offline_stubs.make_html(200, seed=1)}
+    # Il log dell'app (e i traceback dei 500) non finisce nei risultati
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()) as app_log, \
+            contextlib.redirect_stderr(app_log), \
+            offline_stubs.FixtureSite(pages, latency=args.site_latency) as site, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        offline_stubs.use_sqlite(os.path.join(tmp, 'overload.db'), max_size=4)
+        conversation_writer.start()
+        mcp_web_scraper._scraper = mcp_web_scraper.MCPWebScraper(site.url)
+
+        for mode in args.modes:
+            configure(mode, args)
+            reset(site)
+            results, elapsed = run_herd(executor, args.burst)
+            report('herd', mode, results, elapsed, site)
+
+            configure(mode, args)
+            reset(site)
+            post_chat(SITE_QUESTION)  # sito in cache: qui conta solo il modello
+            QuotaModel.calls = 0
+            results, elapsed = run_overload(executor, args.rate, args.duration)
+            report('overload', mode, results, elapsed, site)
+            app_log.seek(0)
+            app_log.truncate()
+
+        conversation_writer.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': _results}, f, indent=2)
+        _stdout.write(f"Risultati salvati in {args.output}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: archiviazione delle conversazioni vecchie e /history sull'archivio
+
+Uso:
+    python benchmarks/bench_retention.py [--rows 50000] [--days 365] [--hot-days 90]
+                                         [--segment-rows 10000] [--chunk-rows 500] [--pool-size 1]
+
+Gira offline su SQLite (vedi offline_stubs.py). Riempie la tabella con `--rows`
+conversazioni distribuite sugli ultimi `--days` giorni, poi esegue RetentionJob e misura:
+- righe archiviate al secondo e durata massima di una transazione di DELETE
+- dimensione dell'archivio rispetto al JSONL non compresso
+- latenza di una pagina di /history dal database, a cavallo e dentro l'archivio, anche
+  filtrata per IP o per sessione, e segmenti decompressi per una sessione archiviata
+- correttezza: sfogliando tutte le pagine ogni conversazione compare una volta, in ordine
+
+Con --pool-size 1 (predefinito) il job deve funzionare con una sola connessione nel pool.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import offline_stubs  # noqa: E402
+
+offline_stubs.install()
+
+import database  # noqa: E402
+import retention  # noqa: E402
+
+
+def seed(rows, days):
+    """
+    Conversazioni con timestamp casuali negli ultimi `days` giorni (secondi interi),
+    a sessioni di 8 turni consecutivi
+    """
+    rng = random.Random(7)
+    now = datetime.now().replace(microsecond=0)
+    timestamps = sorted(now - timedelta(seconds=rng.randint(0, days * 86400)) for _ in range(rows))
+    records = [(f"Domanda {i} " + 'servizi ' * rng.randint(3, 20),
+                f"Risposta {i} " + 'Alomana offre soluzioni ' * rng.randint(5, 40),
+                timestamp,
+                f"10.0.0.{rng.randint(1, 20)}",
+                f"sessione-{i // 8:08d}")
+               for i, timestamp in enumerate(timestamps)]
+    with database.pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT INTO conversations (user_message, ai_response, timestamp, user_ip, session_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            records
+        )
+        conn.commit()
+
+
+def page_latency(cursor, repeat=20, **filters):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        retention.get_history_page(20, cursor, **filters)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(timings), 2)
+
+
+def walk(limit=20, **filters):
+    """Tutte le pagine di /history: (conversazioni, cursori delle pagine)"""
+    rows, cursors, cursor = [], [None], None
+    while True:
+        page, cursor = retention.get_history_page(limit, cursor, **filters)
+        rows += page
+        if cursor is None:
+            return rows, cursors
+        cursors.append(cursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--hot-days', type=int, default=90)
+    parser.add_argument('--segment-rows', type=int, default=10000)
+    parser.add_argument('--chunk-rows', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=1, help="DB_POOL_MAX_SIZE")
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore', DeprecationWarning)  # adattatori datetime di sqlite3
+    with tempfile.TemporaryDirectory() as tmp:
+        offline_stubs.use_sqlite(os.path.join(tmp, 'retention.db'), max_size=args.pool_size)
+        seed(args.rows, args.days)
+        before, _ = walk(100)
+        expected_ids = [row['id'] for row in before]
+
+        archive = retention.ConversationArchive(os.path.join(tmp, 'archive'))
+        retention.conversation_archive = archive
+        job = retention.RetentionJob(archive, hot_days=args.hot_days, segment_rows=args.segment_rows,
+                                     chunk_rows=args.chunk_rows, pause=0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = job.run_once()
+
+        raw_bytes = sum(len(json.dumps(row, ensure_ascii=False)) + 1
+                        for segment in archive.segments() for row in archive.read_segment(segment))
+        stats = archive.stats()
+        print(json.dumps({
+            'rows': args.rows,
+            'archived': result['moved'],
+            'segments': result['segments'],
+            'archive_rows_per_s': round(result['moved'] / result['seconds']) if result['seconds'] else None,
+            'max_delete_ms': job.stats()['max_delete_ms'],
+            'archive_bytes': stats['bytes'],
+            'compression_ratio': round(raw_bytes / stats['bytes'], 1) if stats['bytes'] else None,
+        }))
+
+        after, cursors = walk(100)
+        hot_pages = (args.rows - result['moved']) // 100
+        print(json.dumps({
+            'same_rows_in_order': [row['id'] for row in after] == expected_ids,
+            'page_hot_ms': page_latency(None),
+            'page_boundary_ms': page_latency(cursors[min(hot_pages, len(cursors) - 1)]),
+            'page_archive_ms': page_latency(cursors[-1]),
+            'page_archive_by_ip_ms': page_latency(cursors[-1], user_ip='10.0.0.3'),
+            'page_archive_by_session_ms': page_latency(None, session_id='sessione-00000001'),
+        }))
+
+        # Una sessione archiviata: solo i segmenti che possono contenerla vengono decompressi
+        archive = retention.ConversationArchive(archive.directory)
+        retention.conversation_archive = archive
+        session_rows, _ = walk(20, session_id='sessione-00000002')
+        print(json.dumps({
+            'session_rows': len(session_rows),
+            'segments_decompressed': archive.stats()['decompressed'],
+            'segments_skipped': archive.stats()['skipped_by_filter'],
+        }))
+
+        # Un secondo giro non trova più niente da spostare
+        with contextlib.redirect_stdout(io.StringIO()):
+            second = job.run_once()
+        print(json.dumps({'second_run_moved': second['moved']}))
+
+
+if __name__ == '__main__':
+    main()
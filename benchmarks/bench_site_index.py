@@ -0,0 +1,94 @@
+"""
+Benchmark: ricerca nel sito con indice BM25 vs scansione con regex per ogni query
+
+Uso:
+    python benchmarks/bench_site_index.py [--sentences 1000 10000 100000] [--queries 200]
+
+Confronta, per pagine sintetiche di dimensione crescente:
+- percorso precedente: extract_key_information() + scansione delle chiavi a ogni query
+- nuovo percorso: SiteIndex costruito una volta, poi solo search() per query
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mcp_web_scraper import MCPWebScraper  # noqa: E402
+from site_index import SiteIndex  # noqa: E402
+
+WORDS = (
+    "alomana startup soluzioni intelligenza artificiale milano servizi aziende documenti dati "
+    "piattaforma clienti team tecnologia vertex cloud automazione processi analisi modelli "
+    "sicurezza integrazione contatti email supporto prezzi piani volume richieste prodotto"
+).split()
+
+QUERIES = [
+    "Quali servizi offrite alle aziende?",
+    "Dove si trova il team di Alomana?",
+    "Come gestite la sicurezza dei documenti?",
+    "Avete integrazione con il cloud?",
+    "Come posso contattare il supporto?",
+]
+
+def make_page(sentences: int, seed: int = 42) -> str:
+    rng = random.Random(seed)
+    return ' '.join(
+        ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+        for _ in range(sentences)
+    )
+
+def legacy_search(scraper: MCPWebScraper, content: str, query: str) -> str:
+    """Percorso precedente: estrazione con regex e scansione per ogni richiesta"""
+    info = scraper.extract_key_information(content)
+    query_lower = query.lower()
+    return '\n'.join(
+        f"{key}: {value}" for key, value in info.items()
+        if any(word in value.lower() for word in query_lower.split())
+    )
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sentences', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    scraper = MCPWebScraper()
+    results = []
+    for sentences in args.sentences:
+        content = make_page(sentences)
+        legacy_repeat = max(1, min(args.queries, 2_000_000 // len(content)))
+
+        start = time.perf_counter()
+        index = SiteIndex.from_text(content)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        legacy_ms = timed(lambda i: legacy_search(scraper, content, QUERIES[i % len(QUERIES)]), legacy_repeat)
+        index_ms = timed(lambda i: index.search(QUERIES[i % len(QUERIES)], 5), args.queries)
+
+        result = {
+            'sentences': sentences,
+            'page_chars': len(content),
+            'passages': len(index),
+            'index_build_ms': round(build_ms, 2),
+            'legacy_query_ms': round(legacy_ms, 3),
+            'index_query_ms': round(index_ms, 3),
+            'speedup': round(legacy_ms / index_ms, 1) if index_ms else None,
+        }
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: tempo di avvio (cold start) del chatbot
+
+Uso:
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--real] [--output startup.json]
+
+Per ogni run avvia un processo Python nuovo che:
+1. importa app.py con `-X importtime` (moduli più lenti per tempo cumulativo)
+2. esegue start_worker() e attende la fine del warm-up, come un worker Gunicorn
+
+Di default usa i sostituti di offline_stubs.py (SQLite, sito locale, modello finto),
+quindi misura il costo del nostro codice; con --real importa le librerie Google vere
+(servono credenziali e rete per il warm-up completo).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, os, sys, tempfile, time
+start = time.perf_counter()
+sys.path.insert(0, {here!r})
+if not {real!r}:
+    import offline_stubs
+    offline_stubs.install()
+import app
+imported = time.perf_counter()
+if not {real!r}:
+    tmp = tempfile.mkdtemp()
+    offline_stubs.use_sqlite(os.path.join(tmp, 'startup.db'))
+    site = offline_stubs.FixtureSite({{'/': offline_stubs.make_html(200)}}).__enter__()
+    import mcp_web_scraper
+    mcp_web_scraper._scraper = mcp_web_scraper.MCPWebScraper(site.url)
+app.start_worker()
+app.warmup.wait(60)
+status = app.warmup.status()
+status['process_import_ms'] = round((imported - start) * 1000, 1)
+status['process_ready_ms'] = round((time.perf_counter() - start) * 1000, 1)
+sys.stderr.write('RESULT ' + json.dumps(status) + '\n')
+os._exit(0)
+"""
+
+
+def parse_importtime(stderr):
+    """Righe di -X importtime -> {modulo: cumulativo in ms}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line.split(':', 1)[1].split('|')]
+        modules[name] = int(cumulative_us) / 1000
+    return modules
+
+
+def run_once(real):
+    code = CHILD.format(here=HERE, real=real)
+    env = dict(os.environ, CRAWL_ENABLED='false')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True,
+                          text=True, cwd=os.path.dirname(HERE), env=env, timeout=120)
+    result_line = next((line for line in proc.stderr.splitlines() if line.startswith('RESULT ')), None)
+    if result_line is None:
+        raise RuntimeError(f"Il processo di prova non ha prodotto risultati:\n{proc.stderr[-2000:]}")
+    return json.loads(result_line[len('RESULT '):]), parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="moduli più lenti da riportare")
+    parser.add_argument('--real', action='store_true', help="usa le librerie Google vere")
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    runs, imports = [], []
+    for i in range(args.runs):
+        status, modules = run_once(args.real)
+        runs.append(status)
+        imports.append(modules)
+        print(json.dumps({
+            'run': i,
+            'import_ms': status['process_import_ms'],
+            'ready_ms': status['process_ready_ms'],
+            'steps_ms': {name: step['ms'] for name, step in status['steps'].items()},
+            'failed': [name for name, step in status['steps'].items() if step['status'] == 'failed'],
+        }))
+
+    # Moduli di primo livello importati per app, ordinati per tempo cumulativo mediano
+    names = set.intersection(*(set(m) for m in imports))
+    slowest = sorted(
+        ((name, statistics.median(m[name] for m in imports)) for name in names if '.' not in name),
+        key=lambda item: item[1], reverse=True
+    )[:args.top]
+    summary = {
+        'runs': args.runs,
+        'real': args.real,
+        'import_ms_median': statistics.median(r['process_import_ms'] for r in runs),
+        'ready_ms_median': statistics.median(r['process_ready_ms'] for r in runs),
+        'slowest_imports_ms': {name: round(ms, 1) for name, ms in slowest},
+    }
+    print(json.dumps(summary))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'summary': summary, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
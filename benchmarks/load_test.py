@@ -0,0 +1,105 @@
+"""
+Load test HTTP: throughput e latenza al crescere della concorrenza
+
+Uso:
+    # server di sviluppo
+    python app.py
+    python benchmarks/load_test.py --url http://localhost:8080/chat --label dev-server
+
+    # Gunicorn
+    gunicorn -c gunicorn.conf.py app:app
+    python benchmarks/load_test.py --url http://localhost:8080/chat --label gunicorn
+
+Di default invia una FAQ esatta ("Quanto costa?"), che viene risposta senza chiamare
+Gemini: così si misura la capacità del server e non la latenza del modello.
+Ogni livello di concorrenza stampa una riga JSON; con --output i risultati
+vengono anche salvati su file per confrontare le esecuzioni.
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def run_level(url, payload, concurrency, duration):
+    """Esegue `concurrency` client in parallelo per `duration` secondi"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        local, local_errors = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=payload, timeout=60)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            if ok:
+                local.append(elapsed)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    elapsed = time.monotonic() - start
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(statistics.mean(latencies), 2) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8080/chat')
+    parser.add_argument('--message', default='Quanto costa?')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=10, help='secondi per livello')
+    parser.add_argument('--label', default='', help='nome del server testato (es. dev-server, gunicorn)')
+    parser.add_argument('--output', help='file JSON dove salvare i risultati')
+    args = parser.parse_args()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_level(args.url, {'message': args.message}, concurrency, args.duration)
+        result['label'] = args.label
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
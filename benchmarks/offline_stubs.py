@@ -0,0 +1,302 @@
+"""
+Sostituti locali per eseguire benchmark e load test senza Google Cloud né MySQL
+
+- StubGenerativeModel: risponde dopo una latenza configurabile, anche in streaming
+- FakeSecretManager: Secret Manager in memoria
+- SQLite al posto di MySQL, dietro lo stesso ConnectionPool di database.py (con GET_LOCK)
+- FixtureSite: server HTTP locale con pagine HTML generate di dimensione scelta
+
+Va chiamato install() prima di importare app.py.
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _StubResponse:
+    def __init__(self, text, prompt_tokens=0, output_tokens=0):
+        self.text = text
+        self.usage_metadata = _Usage(prompt_tokens, output_tokens)
+
+
+class StubGenerativeModel:
+    """
+    Modello finto con la stessa interfaccia usata da app.py
+
+    Args:
+        latency: secondi prima della risposta completa
+        first_token_latency: secondi prima del primo chunk in streaming
+        chunks: numero di chunk in streaming
+    """
+
+    latency = 0.05
+    first_token_latency = 0.01
+    chunks = 8
+    calls = 0
+
+    def __init__(self, model_name="stub", **kwargs):
+        self.model_name = model_name
+        self.kwargs = kwargs
+
+    def _answer(self, prompt):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        text = "Risposta di prova: " + " ".join(prompt.split()[-12:])
+        # Come Vertex, i token di input includono la system_instruction
+        system = self.kwargs.get('system_instruction') or ''
+        return text, (len(prompt) + len(str(system))) // 4
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        type(self).calls += 1
+        text, prompt_tokens = self._answer(prompt)
+        if not stream:
+            time.sleep(self.latency)
+            return _StubResponse(text, prompt_tokens, len(text) // 4)
+        return self._stream(text, prompt_tokens)
+
+    def _stream(self, text, prompt_tokens):
+        time.sleep(self.first_token_latency)
+        size = max(1, len(text) // self.chunks)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)]
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep((self.latency - self.first_token_latency) / len(pieces))
+            yield _StubResponse(piece, prompt_tokens, len(text) // 4)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        type(self).calls += 1
+        text, prompt_tokens = self._answer(prompt)
+        if not stream:
+            await asyncio.sleep(self.latency)
+            return _StubResponse(text, prompt_tokens, len(text) // 4)
+
+        async def chunks():
+            await asyncio.sleep(self.first_token_latency)
+            yield _StubResponse(text, prompt_tokens, len(text) // 4)
+        return chunks()
+
+    def count_tokens(self, contents):
+        return types.SimpleNamespace(total_tokens=len(str(contents)) // 4)
+
+
+class FakeSecretManager:
+    """Secret Manager in memoria con latenza simulata"""
+
+    def __init__(self, secrets=None, latency=0.005):
+        self.secrets = secrets or {}
+        self.latency = latency
+        self.calls = 0
+
+    def access_secret_version(self, request, timeout=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        name = request['name'].split('/')[3]
+        if name not in self.secrets:
+            raise KeyError(f"Secret {name} non trovato")
+        payload = types.SimpleNamespace(data=self.secrets[name].encode('utf-8'))
+        return types.SimpleNamespace(payload=payload)
+
+
+def install():
+    """Registra i moduli finti di vertexai e google.* e rende importabili i moduli del progetto"""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    vertexai = types.ModuleType('vertexai')
+    vertexai.init = lambda **kwargs: None
+    generative_models = types.ModuleType('vertexai.generative_models')
+    generative_models.GenerativeModel = StubGenerativeModel
+    vertexai.generative_models = generative_models
+    sys.modules['vertexai'] = vertexai
+    sys.modules['vertexai.generative_models'] = generative_models
+
+    google = sys.modules.get('google') or types.ModuleType('google')
+    cloud = types.ModuleType('google.cloud')
+    secretmanager = types.ModuleType('google.cloud.secretmanager')
+    secretmanager.SecretManagerServiceClient = FakeSecretManager
+    auth = types.ModuleType('google.auth')
+    auth.default = lambda: (None, 'offline-benchmark')
+    google.cloud = cloud
+    google.auth = auth
+    cloud.secretmanager = secretmanager
+    sys.modules.setdefault('google', google)
+    sys.modules['google.cloud'] = cloud
+    sys.modules['google.cloud.secretmanager'] = secretmanager
+    sys.modules['google.auth'] = auth
+
+
+class _SQLiteCursor:
+    """Cursore SQLite che accetta i placeholder %s di pymysql"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        return self._cursor.execute(sql.replace('%s', '?'), tuple(params or ()))
+
+    def executemany(self, sql, rows):
+        return self._cursor.executemany(sql.replace('%s', '?'), rows)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+
+# Lock con nome di MySQL (GET_LOCK/RELEASE_LOCK), per nome: connessione che lo tiene
+_named_locks = {}
+_named_locks_guard = threading.Lock()
+
+
+class SQLiteConnection:
+    """Connessione SQLite con l'interfaccia di pymysql usata da database.py"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES)
+        self._conn.create_function('GET_LOCK', 2, self._get_lock)
+        self._conn.create_function('RELEASE_LOCK', 1, self._release_lock)
+
+    def _get_lock(self, name, timeout):
+        with _named_locks_guard:
+            if _named_locks.setdefault(name, self) is self:
+                return 1
+            return 0
+
+    def _release_lock(self, name):
+        with _named_locks_guard:
+            if _named_locks.get(name) is self:
+                del _named_locks[name]
+                return 1
+            return 0
+
+    def cursor(self, *args):
+        return _SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        # Come MySQL: i lock con nome si liberano alla chiusura della connessione
+        with _named_locks_guard:
+            for name in [name for name, owner in _named_locks.items() if owner is self]:
+                del _named_locks[name]
+        self._conn.close()
+
+
+def use_sqlite(path, max_size=10):
+    """Sostituisce il pool MySQL di database.py con connessioni SQLite sullo stesso file"""
+    import database
+
+    conn = SQLiteConnection(path)
+    conn.cursor().execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message TEXT NOT NULL,
+            ai_response TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_ip VARCHAR(45),
+            session_id VARCHAR(64)
+        )
+    ''')
+    conn.cursor().execute("CREATE INDEX IF NOT EXISTS idx_ts ON conversations (timestamp, id)")
+    conn.commit()
+    conn.close()
+
+    database._pool = database.ConnectionPool(lambda: SQLiteConnection(path), min_size=1, max_size=max_size)
+    return database._pool
+
+
+WORDS = (
+    "alomana startup soluzioni intelligenza artificiale milano servizi aziende documenti dati "
+    "piattaforma clienti team tecnologia vertex cloud automazione processi analisi modelli "
+    "sicurezza integrazione contatti email supporto prezzi piani volume richieste prodotto"
+).split()
+
+
+def make_html(paragraphs, links=(), seed=0):
+    """Pagina HTML sintetica con `paragraphs` paragrafi e i link indicati"""
+    rng = random.Random(seed)
+    body = ''.join(
+        '<p>' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 25))).capitalize() + '.</p>'
+        for _ in range(paragraphs)
+    )
+    nav = ''.join(f'<a href="{link}">{link}</a>' for link in links)
+    return (f"<html><head><title>Alomana</title><style>p {{}}</style></head>"
+            f"<body><nav>{nav}</nav><h1>Alomana</h1>{body}<script>var x = 1;</script></body></html>").encode()
+
+
+class FixtureSite:
+    """
+    Sito HTML locale servito da un thread
+
+    Args:
+        pages: dizionario path -> bytes HTML
+        latency: secondi di attesa per ogni risposta
+    """
+
+    def __init__(self, pages, latency=0.0):
+        self.pages = pages
+        self.latency = latency
+        self.requests = 0
+        self.paths = []  # percorsi richiesti, in ordine di arrivo
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests += 1
+                site.paths.append(self.path)
+                if site.latency:
+                    time.sleep(site.latency)
+                body = site.pages.get(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -12,3 +12,91 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD')
     DB_NAME = os.getenv('DB_NAME')
 
+    # Pool di connessioni MySQL
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))            # attesa massima per una connessione libera
+    DB_POOL_MAX_LIFETIME = int(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # secondi prima di ricreare una connessione
+    DB_POOL_IDLE_TIMEOUT = int(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))   # secondi di inattività prima della chiusura
+
+    # Salvataggio asincrono delle conversazioni (write-behind)
+    WRITER_BATCH_SIZE = int(os.getenv('WRITER_BATCH_SIZE', 50))           # record per INSERT multi-riga
+    WRITER_FLUSH_INTERVAL = float(os.getenv('WRITER_FLUSH_INTERVAL', 1.0)) # secondi massimi di attesa in coda
+    WRITER_MAX_QUEUE = int(os.getenv('WRITER_MAX_QUEUE', 10000))
+    WRITER_MAX_RETRIES = int(os.getenv('WRITER_MAX_RETRIES', 3))
+    WRITER_SPILL_PATH = os.getenv('WRITER_SPILL_PATH', 'conversations_spill.jsonl')
+
+    # Cache del sito web (MCP scraper)
+    SCRAPER_CACHE_TTL = int(os.getenv('SCRAPER_CACHE_TTL', 300))             # secondi in cui la pagina è fresca
+    SCRAPER_CACHE_STALE_TTL = int(os.getenv('SCRAPER_CACHE_STALE_TTL', 3600)) # secondi in cui si serve la copia stale
+    SCRAPER_CACHE_MAX_BYTES = int(os.getenv('SCRAPER_CACHE_MAX_BYTES', 5 * 1024 * 1024))
+    SCRAPER_CACHE_NEGATIVE_TTL = float(os.getenv('SCRAPER_CACHE_NEGATIVE_TTL', 30))  # secondi senza riprovare un sito che non risponde
+
+    # Profiler a campionamento per singola richiesta (header X-Profile: 1)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+
+    # Cache delle risposte del modello
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 2 * 1024 * 1024))
+
+    # Router degli intenti: similarità minima per rispondere con la FAQ
+    # o per usare solo il modello senza consultare il sito
+    ROUTER_FAQ_THRESHOLD = float(os.getenv('ROUTER_FAQ_THRESHOLD', 0.85))  # risposta diretta solo se quasi esatta
+    ROUTER_FAQ_MARGIN = float(os.getenv('ROUTER_FAQ_MARGIN', 0.3))        # vantaggio sull'esempio non-FAQ più vicino
+    ROUTER_LLM_THRESHOLD = float(os.getenv('ROUTER_LLM_THRESHOLD', 0.35))
+
+    # Token massimi (stimati) del contesto dal sito web nel prompt
+    PROMPT_CONTEXT_BUDGET = int(os.getenv('PROMPT_CONTEXT_BUDGET', 600))
+
+    # Sessioni di conversazione (memory o redis)
+    SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+    REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+    SESSION_WINDOW = int(os.getenv('SESSION_WINDOW', 6))                # turni passati al modello per intero
+    SESSION_SUMMARY_CHARS = int(os.getenv('SESSION_SUMMARY_CHARS', 1200))
+    SESSION_TTL = int(os.getenv('SESSION_TTL', 3600))                   # secondi di inattività
+    SESSION_MAX_SESSIONS = int(os.getenv('SESSION_MAX_SESSIONS', 10000))
+    SESSION_MAX_BYTES = int(os.getenv('SESSION_MAX_BYTES', 20 * 1024 * 1024))
+    SESSION_RESTORE_TIMEOUT = float(os.getenv('SESSION_RESTORE_TIMEOUT', 1.0))  # attesa massima per la storia dal database
+    SESSION_SECRET = os.getenv('SESSION_SECRET')                         # firma del cookie di sessione (uguale su tutte le istanze)
+    SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'true').lower() == 'true'  # cookie solo su HTTPS
+    PROMPT_HISTORY_BUDGET = int(os.getenv('PROMPT_HISTORY_BUDGET', 500))  # token della storia nel prompt
+
+    # Chiamate a Gemini e al sito: concorrenza, rate limit, retry e deadline per processo
+    MODEL_MAX_CONCURRENCY = int(os.getenv('MODEL_MAX_CONCURRENCY', 8))
+    MODEL_RATE = float(os.getenv('MODEL_RATE', 10))                  # chiamate al secondo (0 = senza limite)
+    MODEL_BURST = float(os.getenv('MODEL_BURST', 20))
+    MODEL_DEADLINE = float(os.getenv('MODEL_DEADLINE', 30))          # secondi per coda + tentativi
+    SCRAPER_MAX_CONCURRENCY = int(os.getenv('SCRAPER_MAX_CONCURRENCY', 4))
+    SCRAPER_RATE = float(os.getenv('SCRAPER_RATE', 5))
+    SCRAPER_BURST = float(os.getenv('SCRAPER_BURST', 10))
+    SCRAPER_DEADLINE = float(os.getenv('SCRAPER_DEADLINE', 15))
+    UPSTREAM_QUEUE_TIMEOUT = float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 2))  # attesa massima di uno slot, poi 503
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 3))
+    UPSTREAM_BACKOFF_BASE = float(os.getenv('UPSTREAM_BACKOFF_BASE', 0.2))
+    UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', 5))
+
+    # Domande in blocco (/chat/batch e batch_runner.py)
+    BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))            # lascia posto alle chat dal vivo
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 16))
+    BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', 10000))  # righe per richiesta a /chat/batch
+
+    # Archiviazione delle conversazioni vecchie (retention.py)
+    RETENTION_HOT_DAYS = int(os.getenv('RETENTION_HOT_DAYS', 0))        # giorni tenuti nel database (0 = niente archiviazione)
+    RETENTION_ARCHIVE_DAYS = int(os.getenv('RETENTION_ARCHIVE_DAYS', 0))  # giorni tenuti nell'archivio (0 = per sempre)
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+    ARCHIVE_SEGMENT_ROWS = int(os.getenv('ARCHIVE_SEGMENT_ROWS', 10000))  # righe per file gzip
+    ARCHIVE_CHUNK_ROWS = int(os.getenv('ARCHIVE_CHUNK_ROWS', 500))        # righe per SELECT/DELETE (transazioni brevi)
+    ARCHIVE_PAUSE = float(os.getenv('ARCHIVE_PAUSE', 0.05))              # secondi tra due DELETE
+    ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', 86400))         # secondi tra due archiviazioni
+
+    # Estrazione del testo dalle pagine del sito (html_extractor.py)
+    HTML_PARSER = os.getenv('HTML_PARSER', 'auto')                   # auto, selectolax, lxml, stdlib, bs4
+    HTML_MAX_BYTES = int(os.getenv('HTML_MAX_BYTES', 5 * 1024 * 1024))  # oltre, la pagina viene troncata
+
+    # Crawl del sito (più pagine, in background)
+    CRAWL_ENABLED = os.getenv('CRAWL_ENABLED', 'true').lower() == 'true'
+    CRAWL_MAX_PAGES = int(os.getenv('CRAWL_MAX_PAGES', 20))
+    CRAWL_MAX_DEPTH = int(os.getenv('CRAWL_MAX_DEPTH', 2))
+    CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 4))
+    CRAWL_RATE_PER_HOST = float(os.getenv('CRAWL_RATE_PER_HOST', 2))  # richieste al secondo
+    CRAWL_INTERVAL = int(os.getenv('CRAWL_INTERVAL', 3600))            # secondi tra due crawl
@@ -0,0 +1,301 @@
+"""
+Salvataggio asincrono delle conversazioni (write-behind)
+Le richieste mettono le conversazioni in coda e tornano subito;
+un thread in background le scrive nel database a gruppi con INSERT multi-riga
+"""
+
+import atexit
+import contextlib
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo il lock tra thread
+    fcntl = None
+
+import pymysql
+from config import Config
+from database import save_conversations, PoolExhaustedError
+
+# Errori per cui vale la pena riprovare (database temporaneamente irraggiungibile)
+TRANSIENT_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError, PoolExhaustedError)
+
+
+class ConversationWriter:
+    """
+    Coda di scrittura delle conversazioni
+
+    - flush quando la coda raggiunge `batch_size` record o dopo `flush_interval` secondi
+    - fino a `max_retries` tentativi con backoff per gli errori temporanei
+    - se MySQL resta irraggiungibile i record finiscono in un file JSONL (`spill_path`)
+      che viene reinserito al successivo avvio
+    - i record rifiutati dal database (errori non temporanei) e le righe illeggibili del
+      file finiscono in `spill_path + '.bad'`, da controllare a mano: non vengono mai
+      reinseriti, altrimenti fallirebbero a ogni avvio
+
+    Il file è condiviso dai worker di Gunicorn: scritture e rinomina sono protette da un
+    lock su file (`spill_path + '.lock'`) oltre che da quello tra thread.
+    """
+
+    def __init__(self, write_batch=save_conversations, batch_size=50, flush_interval=1.0,
+                 max_queue=10000, max_retries=3, spill_path="conversations_spill.jsonl"):
+        self._write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._atexit_registered = False
+        # Metriche
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.spilled = 0
+        self.rejected = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def start(self):
+        """Avvia il thread di scrittura (una sola volta per processo)"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.shutdown)
+                self._atexit_registered = True
+
+    def enqueue(self, user_message: str, ai_response: str, user_ip: Optional[str] = None,
+                session_id: Optional[str] = None):
+        """Mette in coda una conversazione senza bloccare la richiesta"""
+        if self._thread is None:
+            self.start()
+        record = {
+            'user_message': user_message,
+            'ai_response': ai_response,
+            'user_ip': user_ip,
+            'session_id': session_id,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self.enqueued += 1
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            print("⚠️ Coda conversazioni piena, salvo su file")
+            self._spill([record])
+
+    def _run(self):
+        try:
+            self.replay_spill()
+        except Exception as e:
+            print(f"⚠️ Errore nel reinserimento delle conversazioni da file: {e}")
+        while True:
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                return
+
+    def _collect(self):
+        """Raccoglie fino a batch_size record, aspettando al massimo flush_interval secondi"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if self._stopping.is_set():
+                timeout = 0
+            try:
+                if timeout <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write_batch(batch)
+                self.written += len(batch)
+                self.batches += 1
+                break
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries or self._stopping.is_set():
+                    # In chiusura non aspettiamo il database: i record vanno subito su file
+                    print(f"❌ Database non raggiungibile dopo {attempt + 1} tentativi: {e}")
+                    self._spill(batch)
+                    break
+                self.retries += 1
+                time.sleep(min(0.5 * 2 ** attempt, 5))
+            except Exception as e:
+                print(f"❌ Errore nel salvataggio di {len(batch)} conversazioni: {e}")
+                self._write_one_by_one(batch)
+                break
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._flush_ms_total += elapsed_ms
+
+    def _write_one_by_one(self, batch):
+        """Dopo un errore non temporaneo: salva i record validi, scarta solo quelli rifiutati"""
+        for record in batch:
+            try:
+                self._write_batch([record])
+                self.written += 1
+                self.batches += 1
+            except TRANSIENT_ERRORS:
+                self._spill([record])
+            except Exception as e:
+                print(f"❌ Conversazione rifiutata dal database, spostata in {self.bad_path}: {e}")
+                self._quarantine([json.dumps(record, ensure_ascii=False)])
+
+    @property
+    def bad_path(self) -> str:
+        return self.spill_path + '.bad'
+
+    @contextlib.contextmanager
+    def _spill_locked(self):
+        """Lock esclusivo sul file di spill, tra thread e tra processi"""
+        with self._spill_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.spill_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _spill(self, records):
+        """Aggiunge i record al file locale (append-only, una riga JSON per record)"""
+        try:
+            with self._spill_locked(), open(self.spill_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.spilled += len(records)
+        except Exception as e:
+            print(f"❌ Impossibile salvare le conversazioni su file: {e}")
+
+    def _quarantine(self, lines):
+        """Righe da non reinserire più (JSON non valido o record rifiutati dal database)"""
+        try:
+            with self._spill_locked(), open(self.bad_path, 'a', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line.rstrip('\n') + '\n')
+            self.rejected += len(lines)
+        except Exception as e:
+            print(f"❌ Impossibile salvare le righe scartate su file: {e}")
+
+    def replay_spill(self):
+        """
+        Scrive nel database i record salvati su file durante un'interruzione
+
+        Il file viene rinominato con un nome unico (pid e ora) così un nuovo spill non
+        lo sovrascrive mai; vengono ripresi anche i file .replay lasciati da un processo
+        terminato a metà. Ogni file .replay è bloccato da chi lo sta reinserendo, quindi
+        due worker non inseriscono gli stessi record.
+        """
+        with self._spill_locked():
+            if os.path.exists(self.spill_path):
+                os.replace(self.spill_path, f"{self.spill_path}.replay.{os.getpid()}.{time.time_ns()}")
+        for replay_path in sorted(glob.glob(glob.escape(self.spill_path) + '.replay.*')):
+            self._replay_file(replay_path)
+
+    def _replay_file(self, replay_path):
+        try:
+            f = open(replay_path, encoding='utf-8')
+        except FileNotFoundError:
+            return  # già reinserito da un altro worker
+        with f:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # un altro worker lo sta reinserendo
+                try:
+                    if os.stat(replay_path).st_ino != os.fstat(f.fileno()).st_ino:
+                        return
+                except FileNotFoundError:
+                    return  # reinserito e cancellato mentre aspettavamo il lock
+            count = 0
+            batch = []
+            bad = []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    bad.append(line)
+                    continue
+                batch.append(record)
+                count += 1
+                if len(batch) >= self.batch_size:
+                    self._flush(batch)
+                    batch = []
+            if batch:
+                self._flush(batch)
+            if bad:
+                print(f"⚠️ {len(bad)} righe non valide in {replay_path}, spostate in {self.bad_path}")
+                self._quarantine(bad)
+            # Tutto è stato scritto nel database o di nuovo nel file di spill
+            os.remove(replay_path)
+        print(f"📥 Reinserite {count} conversazioni salvate su file")
+
+    def shutdown(self, timeout: float = 10):
+        """Svuota la coda e ferma il thread (chiamato all'uscita del processo)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        # Quello che non è stato scritto in tempo finisce su file
+        leftover = []
+        while True:
+            try:
+                leftover.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._spill(leftover)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self._queue.qsize(),
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'batches': self.batches,
+            'retries': self.retries,
+            'spilled': self.spilled,
+            'rejected': self.rejected,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'avg_flush_ms': round(self._flush_ms_total / self.batches, 3) if self.batches else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
+
+
+# Istanza globale per l'uso nell'applicazione
+conversation_writer = ConversationWriter(
+    batch_size=Config.WRITER_BATCH_SIZE,
+    flush_interval=Config.WRITER_FLUSH_INTERVAL,
+    max_queue=Config.WRITER_MAX_QUEUE,
+    max_retries=Config.WRITER_MAX_RETRIES,
+    spill_path=Config.WRITER_SPILL_PATH,
+)
@@ -1,9 +1,277 @@
 import pymysql # Libreria per connettersi a MySQL
+import base64
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from config import Config # Configurazioni database
 from secure_config import secure_config # Configurazione sicura A2A
+from metrics import span, STAGE_SECONDS # Metriche di latenza
 from datetime import datetime # Per gestire date/ore
 
-def get_connection(): # Funzione per connettersi al database
+
+class PoolExhaustedError(Exception):
+    """Nessuna connessione libera entro il timeout del pool"""
+
+
+class _PooledConnection:
+    """Connessione del pool con i tempi di creazione e ultimo utilizzo"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni MySQL thread-safe
+
+    - min_size connessioni restano sempre aperte, al massimo max_size in totale
+    - le connessioni inattive da più di idle_timeout secondi vengono chiuse
+    - le connessioni più vecchie di max_lifetime secondi vengono ricreate
+    - al checkout una connessione inattiva da troppo viene verificata con ping
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10,
+                 max_lifetime=1800, idle_timeout=300, health_check_interval=30):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        # Metriche
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.exhausted = 0
+        self.created = 0
+        self.discarded = 0
+
+        self._reaper = threading.Thread(target=self._reap_loop, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _open(self):
+        with span('db_connect'):
+            pooled = _PooledConnection(self._connect())
+        self.created += 1
+        return pooled
+
+    def _close(self, pooled):
+        self.discarded += 1
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _is_expired(self, pooled, now):
+        return now - pooled.created_at > self.max_lifetime
+
+    def fill(self):
+        """Apre le connessioni fino a min_size (usato all'avvio)"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pooled = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def acquire(self):
+        """Prende una connessione dal pool (o ne apre una nuova se c'è spazio)"""
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolExhaustedError("Il pool di connessioni è chiuso")
+                if self._idle:
+                    pooled = self._idle.pop()  # LIFO: la connessione più calda
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    pooled = None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.exhausted += 1
+                    raise PoolExhaustedError(
+                        f"Nessuna connessione disponibile dopo {self.timeout}s (max {self.max_size})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+        waited_for = time.monotonic() - start
+        if waited:
+            self.waits += 1
+        self.wait_time_total += waited_for
+        self.wait_time_max = max(self.wait_time_max, waited_for)
+        STAGE_SECONDS.labels('db_pool_wait').observe(waited_for)
+
+        if pooled is not None:
+            pooled = self._check(pooled)
+        if pooled is None:
+            try:
+                pooled = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self.checkouts += 1
+            self._in_use[id(pooled.conn)] = pooled
+        return pooled.conn
+
+    def _check(self, pooled):
+        """Verifica una connessione inattiva; restituisce None se va ricreata"""
+        now = time.monotonic()
+        if self._is_expired(pooled, now):
+            self._close(pooled)
+            return None
+        if now - pooled.last_used > self.health_check_interval:
+            try:
+                pooled.conn.ping(reconnect=False)
+            except Exception:
+                print("⚠️ Connessione al database non più valida, ne apro una nuova")
+                self._close(pooled)
+                return None
+        return pooled
+
+    def release(self, conn, broken=False):
+        """Restituisce una connessione al pool (o la chiude se rotta/scaduta)"""
+        if not broken:
+            # Chiude la transazione lasciata aperta anche dalle sole letture (autocommit è spento):
+            # altrimenti il prossimo utilizzo leggerebbe lo snapshot REPEATABLE READ vecchio
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+            if pooled is None:
+                return
+            now = time.monotonic()
+            if broken or self._closed or self._is_expired(pooled, now):
+                self._size -= 1
+                discard = True
+            else:
+                pooled.last_used = now
+                self._idle.append(pooled)
+                discard = False
+            self._cond.notify()
+        if discard:
+            self._close(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Context manager: prende una connessione e la restituisce al termine"""
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def _reap_loop(self):
+        interval = max(1, min(self.idle_timeout, self.max_lifetime) / 2)
+        while not self._closed:
+            time.sleep(interval)
+            self.reap()
+
+    def reap(self):
+        """Chiude le connessioni inattive da troppo o troppo vecchie, lasciandone min_size"""
+        now = time.monotonic()
+        to_close = []
+        with self._cond:
+            keep = deque()
+            for pooled in self._idle:
+                idle_for = now - pooled.last_used
+                too_old = self._is_expired(pooled, now)
+                if too_old or (idle_for > self.idle_timeout and self._size > self.min_size):
+                    to_close.append(pooled)
+                    self._size -= 1
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+        for pooled in to_close:
+            self._close(pooled)
+
+    def close(self):
+        """Chiude tutte le connessioni inattive e rifiuta nuovi checkout"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'wait_time_avg_ms': round(1000 * self.wait_time_total / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_time_max_ms': round(1000 * self.wait_time_max, 3),
+                'exhausted': self.exhausted,
+                'created': self.created,
+                'discarded': self.discarded,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Restituisce il pool condiviso, creandolo al primo utilizzo"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_connection,
+                    min_size=Config.DB_POOL_MIN_SIZE,
+                    max_size=Config.DB_POOL_MAX_SIZE,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    max_lifetime=Config.DB_POOL_MAX_LIFETIME,
+                    idle_timeout=Config.DB_POOL_IDLE_TIMEOUT,
+                )
+    return _pool
+
+def pooled_connection():
+    """Connessione presa dal pool, da usare con `with pooled_connection() as conn:`"""
+    return get_pool().connection()
+
+def get_connection(): # Funzione per aprire una nuova connessione al database
     # Usa configurazione sicura A2A se disponibile, altrimenti fallback a Config
     try:
         db_config = secure_config.get_database_config()
@@ -45,21 +313,26 @@ def init_database():
         conn.close() # Chiude la connessione
         print("Database creato/verificato!")
         
-        # Crea tabella conversations
+        # Crea tabella conversations (connessione diretta: il pool viene aperto dai worker)
         conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                user_message TEXT NOT NULL,
-                ai_response TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                user_ip VARCHAR(45)
-            )
-        ''')
-        conn.commit() # Salva le modifiche
-        conn.close()
-        print("Tabella conversations creata/verificata!")
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    user_message TEXT NOT NULL,
+                    ai_response TEXT NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    user_ip VARCHAR(45)
+                )
+            ''')
+            conn.commit() # Salva le modifiche
+            print("Tabella conversations creata/verificata!")
+            
+            # Applica le migrazioni dello schema non ancora eseguite
+            run_migrations(conn)
+        finally:
+            conn.close()
         
     except Exception as e:
         print(f"Errore durante l'inizializzazione del database: {e}")
@@ -67,23 +340,169 @@ def init_database():
         traceback.print_exc()
         raise
 
-def save_conversation(user_message, ai_response, user_ip=None):
-    conn = get_connection() # Connessione al database
-    cursor = conn.cursor() # Crea cursore per eseguire query
-    cursor.execute(
-        "INSERT INTO conversations (user_message, ai_response, user_ip) VALUES (%s, %s, %s)",
-        (user_message, ai_response, user_ip)
-    )
-    conn.commit()
-    conn.close()
+# Migrazioni dello schema: (versione, descrizione, istruzioni SQL)
+# Si aggiungono sempre in fondo, con versione crescente
+MIGRATIONS = [
+    (1, "Indici per /history (ordinamento per data e filtro per IP)", [
+        "CREATE INDEX idx_conversations_timestamp_id ON conversations (timestamp, id)",
+        "CREATE INDEX idx_conversations_ip_timestamp_id ON conversations (user_ip, timestamp, id)",
+    ]),
+    (2, "Sessioni di conversazione: colonna session_id con indice", [
+        "ALTER TABLE conversations ADD COLUMN session_id VARCHAR(64) NULL",
+        "CREATE INDEX idx_conversations_session_timestamp_id ON conversations (session_id, timestamp, id)",
+    ]),
+]
 
-def get_recent_conversations(limit=10):
-    conn = get_connection()
+def run_migrations(conn):
+    """
+    Esegue le migrazioni mancanti, registrandole nella tabella schema_migrations
+    """
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT user_message, ai_response, timestamp FROM conversations ORDER BY timestamp DESC LIMIT %s",
-        (limit,)
-    )
-    results = cursor.fetchall()
-    conn.close()
-    return results
\ No newline at end of file
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        print(f"Migrazione {version}: {description}")
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except pymysql.err.OperationalError as e:
+                # 1061 = indice già esistente, 1060 = colonna già esistente
+                # (migrazione interrotta a metà in un avvio precedente)
+                if e.args[0] not in (1060, 1061):
+                    raise
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        conn.commit()
+    print("Schema del database aggiornato!")
+
+def save_conversations(records):
+    """
+    Salva più conversazioni con un solo INSERT multi-riga
+    
+    Args:
+        records: lista di dict con user_message, ai_response, user_ip, session_id e timestamp
+    """
+    if not records:
+        return
+    with span('db_insert'), pooled_connection() as conn:
+        cursor = conn.cursor()
+        # pymysql trasforma executemany su INSERT ... VALUES in un unico INSERT multi-riga
+        cursor.executemany(
+            "INSERT INTO conversations (user_message, ai_response, user_ip, session_id, timestamp) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            [(r['user_message'], r['ai_response'], r.get('user_ip'), r.get('session_id'), r.get('timestamp'))
+             for r in records]
+        )
+        conn.commit()
+
+def encode_cursor(timestamp, conversation_id) -> str:
+    """Cursore opaco per la paginazione: posizione (timestamp, id) dell'ultima riga letta"""
+    raw = f"{timestamp.isoformat()}|{conversation_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str):
+    """Decodifica un cursore; ValueError se non valido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, conversation_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(conversation_id)
+    except Exception:
+        raise ValueError("Cursore non valido")
+
+def _history_filters(cursor=None, since=None, until=None, user_ip=None, session_id=None):
+    """Clausola WHERE e parametri comuni per la lettura della cronologia"""
+    conditions, params = [], []
+    if cursor:
+        timestamp, conversation_id = decode_cursor(cursor)
+        # Keyset: righe strettamente precedenti all'ultima restituita (usa l'indice timestamp, id)
+        conditions.append("(timestamp < %s OR (timestamp = %s AND id < %s))")
+        params += [timestamp, timestamp, conversation_id]
+    if since:
+        conditions.append("timestamp >= %s")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < %s")
+        params.append(until)
+    if user_ip:
+        conditions.append("user_ip = %s")
+        params.append(user_ip)
+    if session_id:
+        conditions.append("session_id = %s")
+        params.append(session_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+def _conversation_row(row) -> dict:
+    conversation_id, user_message, ai_response, timestamp, user_ip, session_id = row
+    return {
+        'id': conversation_id,
+        'user_message': user_message,
+        'ai_response': ai_response,
+        'timestamp': timestamp.isoformat() if timestamp else None,
+        'user_ip': user_ip,
+        'session_id': session_id,
+    }
+
+HISTORY_COLUMNS = "id, user_message, ai_response, timestamp, user_ip, session_id"
+
+def get_conversations_page(limit=20, cursor=None, since=None, until=None, user_ip=None, session_id=None):
+    """
+    Una pagina di cronologia, dalla più recente, con paginazione a cursore
+    
+    Returns:
+        (lista di conversazioni, cursore della pagina successiva o None)
+    """
+    where, params = _history_filters(cursor, since, until, user_ip, session_id)
+    with pooled_connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(
+            f"SELECT {HISTORY_COLUMNS} FROM conversations {where} "
+            f"ORDER BY timestamp DESC, id DESC LIMIT %s",
+            params + [limit + 1]
+        )
+        rows = db_cursor.fetchall()
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+    return [_conversation_row(row) for row in rows], next_cursor
+
+def iter_conversations(since=None, until=None, user_ip=None, session_id=None, batch_size=500):
+    """
+    Legge tutta la cronologia filtrata riga per riga con un cursore lato server,
+    senza caricare il risultato in memoria (per l'export NDJSON)
+    """
+    where, params = _history_filters(None, since, until, user_ip, session_id)
+    pool = get_pool()
+    conn = pool.acquire()
+    finished = False
+    try:
+        db_cursor = conn.cursor(pymysql.cursors.SSCursor)
+        db_cursor.execute(
+            f"SELECT {HISTORY_COLUMNS} FROM conversations {where} ORDER BY timestamp DESC, id DESC",
+            params
+        )
+        while True:
+            rows = db_cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield _conversation_row(row)
+        db_cursor.close()
+        finished = True
+    finally:
+        # Se il client si è disconnesso a metà, la connessione ha ancora righe da leggere: la scartiamo
+        pool.release(conn, broken=not finished)
@@ -0,0 +1,75 @@
+"""
+FAQ della startup
+Unica fonte per le domande/risposte usate nel prompt di sistema e nella risposta diretta
+"""
+
+import re
+import unicodedata
+from typing import Optional
+
+# paraphrases: altri modi di fare la stessa domanda, usati dal router degli intenti (intent_router.py)
+FAQ_ENTRIES = [
+    {
+        'question': "Che prodotto sviluppate?",
+        'answer': "Sviluppiamo soluzioni AI",
+        'paraphrases': [
+            "Cosa sviluppate?", "Di cosa vi occupate?", "Che cosa fate?", "Qual è il vostro prodotto?",
+            "Cosa producete?", "Che tipo di prodotto offrite?", "What do you build?", "Che soluzioni sviluppate?",
+        ],
+    },
+    {
+        'question': "Dove avete la sede?",
+        'answer': "Siamo una startup di Milano con team remoto",
+        'paraphrases': [
+            "Dove siete?", "Dove si trova la vostra sede?", "In che città siete?", "Dove siete basati?",
+            "Dove lavorate?", "Avete un ufficio?", "Where are you located?", "Dove è la sede della startup?",
+        ],
+    },
+    {
+        'question': "Come funziona il vostro prodotto?",
+        'answer': "Utilizziamo Vertex AI di Google",
+        'paraphrases': [
+            "Come funziona?", "Su che tecnologia si basa il prodotto?", "Che tecnologia usate?",
+            "Come funziona la vostra soluzione?", "Che AI usate?", "How does it work?", "Quale modello usate?",
+        ],
+    },
+    {
+        'question': "Chi può usare il prodotto?",
+        'answer': "Aziende che gestiscono grandi volumi di documenti",
+        'paraphrases': [
+            "A chi è rivolto il prodotto?", "Chi sono i vostri clienti?", "Per chi è pensato?",
+            "Posso usarlo anch'io?", "È adatto alla mia azienda?", "Who is it for?", "Chi lo può usare?",
+        ],
+    },
+    {
+        'question': "Quanto costa?",
+        'answer': "Offriamo piani personalizzati in base al numero delle richieste/volume dell'azienda",
+        'paraphrases': [
+            "Qual è il prezzo?", "Quanto costa il prodotto?", "Quali sono i prezzi?", "Avete un listino prezzi?",
+            "Quanto si paga?", "Che piani offrite?", "How much does it cost?", "Quanto costa l'abbonamento?",
+        ],
+    },
+]
+
+def normalize_message(text: str) -> str:
+    """
+    Normalizza un messaggio per confronti e chiavi di cache:
+    minuscolo, senza accenti né punteggiatura, spazi compattati
+    """
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+# Domanda normalizzata -> risposta
+FAQ_ANSWERS = {normalize_message(entry['question']): entry['answer'] for entry in FAQ_ENTRIES}
+
+def match_faq(message: str) -> Optional[str]:
+    """
+    Risposta diretta se il messaggio è esattamente una delle FAQ (senza chiamare il modello)
+    """
+    return FAQ_ANSWERS.get(normalize_message(message))
+
+def format_faq_list() -> str:
+    """Elenco delle FAQ nel formato usato dal prompt di sistema"""
+    return '\n'.join(f'   - "{entry["question"]}" → "{entry["answer"]}"' for entry in FAQ_ENTRIES)
@@ -0,0 +1,55 @@
+"""
+Configurazione Gunicorn per la produzione (Cloud Run)
+Avvio: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+# Indirizzo e porta (Cloud Run passa PORT)
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Processi e thread: le richieste passano quasi tutto il tempo in attesa di I/O
+# (Gemini, sito web, MySQL), quindi pochi processi con molti thread ciascuno.
+# Per la versione asincrona (async_app:app) usare GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Timeout: una richiesta bloccata oltre `timeout` secondi fa riavviare il worker;
+# allo spegnimento i worker hanno `graceful_timeout` secondi per finire le richieste
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Carica app.py una volta nel master, prima del fork; il modello Vertex e le connessioni
+# vengono creati nei worker dal warm-up in background (vedi /ready)
+preload_app = True
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    # Verifica credenziali, precarica i segreti e prepara il database una volta sola
+    from app import startup
+    startup()
+
+
+def post_fork(server, worker):
+    # Thread in background, pool di connessioni, client gRPC e modello vanno creati in ogni worker
+    from app import start_worker
+    start_worker()
+
+
+def worker_exit(server, worker):
+    # Svuota la coda delle conversazioni e chiude il pool prima di uscire
+    from app import stop_worker
+    stop_worker()
+
+
+def child_exit(server, worker):
+    # Con PROMETHEUS_MULTIPROC_DIR le metriche dei worker terminati vanno marcate come chiuse
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,346 @@
+"""
+Estrazione del testo dalle pagine HTML del sito
+
+Backend intercambiabili, scelti con HTML_PARSER ('auto' = il più veloce installato):
+- selectolax: parser lexbor in C, il più veloce
+- lxml: parser libxml2, alimentato a blocchi
+- stdlib: html.parser della libreria standard, incrementale (nessun albero in memoria)
+- bs4: il percorso precedente con BeautifulSoup, per confronto
+
+Tutti producono blocchi di testo: titoli, voci di elenco, paragrafi e celle restano
+passaggi separati invece di un unico testo, così l'indice di ricerca non mescola un
+titolo con la frase che lo segue. Script, stili e menu di navigazione vengono scartati
+(i link dei menu restano per il crawler). Oltre HTML_MAX_BYTES la pagina viene troncata.
+"""
+
+import abc
+import codecs
+import re
+import threading
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+from urllib.parse import urljoin
+
+from config import Config
+
+# Elementi il cui contenuto non è testo della pagina (o è boilerplate di navigazione)
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'iframe', 'nav', 'aside'}
+
+# Elementi che iniziano e chiudono un blocco di testo
+BLOCK_TAGS = {
+    'title', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'li', 'dt', 'dd', 'ul', 'ol', 'dl',
+    'div', 'section', 'article', 'main', 'header', 'footer', 'blockquote', 'pre', 'address',
+    'table', 'tr', 'td', 'th', 'caption', 'figcaption', 'form', 'fieldset', 'legend', 'br', 'hr',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+Html = Union[bytes, Iterable[bytes]]
+
+
+class Extracted(NamedTuple):
+    """Risultato dell'estrazione"""
+    blocks: List[str]
+    links: List[str]
+    truncated: bool = False
+
+    @property
+    def text(self) -> str:
+        """Un blocco per riga (split_passages() divide anche sugli a capo)"""
+        return '\n'.join(self.blocks)
+
+
+def sniff_encoding(head: bytes) -> str:
+    """Codifica dal BOM o dal <meta charset> nei primi byte, altrimenti UTF-8"""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    match = META_CHARSET.search(head[:4096])
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode('ascii')).name
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return 'utf-8'
+
+
+def iter_limited(html: Html, max_bytes: int) -> Iterator[Optional[bytes]]:
+    """Blocchi di byte fino a max_bytes; l'ultimo è None se la pagina è stata troncata"""
+    chunks = [html] if isinstance(html, (bytes, bytearray)) else html
+    total = 0
+    for chunk in chunks:
+        for start in range(0, len(chunk), CHUNK_SIZE):
+            piece = chunk[start:start + CHUNK_SIZE]
+            if total + len(piece) > max_bytes:
+                if max_bytes > total:
+                    yield bytes(piece[:max_bytes - total])
+                yield None
+                return
+            total += len(piece)
+            yield bytes(piece)
+
+
+def read_limited(html: Html, max_bytes: int):
+    """(byte fino a max_bytes, troncata) per i backend che vogliono tutto il documento"""
+    chunks = list(iter_limited(html, max_bytes))
+    truncated = bool(chunks) and chunks[-1] is None
+    return b''.join(chunk for chunk in chunks if chunk is not None), truncated
+
+
+class _BlockBuilder:
+    """Riceve eventi start/end/data da qualsiasi parser e costruisce blocchi e link"""
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url
+        self.blocks: List[str] = []
+        self.links: List[str] = []
+        self._parts: List[str] = []
+        self._skip = 0
+
+    def start(self, tag: str, href: Optional[str] = None):
+        if href and self.base_url and tag == 'a':
+            self.links.append(urljoin(self.base_url, href))
+        if tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.flush()
+
+    def end(self, tag: str):
+        if tag in SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in BLOCK_TAGS:
+            self.flush()
+
+    def data(self, text: Optional[str]):
+        if text and not self._skip:
+            self._parts.append(text)
+
+    def flush(self):
+        if self._parts:
+            text = ' '.join(''.join(self._parts).split())
+            self._parts = []
+            if text:
+                self.blocks.append(text)
+
+    def result(self, truncated: bool = False) -> Extracted:
+        self.flush()
+        return Extracted(self.blocks, self.links, truncated)
+
+
+class HtmlExtractor(abc.ABC):
+    """Interfaccia comune dei backend"""
+
+    name = ''
+
+    def __init__(self, max_bytes: int = Config.HTML_MAX_BYTES):
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def available() -> bool:
+        return True
+
+    @abc.abstractmethod
+    def extract(self, html: Html, base_url: Optional[str] = None) -> Extracted:
+        """
+        Blocchi di testo e, se base_url è indicato, link assoluti della pagina
+
+        Args:
+            html: byte della pagina o iterabile di blocchi di byte (risposta in streaming)
+        """
+
+
+class StdlibExtractor(HtmlExtractor):
+    """html.parser alimentato a blocchi: la memoria resta proporzionale al testo, non all'HTML"""
+
+    name = 'stdlib'
+
+    def extract(self, html: Html, base_url: Optional[str] = None) -> Extracted:
+        from html.parser import HTMLParser
+
+        builder = _BlockBuilder(base_url)
+
+        class Parser(HTMLParser):
+            def handle_starttag(self, tag, attrs):
+                builder.start(tag, dict(attrs).get('href') if tag == 'a' else None)
+
+            def handle_endtag(self, tag):
+                builder.end(tag)
+
+            def handle_data(self, data):
+                builder.data(data)
+
+        parser = Parser()
+        decoder = None
+        truncated = False
+        for chunk in iter_limited(html, self.max_bytes):
+            if chunk is None:
+                truncated = True
+                break
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(sniff_encoding(chunk))(errors='replace')
+            parser.feed(decoder.decode(chunk))
+        if decoder is not None:
+            parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        return builder.result(truncated)
+
+
+class LxmlExtractor(HtmlExtractor):
+    """libxml2 alimentato a blocchi (feed), albero compatto in C"""
+
+    name = 'lxml'
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import lxml.etree  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, html: Html, base_url: Optional[str] = None) -> Extracted:
+        from lxml import etree
+
+        parser = None
+        truncated = False
+        for chunk in iter_limited(html, self.max_bytes):
+            if chunk is None:
+                truncated = True
+                break
+            if parser is None:
+                # libxml2 riconosce da solo il BOM, ma non il nome 'utf-8-sig'
+                encoding = sniff_encoding(chunk).replace('utf-8-sig', 'utf-8')
+                parser = etree.HTMLParser(encoding=encoding, remove_comments=True,
+                                          remove_pis=True, no_network=True)
+            parser.feed(chunk)
+        builder = _BlockBuilder(base_url)
+        root = parser.close() if parser is not None else None
+        if root is None:
+            return builder.result(truncated)
+
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, tuple):
+                builder.end(node[0])
+                builder.data(node[1])
+                continue
+            tag = node.tag if isinstance(node.tag, str) else ''
+            builder.start(tag, node.get('href') if tag == 'a' else None)
+            builder.data(node.text)
+            stack.append((tag, node.tail))
+            stack.extend(reversed(node))
+        return builder.result(truncated)
+
+
+class SelectolaxExtractor(HtmlExtractor):
+    """Parser lexbor (selectolax): il documento intero viene analizzato in C"""
+
+    name = 'selectolax'
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import selectolax.lexbor  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, html: Html, base_url: Optional[str] = None) -> Extracted:
+        from selectolax.lexbor import LexborHTMLParser
+
+        data, truncated = read_limited(html, self.max_bytes)
+        tree = LexborHTMLParser(data.decode(sniff_encoding(data[:4096]), errors='replace'))
+        builder = _BlockBuilder(base_url)
+        if base_url:
+            builder.links = [urljoin(base_url, a.attributes['href'])
+                             for a in tree.css('a[href]') if a.attributes.get('href')]
+            builder.base_url = None
+        # I contenuti da scartare vengono rimossi in C prima della visita
+        tree.strip_tags(list(SKIP_TAGS))
+
+        stack = [tree.root] if tree.root is not None else []
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                builder.end(node)
+                continue
+            tag = node.tag
+            if tag == '-text':
+                builder.data(node.text_content)
+                continue
+            builder.start(tag)
+            stack.append(tag)
+            stack.extend(reversed(list(node.iter(include_text=True))))
+        return builder.result(truncated)
+
+
+class Bs4Extractor(HtmlExtractor):
+    """Percorso precedente: BeautifulSoup con html.parser, tutto il testo in un unico blocco"""
+
+    name = 'bs4'
+
+    @staticmethod
+    def available() -> bool:
+        try:
+            import bs4  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def extract(self, html: Html, base_url: Optional[str] = None) -> Extracted:
+        from bs4 import BeautifulSoup
+
+        data, truncated = read_limited(html, self.max_bytes)
+        soup = BeautifulSoup(data, 'html.parser')
+        links = [urljoin(base_url, a['href']) for a in soup.find_all('a', href=True)] if base_url else []
+
+        # Rimuovi script e style
+        for script in soup(["script", "style"]):
+            script.decompose()
+
+        # Pulisci il testo
+        lines = (line.strip() for line in soup.get_text().splitlines())
+        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        text = ' '.join(chunk for chunk in chunks if chunk)
+        return Extracted([text] if text else [], links, truncated)
+
+
+# In ordine di preferenza per HTML_PARSER=auto (bs4 solo se richiesto esplicitamente)
+BACKENDS = {
+    'selectolax': SelectolaxExtractor,
+    'lxml': LxmlExtractor,
+    'stdlib': StdlibExtractor,
+    'bs4': Bs4Extractor,
+}
+
+
+def create_extractor(name: str = 'auto', max_bytes: int = Config.HTML_MAX_BYTES) -> HtmlExtractor:
+    """
+    Backend richiesto, o il più veloce installato con 'auto'
+
+    Raises:
+        ValueError se il backend non esiste o non è installato
+    """
+    if name == 'auto':
+        name = next(backend for backend in ('selectolax', 'lxml', 'stdlib') if BACKENDS[backend].available())
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"HTML_PARSER sconosciuto: {name} (disponibili: auto, {', '.join(BACKENDS)})")
+    if not backend.available():
+        raise ValueError(f"HTML_PARSER={name} non è installato")
+    return backend(max_bytes)
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+def get_extractor() -> HtmlExtractor:
+    """Backend scelto da HTML_PARSER, creato al primo parsing"""
+    global _extractor
+    if _extractor is None:
+        with _extractor_lock:
+            if _extractor is None:
+                _extractor = create_extractor(Config.HTML_PARSER)
+                print(f"Estrazione HTML con {_extractor.name}")
+    return _extractor
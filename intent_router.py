@@ -0,0 +1,180 @@
+"""
+Router degli intenti per i messaggi della chat
+Decide, senza chiamare il modello, se un messaggio è:
+- 'faq': una FAQ, esatta o quasi (es. errori di battitura) → risposta diretta
+- 'llm': domanda generica o che somiglia a una FAQ → modello con il prompt delle FAQ, senza sito
+- 'site': domanda sulla startup non coperta dalle FAQ → contesto dal sito + modello
+
+Classificatore locale su CPU: TF-IDF di n-grammi di caratteri sugli esempi
+(FAQ con riformulazioni, domande generiche, domande sul sito) e similarità
+coseno con NumPy. Gli n-grammi di caratteri reggono errori di battitura,
+plurali e coniugazioni diverse meglio delle parole chiave.
+
+La risposta diretta salta il modello, quindi è riservata ai casi quasi certi: soglia
+alta e un margine sull'esempio non-FAQ più vicino. "Quanto costa il GDPR?" somiglia a
+"Quanto costa?" ma non è quella domanda: va al modello, che ha comunque le FAQ nel prompt.
+"""
+
+import math
+import threading
+from collections import Counter
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from faq import FAQ_ENTRIES, match_faq, normalize_message
+
+# Domande a cui il modello risponde da solo: saluti e domande generali sulle startup
+LLM_EXAMPLES = [
+    "Ciao", "Buongiorno", "Salve", "Ciao come va?", "Grazie mille", "Grazie per l'aiuto", "Ok perfetto",
+    "Chi sei?", "Sei un bot?", "Cosa sai fare?", "Che domande posso farti?",
+    "Cos'è una startup?", "Come si finanzia una startup?", "Cos'è un business plan?",
+    "Che differenza c'è tra startup e PMI?", "Cos'è il venture capital?", "Cosa sono i business angel?",
+    "Cos'è l'intelligenza artificiale?", "Cos'è il machine learning?", "Cos'è un modello linguistico?",
+    "Hello", "Thank you", "What is a startup?",
+]
+
+# Domande sulla startup che le FAQ non coprono: serve il contenuto del sito
+SITE_EXAMPLES = [
+    "Quali servizi offrite?", "Quali servizi offrite alle aziende?", "Che servizi avete?",
+    "Come posso contattarvi?", "Qual è la vostra email?", "Avete un numero di telefono?",
+    "Chi fa parte del team?", "Chi sono i fondatori?", "Chi è il CEO?", "Quante persone lavorano da voi?",
+    "State assumendo?", "Come posso lavorare con voi?", "Avete posizioni aperte?",
+    "Avete casi di studio?", "Con quali clienti avete lavorato?", "Avete dei partner?",
+    "Come gestite la sicurezza dei documenti?", "Siete conformi al GDPR?", "Dove sono salvati i dati?",
+    "Avete integrazioni con altri software?", "Avete delle API?", "Avete un blog?",
+    "Quando è stata fondata Alomana?", "Qual è la storia di Alomana?", "Cosa dice il sito di Alomana?",
+    "Avete una demo?", "Come posso richiedere una demo?", "Offrite supporto tecnico?",
+]
+
+
+class Route(NamedTuple):
+    """Esito del routing di un messaggio"""
+    intent: str                     # 'faq', 'llm' o 'site'
+    score: float                    # similarità con l'esempio più vicino (1.0 = FAQ esatta)
+    answer: Optional[str] = None    # risposta diretta se intent == 'faq'
+    matched: Optional[str] = None   # esempio più vicino, utile per il debug delle soglie
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = (3, 4, 5)) -> Counter:
+    """N-grammi di caratteri di ogni parola (con spazi ai bordi) più le parole intere"""
+    grams = Counter()
+    for word in text.split():
+        padded = f" {word} "
+        grams[word] += 1
+        for n in sizes:
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class IntentRouter:
+    """
+    Classificatore a vicino più prossimo sugli esempi, con soglie di confidenza
+
+    Args:
+        examples: lista di (testo, intento, risposta o None)
+        faq_threshold: similarità minima per rispondere direttamente con la FAQ
+        faq_margin: vantaggio minimo della FAQ sull'esempio non-FAQ più simile
+        llm_threshold: similarità minima con una FAQ o domanda generica per evitare il sito
+    """
+
+    def __init__(self, examples: List[Tuple[str, str, Optional[str]]],
+                 faq_threshold: float = 0.85, llm_threshold: float = 0.35, faq_margin: float = 0.3):
+        self.faq_threshold = faq_threshold
+        self.faq_margin = faq_margin
+        self.llm_threshold = llm_threshold
+        self.texts = [text for text, _, _ in examples]
+        self.intents = [intent for _, intent, _ in examples]
+        self.answers = [answer for _, _, answer in examples]
+        self._non_faq = np.array([intent != 'faq' for intent in self.intents])
+
+        documents = [char_ngrams(normalize_message(text)) for text in self.texts]
+        document_frequency = Counter(gram for grams in documents for gram in grams)
+        self.vocabulary = {gram: i for i, gram in enumerate(document_frequency)}
+
+        # IDF con smoothing; gli n-grammi mai visti pesano come quelli più rari
+        n = len(documents)
+        self.idf = np.array([math.log((1 + n) / (1 + document_frequency[gram])) + 1
+                             for gram in self.vocabulary], dtype=np.float32)
+        self.unknown_idf = math.log(1 + n) + 1
+
+        # Matrice n-grammi x esempi, colonne normalizzate: la similarità coseno è un prodotto scalare
+        self.matrix = np.zeros((len(self.vocabulary), n), dtype=np.float32)
+        for column, grams in enumerate(documents):
+            for gram, count in grams.items():
+                row = self.vocabulary[gram]
+                self.matrix[row, column] = (1 + math.log(count)) * self.idf[row]
+        self.matrix /= np.linalg.norm(self.matrix, axis=0, keepdims=True)
+
+    @classmethod
+    def from_faq(cls, faq_threshold: float = Config.ROUTER_FAQ_THRESHOLD,
+                 llm_threshold: float = Config.ROUTER_LLM_THRESHOLD,
+                 faq_margin: float = Config.ROUTER_FAQ_MARGIN) -> "IntentRouter":
+        """Router con le FAQ di faq.py (domanda e riformulazioni) e gli esempi di questo modulo"""
+        examples = []
+        for entry in FAQ_ENTRIES:
+            for text in [entry['question']] + entry.get('paraphrases', []):
+                examples.append((text, 'faq', entry['answer']))
+        examples += [(text, 'llm', None) for text in LLM_EXAMPLES]
+        examples += [(text, 'site', None) for text in SITE_EXAMPLES]
+        return cls(examples, faq_threshold, llm_threshold, faq_margin)
+
+    def similarities(self, message: str) -> np.ndarray:
+        """Similarità coseno del messaggio con ogni esempio"""
+        grams = char_ngrams(normalize_message(message))
+        rows, weights = [], []
+        norm = 0.0
+        for gram, count in grams.items():
+            row = self.vocabulary.get(gram)
+            tf = 1 + math.log(count)
+            if row is None:
+                # Non contribuisce alla similarità, ma abbassa la norma del messaggio
+                norm += (tf * self.unknown_idf) ** 2
+                continue
+            weight = tf * float(self.idf[row])
+            rows.append(row)
+            weights.append(weight)
+            norm += weight ** 2
+        if not rows:
+            return np.zeros(self.matrix.shape[1], dtype=np.float32)
+        return np.asarray(weights, dtype=np.float32) @ self.matrix[rows] / math.sqrt(norm)
+
+    def route(self, message: str) -> Route:
+        """Sceglie il percorso per un messaggio"""
+        normalized = normalize_message(message)
+        answer = match_faq(normalized)
+        if answer is not None:
+            return Route('faq', 1.0, answer, message)
+        if not normalized:
+            return Route('llm', 0.0)
+
+        scores = self.similarities(normalized)
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        intent = self.intents[best]
+        if intent == 'faq' and score >= self.faq_threshold:
+            runner_up = float(scores[self._non_faq].max()) if self._non_faq.any() else 0.0
+            if score - runner_up >= self.faq_margin:
+                return Route('faq', score, self.answers[best], self.texts[best])
+        if intent in ('faq', 'llm') and score >= self.llm_threshold:
+            # FAQ incerta o domanda generica: il modello ha già le FAQ nel prompt
+            return Route('llm', score, None, self.texts[best])
+        # Nel dubbio consultiamo il sito, come faceva il controllo a parole chiave
+        return Route('site', score, None, self.texts[best])
+
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    """
+    Restituisce il router condiviso, costruito al primo uso (o dal warm-up)
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = IntentRouter.from_faq()
+    return _router
@@ -1,7 +1,43 @@
+import asyncio
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 import re
-from typing import Dict, List, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from config import Config
+from page_cache import PageCache, CachedPage
+from html_extractor import CHUNK_SIZE, get_extractor, read_limited
+from site_index import SiteIndex, split_passages
+from site_crawler import SiteCrawler
+from metrics import span
+from resilience import SingleFlight, Upstream
+
+if TYPE_CHECKING:
+    import aiohttp  # solo per le annotazioni: a runtime viene importato da get_async_session()
+
+# Cache condivisa da tutte le istanze dello scraper nel processo
+page_cache = PageCache(
+    ttl=Config.SCRAPER_CACHE_TTL,
+    stale_ttl=Config.SCRAPER_CACHE_STALE_TTL,
+    max_bytes=Config.SCRAPER_CACHE_MAX_BYTES,
+    negative_ttl=Config.SCRAPER_CACHE_NEGATIVE_TTL
+)
+
+# Download del sito dal percorso delle richieste: limiti condivisi e un solo download
+# per pagina anche quando molte richieste la trovano mancante insieme
+scraper_upstream = Upstream(
+    'scraper',
+    max_concurrency=Config.SCRAPER_MAX_CONCURRENCY,
+    rate=Config.SCRAPER_RATE,
+    burst=Config.SCRAPER_BURST,
+    max_retries=Config.UPSTREAM_MAX_RETRIES,
+    backoff_base=Config.UPSTREAM_BACKOFF_BASE,
+    backoff_max=Config.UPSTREAM_BACKOFF_MAX,
+    deadline=Config.SCRAPER_DEADLINE,
+    queue_timeout=Config.UPSTREAM_QUEUE_TIMEOUT
+)
+scraper_flight = SingleFlight('scraper')
 
 class MCPWebScraper:
     """
@@ -19,39 +55,164 @@ class MCPWebScraper:
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
         })
+        # Pool di connessioni abbastanza grande per il crawl in parallelo
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, Config.CRAWL_CONCURRENCY))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
     
-    
+    @property
+    def site_key(self) -> str:
+        """Chiave in cache dell'indice costruito dal crawl di tutto il sito"""
+        return self.website_url + '#site'
     
     def get_website_content(self) -> Optional[str]:
         """
-        Scarica il contenuto del sito web
+        Restituisce il contenuto testuale del sito web (dalla cache se possibile)
+        """
+        page = self.get_page()
+        return page.text if page else None
+    
+    def get_page(self) -> Optional[CachedPage]:
+        """
+        Restituisce la pagina in cache con testo e informazioni chiave già estratte
+        """
+        return page_cache.get(self.website_url, self.fetch_page_shared)
+    
+    def fetch_page_shared(self, previous: Optional[CachedPage] = None) -> Optional[CachedPage]:
+        """
+        fetch_page() condiviso: le richieste che arrivano durante il download ne aspettano l'esito
+        """
+        return scraper_flight.do(self.website_url, lambda: self.fetch_page(previous))
+    
+    def fetch_page(self, previous: Optional[CachedPage] = None) -> Optional[CachedPage]:
+        """
+        Scarica e analizza il sito web, con GET condizionale se abbiamo già una copia
         """
         try:
             print(f"Scaricando contenuto da: {self.website_url}")
-            response = self.session.get(self.website_url, timeout=10)
-            response.raise_for_status()
+            headers = {}
+            if previous is not None:
+                if previous.etag:
+                    headers['If-None-Match'] = previous.etag
+                if previous.last_modified:
+                    headers['If-Modified-Since'] = previous.last_modified
+            def download():
+                # In streaming: di una pagina enorme leggiamo solo i primi HTML_MAX_BYTES (+1 per saperlo)
+                with self.session.get(self.website_url, timeout=10, headers=headers, stream=True) as response:
+                    response.raise_for_status()  # 429 e 5xx vengono ritentati con backoff
+                    body, _ = read_limited(response.iter_content(CHUNK_SIZE), Config.HTML_MAX_BYTES + 1)
+                    return response, body
+            
+            with span('http_fetch'):
+                response, body = scraper_upstream.call(download)
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            if response.status_code == 304 and previous is not None:
+                print("Contenuto non modificato (304), riuso la copia in cache")
+                previous.touch()
+                return previous
             
-            # Rimuovi script e style
-            for script in soup(["script", "style"]):
-                script.decompose()
+            return self.build_page(
+                body,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
+            
+        except Exception as e:
+            print(f"Errore nel scaricare il sito web: {e}")
+            return None
+    
+    def build_page(self, html: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None) -> CachedPage:
+        """
+        Analizza l'HTML scaricato: testo pulito, informazioni chiave e indice di ricerca
+        """
+        with span('html_parse'):
+            text = self.parse_html(html)
+            info = self.extract_key_information(text)
+        print(f"Contenuto scaricato: {len(text)} caratteri")
+        with span('index_build'):
+            index = SiteIndex.from_text(text)
+        return CachedPage(
+            url=self.website_url,
+            text=text,
+            info=info,
+            etag=etag,
+            last_modified=last_modified,
+            index=index
+        )
+    
+    async def get_page_async(self) -> Optional[CachedPage]:
+        """
+        Come get_page(), ma senza bloccare l'event loop durante il download
+        """
+        return await page_cache.get_async(self.website_url, self.fetch_page_shared_async)
+    
+    async def fetch_page_shared_async(self, previous: Optional[CachedPage] = None) -> Optional[CachedPage]:
+        """
+        Versione asincrona di fetch_page_shared()
+        """
+        return await scraper_flight.do_async(self.website_url, lambda: self.fetch_page_async(previous))
+    
+    async def fetch_page_async(self, previous: Optional[CachedPage] = None) -> Optional[CachedPage]:
+        """
+        Versione asincrona di fetch_page() con aiohttp
+        """
+        try:
+            print(f"Scaricando contenuto (async) da: {self.website_url}")
+            headers = dict(self.session.headers)
+            if previous is not None:
+                if previous.etag:
+                    headers['If-None-Match'] = previous.etag
+                if previous.last_modified:
+                    headers['If-Modified-Since'] = previous.last_modified
+            import aiohttp
+            session = get_async_session()
             
-            # Estrai testo
-            text = soup.get_text()
+            async def download():
+                async with session.get(self.website_url, headers=headers,
+                                       timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    response.raise_for_status()
+                    if response.status == 304:
+                        return response.status, None, None, None
+                    body = []
+                    size = 0
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        body.append(chunk[:Config.HTML_MAX_BYTES + 1 - size])
+                        size += len(body[-1])
+                        if size > Config.HTML_MAX_BYTES:
+                            break
+                    return (response.status, b''.join(body),
+                            response.headers.get('ETag'), response.headers.get('Last-Modified'))
             
-            # Pulisci il testo
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
+            with span('http_fetch'):
+                status, html, etag, last_modified = await scraper_upstream.call_async(download)
+            if status == 304 and previous is not None:
+                previous.touch()
+                return previous
             
-            print(f"Contenuto scaricato: {len(text)} caratteri")
-            return text
+            # Parsing e indicizzazione usano CPU: li facciamo fuori dall'event loop
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.build_page, html, etag, last_modified)
             
         except Exception as e:
             print(f"Errore nel scaricare il sito web: {e}")
             return None
     
+    def parse_html(self, html: bytes) -> str:
+        """
+        Estrae il testo pulito dall'HTML
+        """
+        return self.parse_page(html)[0]
+    
+    def parse_page(self, html: bytes, base_url: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Estrae il testo pulito (un blocco per riga: titoli, voci di elenco, paragrafi)
+        e, se base_url è indicato, i link assoluti della pagina
+        """
+        extracted = get_extractor().extract(html, base_url)
+        if extracted.truncated:
+            print(f"⚠️ Pagina oltre {Config.HTML_MAX_BYTES} byte: analizzata solo la prima parte")
+        return extracted.text, extracted.links
+    
     def extract_key_information(self, content: str) -> Dict[str, str]:
         """
         Estrae informazioni chiave dal contenuto del sito
@@ -113,28 +274,67 @@ class MCPWebScraper:
         else:
             return "Alomana è una startup tech che sviluppa soluzioni AI innovative per aziende, con sede a Milano."
 
-    def search_website_for_query(self, query: str) -> str:
+    def crawl_site(self) -> Optional[CachedPage]:
+        """
+        Scarica le pagine del sito (stesso dominio) e costruisce un unico indice di ricerca
+        """
+        crawler = SiteCrawler(
+            self.website_url, self.session, self.parse_page,
+            max_pages=Config.CRAWL_MAX_PAGES,
+            max_depth=Config.CRAWL_MAX_DEPTH,
+            concurrency=Config.CRAWL_CONCURRENCY,
+            rate_per_host=Config.CRAWL_RATE_PER_HOST
+        )
+        pages = crawler.crawl()
+        if not pages:
+            return None
+        
+        passages = [passage for page in pages for passage in split_passages(page.text)]
+        text = '\n'.join(page.text for page in pages)
+        site = CachedPage(
+            url=self.site_key,
+            text=text,
+            info=self.extract_key_information(text),
+            index=SiteIndex(passages)
+        )
+        page_cache.put(site)
+        print(f"Indice del sito aggiornato: {len(site.index)} frasi da {len(pages)} pagine")
+        return site
+    
+    def search_passages(self, query: str, page: Optional[CachedPage] = None, top_k: int = 5) -> List[str]:
+        """
+        Restituisce le top_k frasi del sito più rilevanti per la query
+        Usa l'indice del crawl completo se disponibile, altrimenti quello della home
+        """
+        page = page_cache.peek(self.site_key) or page or self.get_page()
+        if not page or page.index is None:
+            return []
+        return [passage for _, passage in page.index.search(query, top_k)]
+    
+    def search_website_for_query(self, query: str, page: Optional[CachedPage] = None) -> str:
         """
         Cerca informazioni specifiche nel sito web basandosi sulla query
         """
-        content = self.get_website_content() #se il sito ritorna niente, usa le informazioni di fallback
-        if not content:
+        return self.context_from_page(query, page or self.get_page())
+    
+    def context_from_page(self, query: str, page: Optional[CachedPage]) -> str:
+        """
+        Contesto per la query da una pagina già scaricata, senza mai scaricare niente
+        (la versione asincrona non può fare download sincroni nell'event loop)
+        """
+        #se il sito ritorna niente, usa le informazioni di fallback
+        if not page or not page.text:
             print("Sito web non accessibile, usando informazioni di fallback...")
             return self.get_fallback_info(query)
         
-        # Estrai informazioni chiave
-        info = self.extract_key_information(content)
+        # Informazioni chiave già estratte e salvate in cache
+        info = page.info
         
-        # Cerca corrispondenze con la query
-        query_lower = query.lower()
-        relevant_info = []
-        
-        for key, value in info.items():
-            if any(word in value.lower() for word in query_lower.split()):
-                relevant_info.append(f"{key}: {value}")
+        # Frasi più rilevanti per la query dall'indice BM25 della pagina
+        passages = self.search_passages(query, page)
         
-        if relevant_info:
-            return f"Informazioni dal sito web Alomana:\n" + "\n".join(relevant_info)
+        if passages:
+            return "Informazioni dal sito web Alomana:\n" + "\n".join(passages)
         else:
             # Ritorna informazioni generali se non trova corrispondenze specifiche
             general_info = []
@@ -144,13 +344,78 @@ class MCPWebScraper:
                 general_info.append(f"Servizi: {info['services']}")
             
             if general_info:
-                return f"Informazioni generali dal sito web Alomana:\n" + "\n".join(general_info)
+                return "Informazioni generali dal sito web Alomana:\n" + "\n".join(general_info)
             else:
                 return self.get_fallback_info(query)
 
-def get_website_context(query: str) -> str:
+_scraper = None
+_scraper_lock = threading.Lock()
+
+def get_scraper() -> MCPWebScraper:
+    """
+    Restituisce lo scraper condiviso (una sola sessione HTTP per processo),
+    creato al primo uso
+    """
+    global _scraper
+    if _scraper is None:
+        with _scraper_lock:
+            if _scraper is None:
+                _scraper = MCPWebScraper()
+    return _scraper
+
+_async_session = None
+
+def get_async_session() -> "aiohttp.ClientSession":
+    """
+    Sessione aiohttp condivisa (pool di connessioni), creata nell'event loop corrente
+    aiohttp viene importato solo qui: la versione Flask non lo carica mai
+    """
+    global _async_session
+    import aiohttp
+    if _async_session is None or _async_session.closed:
+        _async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=100))
+    return _async_session
+
+async def close_async_session():
+    global _async_session
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
+
+_crawl_thread = None
+
+def start_background_crawl(interval: int = Config.CRAWL_INTERVAL):
+    """
+    Avvia il crawl del sito in background: subito e poi ogni `interval` secondi
+    (mai sul percorso delle richieste)
+    """
+    global _crawl_thread
+    if _crawl_thread is not None:
+        return
+    
+    def crawl_loop():
+        while True:
+            try:
+                get_scraper().crawl_site()
+            except Exception as e:
+                print(f"Errore durante il crawl del sito: {e}")
+            time.sleep(interval)
+    
+    _crawl_thread = threading.Thread(target=crawl_loop, name="site-crawler", daemon=True)
+    _crawl_thread.start()
+
+def get_website_context(query: str, page: Optional[CachedPage] = None) -> str:
     """
     Funzione principale per ottenere contesto dal sito web
+    (page: pagina già letta dalla cache, per non rileggerla a ogni domanda di un blocco)
     """
-    scraper = MCPWebScraper()
-    return scraper.search_website_for_query(query)
+    return get_scraper().search_website_for_query(query, page)
+
+async def get_website_context_async(query: str) -> str:
+    """
+    Versione asincrona di get_website_context()
+    """
+    scraper = get_scraper()
+    # Se il download asincrono fallisce si usano le informazioni di fallback, senza riprovare in modo sincrono
+    return scraper.context_from_page(query, await scraper.get_page_async())
+
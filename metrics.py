@@ -0,0 +1,187 @@
+"""
+Metriche di latenza per fase della richiesta, esportate in formato Prometheus su /metrics
+
+- span("fase") misura una fase (sito web, Secret Manager, MySQL, Gemini, ...)
+- ogni richiesta raccoglie le sue fasi e stampa una riga JSON con i tempi
+- SamplingProfiler campiona lo stack del thread della richiesta quando richiesto
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+from prometheus_client.core import GaugeMetricFamily
+
+# Bucket pensati per fasi da qualche millisecondo (cache) a decine di secondi (Gemini)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+STAGE_SECONDS = Histogram(
+    'chatbot_stage_seconds', 'Durata di ogni fase della richiesta', ['stage'], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'chatbot_request_seconds', 'Durata totale delle richieste HTTP', ['endpoint', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+MODEL_TOKENS = Counter('chatbot_model_tokens_total', 'Token usati nelle chiamate a Gemini', ['kind'])
+PROMPT_TOKENS = Histogram(
+    'chatbot_prompt_tokens', 'Token di input per chiamata a Gemini',
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+)
+CONTEXT_TOKENS = Counter(
+    'chatbot_context_tokens_total', 'Token stimati del contesto dal sito, prima e dopo la compressione', ['kind']
+)
+UPSTREAM_EVENTS = Counter(
+    'chatbot_upstream_events_total', 'Chiamate a Gemini e al sito: accodate, coalescenti, ritentate o rifiutate',
+    ['upstream', 'event']
+)
+
+# Fasi della richiesta corrente (ContextVar: funziona sia con i thread sia con asyncio)
+_current_trace = ContextVar('chatbot_trace', default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Misura la durata di una fase e la registra nell'istogramma e nella richiesta corrente"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace['spans'][stage] = trace['spans'].get(stage, 0.0) + elapsed * 1000
+
+
+def record_tokens(response):
+    """Registra i token di input/output dalla risposta di Gemini (usage_metadata)"""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+    output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+    MODEL_TOKENS.labels('prompt').inc(prompt_tokens)
+    MODEL_TOKENS.labels('output').inc(output_tokens)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace['tokens'] = {'prompt': prompt_tokens, 'output': output_tokens}
+
+
+def record_prompt(tokens: dict):
+    """Registra i token stimati del prompt (sistema, contesto prima/dopo il taglio, totale inviato)"""
+    CONTEXT_TOKENS.labels('raw').inc(tokens.get('context_raw', 0))
+    CONTEXT_TOKENS.labels('sent').inc(tokens.get('context', 0))
+    trace = _current_trace.get()
+    if trace is not None:
+        trace['prompt_estimate'] = tokens
+
+
+def start_trace(endpoint: str):
+    """Inizia la raccolta delle fasi per la richiesta corrente"""
+    trace = {'endpoint': endpoint, 'start': time.perf_counter(), 'spans': {}}
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(trace, token, status: int):
+    """Chiude la richiesta: istogramma della durata totale e una riga di log JSON con le fasi"""
+    _current_trace.reset(token)
+    total = time.perf_counter() - trace['start']
+    REQUEST_SECONDS.labels(trace['endpoint'], str(status)).observe(total)
+    if trace['spans']:
+        print(json.dumps({
+            'event': 'request_timing',
+            'endpoint': trace['endpoint'],
+            'status': status,
+            'total_ms': round(total * 1000, 2),
+            'spans_ms': {stage: round(ms, 2) for stage, ms in trace['spans'].items()},
+            'tokens': trace.get('tokens'),
+            'prompt_estimate': trace.get('prompt_estimate'),
+        }))
+
+
+class StatsCollector:
+    """Espone come gauge le statistiche interne (pool, coda, cache) lette al momento dello scrape"""
+
+    def __init__(self):
+        self._sources = {}
+
+    def add(self, name: str, stats_fn):
+        self._sources[name] = stats_fn
+
+    def collect(self):
+        for name, stats_fn in self._sources.items():
+            try:
+                stats = stats_fn()
+            except Exception:
+                continue
+            gauge = GaugeMetricFamily(f'chatbot_{name}', f'Statistiche interne: {name}', labels=['field'])
+            for field, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    gauge.add_metric([field], value)
+            yield gauge
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def metrics_response():
+    """
+    Corpo e content type per /metrics
+    Con più worker Gunicorn impostare PROMETHEUS_MULTIPROC_DIR per aggregare gli istogrammi
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(stats_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento per una singola richiesta
+
+    Un thread legge lo stack del thread della richiesta ogni `interval` secondi;
+    alla fine stampa gli stack più frequenti. Costo nullo quando non è attivo.
+    """
+
+    def __init__(self, interval: float = 0.005, depth: int = 12):
+        self.interval = interval
+        self.depth = depth
+        self.samples = StackCounter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self, label: str = '', top: int = 10):
+        self._stop.set()
+        self._thread.join()
+        total = sum(self.samples.values())
+        print(f"📈 Profilo {label}: {total} campioni ogni {self.interval * 1000:.0f}ms")
+        for stack, count in self.samples.most_common(top):
+            print(f"  {count:5d} ({100 * count / total:.0f}%)  {' > '.join(stack[-4:])}")
@@ -0,0 +1,227 @@
+"""
+Cache delle pagine scaricate dal sito web
+Tiene in memoria testo pulito e informazioni estratte, con TTL,
+revalidation condizionale (ETag / Last-Modified) e refresh in background
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+
+class CachedPage:
+    """
+    Una pagina in cache: testo pulito, informazioni estratte, indice di ricerca
+    e header di validazione
+    """
+
+    def __init__(self, url: str, text: str, info: Dict[str, str],
+                 etag: Optional[str] = None, last_modified: Optional[str] = None, index=None):
+        self.url = url
+        self.text = text
+        self.info = info
+        self.index = index
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = time.monotonic()
+        # Stima della memoria occupata (testo + valori estratti + indice)
+        self.size = len(text.encode('utf-8')) + sum(len(v.encode('utf-8')) for v in info.values())
+        if index is not None:
+            self.size += index.size_estimate()
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def touch(self):
+        """Segna la pagina come appena rivalidata (risposta 304)"""
+        self.fetched_at = time.monotonic()
+
+
+class PageCache:
+    """
+    Cache LRU condivisa dal processo, limitata in byte
+
+    - entro `ttl` secondi la pagina è fresca e viene servita senza rete
+    - tra `ttl` e `stale_ttl` viene servita subito e rivalidata in background
+    - oltre `stale_ttl` il chiamante deve riscaricarla in modo sincrono
+    - se quel download fallisce, per `negative_ttl` secondi non viene ritentato: le
+      richieste ricevono subito la copia vecchia (o None) invece di aspettare a loro
+      volta la deadline del sito irraggiungibile
+    """
+
+    def __init__(self, ttl: int = 300, stale_ttl: int = 3600, max_bytes: int = 5 * 1024 * 1024,
+                 negative_ttl: float = 30):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._failed_until: Dict[str, float] = {}  # url -> fine del periodo senza nuovi tentativi
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def peek(self, url: str) -> Optional[CachedPage]:
+        """Restituisce la pagina in cache (anche scaduta) senza toccare le statistiche"""
+        with self._lock:
+            return self._entries.get(url)
+
+    def put(self, page: CachedPage):
+        """Inserisce o sostituisce una pagina, rispettando il limite di memoria"""
+        with self._lock:
+            old = self._entries.pop(page.url, None)
+            if old is not None:
+                self._size -= old.size
+            if page.size > self.max_bytes:
+                print(f"⚠️ Pagina {page.url} troppo grande per la cache ({page.size} byte)")
+                return
+            self._entries[page.url] = page
+            self._size += page.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def get(self, url: str, fetch: Callable[[Optional[CachedPage]], Optional[CachedPage]]) -> Optional[CachedPage]:
+        """
+        Restituisce la pagina per `url` usando la cache quando possibile
+
+        Args:
+            url: URL della pagina
+            fetch: funzione che riceve la pagina precedente (o None) e restituisce
+                   quella aggiornata, oppure None se il download fallisce
+
+        Returns:
+            La pagina (eventualmente stale) o None se non disponibile
+        """
+        page, state = self._lookup(url)
+        if state == 'fresh':
+            return page
+        if state == 'stale':
+            self._refresh_in_background(url, page, fetch)
+            return page
+
+        # Pagina assente o troppo vecchia: download sincrono (se non è appena fallito)
+        if self._recently_failed(url):
+            return page
+        fresh = fetch(page)
+        self._record_result(url, fresh)
+        if fresh is not None:
+            self.put(fresh)
+            return fresh
+        # Se il sito non risponde serviamo comunque la copia vecchia
+        return page
+
+    async def get_async(self, url: str, fetch) -> Optional[CachedPage]:
+        """
+        Come get(), ma `fetch` è una coroutine: il refresh in background è un task asyncio
+        """
+        page, state = self._lookup(url)
+        if state == 'fresh':
+            return page
+        if state == 'stale':
+            with self._lock:
+                if url in self._refreshing:
+                    return page
+                self._refreshing.add(url)
+            asyncio.get_running_loop().create_task(self._refresh_async(url, page, fetch))
+            return page
+
+        if self._recently_failed(url):
+            return page
+        fresh = await fetch(page)
+        self._record_result(url, fresh)
+        if fresh is not None:
+            self.put(fresh)
+            return fresh
+        return page
+
+    def _recently_failed(self, url: str) -> bool:
+        with self._lock:
+            until = self._failed_until.get(url)
+            if until is None:
+                return False
+            if time.monotonic() < until:
+                self.negative_hits += 1
+                return True
+            del self._failed_until[url]
+            return False
+
+    def _record_result(self, url: str, fresh: Optional[CachedPage]):
+        with self._lock:
+            if fresh is None:
+                if self.negative_ttl > 0:
+                    self._failed_until[url] = time.monotonic() + self.negative_ttl
+            else:
+                self._failed_until.pop(url, None)
+
+    def _lookup(self, url: str):
+        """Restituisce (pagina, stato) con stato 'fresh', 'stale' o 'miss'"""
+        with self._lock:
+            page = self._entries.get(url)
+            if page is not None:
+                self._entries.move_to_end(url)
+
+        if page is not None:
+            age = page.age()
+            if age < self.ttl:
+                self.hits += 1
+                return page, 'fresh'
+            if age < self.stale_ttl:
+                self.stale_hits += 1
+                return page, 'stale'
+        self.misses += 1
+        return page, 'miss'
+
+    async def _refresh_async(self, url: str, page: CachedPage, fetch):
+        try:
+            fresh = await fetch(page)
+            if fresh is not None:
+                self.put(fresh)
+        except Exception as e:
+            print(f"Errore nel refresh in background di {url}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(url)
+
+    def _refresh_in_background(self, url: str, page: CachedPage, fetch):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+
+        def refresh():
+            try:
+                fresh = fetch(page)
+                if fresh is not None:
+                    self.put(fresh)
+            except Exception as e:
+                print(f"Errore nel refresh in background di {url}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(url)
+
+        threading.Thread(target=refresh, name="page-cache-refresh", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failed_until.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+            }
@@ -0,0 +1,145 @@
+"""
+Costruzione del prompt per Gemini con un budget di token
+Il prompt di sistema (FAQ e istruzioni) va al modello come system_instruction,
+quindi qui si compone solo la parte variabile: contesto dal sito e domanda.
+Il contesto viene diviso in frasi, deduplicato, ordinato per rilevanza
+rispetto alla domanda e tagliato al budget; la storia della sessione
+(riassunto + ultimi turni) ha un budget separato.
+"""
+
+import math
+from typing import List, NamedTuple, Optional
+
+from faq import normalize_message
+from site_index import SENTENCE_SPLIT, tokenize
+
+# Stima grezza per il testo italiano/inglese con il tokenizer di Gemini
+CHARS_PER_TOKEN = 4
+
+CONTEXT_HEADER = "Informazioni dal sito web Alomana:"
+
+
+def estimate_tokens(text: str) -> int:
+    """Numero di token stimato dalla lunghezza (senza chiamare l'API count_tokens)"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+class BuiltPrompt(NamedTuple):
+    """Prompt pronto per il modello e conteggi stimati per il log"""
+    text: str
+    tokens: dict
+
+
+class PromptBuilder:
+    """
+    Args:
+        system_prompt: istruzioni fisse (inviate come system_instruction, qui solo per il conteggio)
+        context_budget: token massimi per il contesto dal sito web
+        history_budget: token massimi per la storia della sessione
+        max_sentence_tokens: frasi più lunghe vengono accorciate a questo numero di token
+    """
+
+    def __init__(self, system_prompt: str, context_budget: int = 600, history_budget: int = 500,
+                 max_sentence_tokens: int = 120):
+        self.system_prompt = system_prompt
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.max_sentence_tokens = max_sentence_tokens
+
+    def sentences(self, website_context: str) -> List[str]:
+        """Frasi del contesto senza intestazioni né duplicati (confronto normalizzato)"""
+        seen = set()
+        result = []
+        for line in website_context.splitlines():
+            line = line.strip()
+            if not line or line.endswith(':'):
+                continue
+            for sentence in SENTENCE_SPLIT.split(line):
+                sentence = sentence.strip()
+                key = normalize_message(sentence)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                result.append(self._shorten(sentence))
+        return result
+
+    def _shorten(self, sentence: str) -> str:
+        max_chars = self.max_sentence_tokens * CHARS_PER_TOKEN
+        if len(sentence) <= max_chars:
+            return sentence
+        cut = sentence.rfind(' ', 0, max_chars)
+        return sentence[:cut if cut > 0 else max_chars] + "…"
+
+    def rank(self, user_message: str, sentences: List[str]) -> List[str]:
+        """
+        Ordina le frasi per parole in comune con la domanda (a parità, l'ordine originale,
+        che per i passaggi BM25 è già per rilevanza)
+        """
+        query = set(tokenize(user_message))
+        if not query:
+            return sentences
+
+        def score(item):
+            position, sentence = item
+            words = set(tokenize(sentence))
+            overlap = len(query & words) / math.sqrt(len(words)) if words else 0.0
+            return (-overlap, position)
+
+        return [sentence for _, sentence in sorted(enumerate(sentences), key=score)]
+
+    def select(self, user_message: str, website_context: str) -> List[str]:
+        """Frasi più rilevanti che stanno nel budget di token"""
+        selected, used = [], 0
+        for sentence in self.rank(user_message, self.sentences(website_context)):
+            tokens = estimate_tokens(sentence) + 1
+            if used + tokens > self.context_budget:
+                continue
+            selected.append(sentence)
+            used += tokens
+        return selected
+
+    def history_text(self, history) -> str:
+        """
+        Storia della sessione entro il budget: i turni più recenti hanno la precedenza,
+        il riassunto dei turni vecchi entra solo se resta spazio
+        """
+        turns, used = [], 0
+        for user, assistant in reversed(history.turns):
+            turn = f"Utente: {user}\nAssistente: {self._shorten(assistant)}"
+            tokens = estimate_tokens(turn) + 1
+            if used + tokens > self.history_budget:
+                break
+            turns.insert(0, turn)
+            used += tokens
+        text = ""
+        if history.summary and used + estimate_tokens(history.summary) <= self.history_budget:
+            text += f"Riassunto della conversazione precedente:\n{history.summary}\n\n"
+        if turns:
+            text += "Conversazione recente:\n" + "\n".join(turns) + "\n\n"
+        return text
+
+    def build(self, user_message: str, website_context: str = "", history: Optional[object] = None) -> BuiltPrompt:
+        """
+        Parte variabile del prompt: storia della sessione, contesto compresso e domanda dell'utente
+
+        Args:
+            history: SessionHistory (session_store.py) o None per una domanda isolata
+        """
+        prompt = self.history_text(history) if history else ""
+        history_tokens = estimate_tokens(prompt)
+        context_tokens = 0
+        if website_context:
+            selected = self.select(user_message, website_context)
+            if selected:
+                context = "\n".join(selected)
+                context_tokens = estimate_tokens(context)
+                prompt += f"{CONTEXT_HEADER}\n{context}\n\n"
+        prompt += f"Utente: {user_message}\nAssistente:"
+        return BuiltPrompt(prompt, {
+            'system': self.system_tokens,
+            'history': history_tokens,
+            'context_raw': estimate_tokens(website_context),
+            'context': context_tokens,
+            'prompt': estimate_tokens(prompt),
+        })
@@ -0,0 +1,346 @@
+"""
+Protezione delle chiamate verso Gemini e verso il sito web durante i picchi
+
+- SingleFlight: richieste identiche in corso nello stesso momento condividono una
+  sola chiamata (la prima la esegue, le altre aspettano il suo risultato)
+- Upstream: per ogni servizio esterno un limite di chiamate contemporanee, un token
+  bucket per il rate e retry con backoff esponenziale e jitter, tutto entro una deadline
+- se non c'è posto entro l'attesa massima la chiamata fallisce subito con UpstreamBusy:
+  meglio un 503 veloce che una coda che fa crescere la latenza di tutte le richieste
+
+Ogni metodo ha la versione per i thread (Flask) e quella asyncio (Quart).
+"""
+
+import asyncio
+import random
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import requests
+
+from metrics import UPSTREAM_EVENTS
+
+T = TypeVar('T')
+
+# Codici HTTP per cui ha senso riprovare: rate limit e errori temporanei del server
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class UpstreamBusy(Exception):
+    """Il servizio esterno è saturo: nessuno slot o token libero entro l'attesa massima"""
+
+    def __init__(self, upstream: str, retry_after: float = 1.0):
+        super().__init__(f"{upstream} sovraccarico, riprovare tra {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def http_status(exc: BaseException) -> Optional[int]:
+    """Codice HTTP di un errore di google.api_core, requests o aiohttp (None se non c'è)"""
+    for status in (getattr(exc, 'code', None),                                 # google.api_core
+                   getattr(exc, 'status', None),                               # aiohttp
+                   getattr(getattr(exc, 'response', None), 'status_code', None)):  # requests
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Errori temporanei: 429/5xx, timeout ed errori di connessione"""
+    if isinstance(exc, UpstreamBusy):
+        return False
+    status = http_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError,
+                        requests.ConnectionError, requests.Timeout)):
+        return True
+    # aiohttp è importato solo dalla versione asincrona
+    aiohttp = sys.modules.get('aiohttp')
+    return aiohttp is not None and isinstance(exc, aiohttp.ClientConnectionError)
+
+
+class TokenBucket:
+    """
+    In media `rate` chiamate al secondo, fino a `burst` di fila
+
+    reserve() prenota il token e restituisce quanto aspettare: il chiamante dorme
+    con time.sleep() o asyncio.sleep(), così lo stesso bucket serve thread e asyncio
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Secondi di attesa per il token prenotato, o None (nessun token preso) se supera max_wait"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class Upstream:
+    """
+    Limiti per un servizio esterno, condivisi da tutte le richieste del processo
+
+    Args:
+        name: nome nelle metriche e nei log ('model', 'scraper')
+        max_concurrency: chiamate contemporanee massime
+        rate: chiamate al secondo in media (0 = nessun limite)
+        burst: chiamate di fila oltre il rate medio
+        max_retries: tentativi in più per gli errori temporanei (is_retryable)
+        backoff_base: attesa del primo retry; raddoppia a ogni tentativo, con full jitter
+        backoff_max: attesa massima tra due tentativi
+        deadline: secondi massimi per coda, tentativi e backoff di una chiamata
+        queue_timeout: attesa massima per uno slot o un token prima di rifiutare
+    """
+
+    def __init__(self, name: str, max_concurrency: int = 8, rate: float = 0, burst: float = 1,
+                 max_retries: int = 3, backoff_base: float = 0.2, backoff_max: float = 5.0,
+                 deadline: float = 30.0, queue_timeout: float = 5.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # asyncio.Semaphore è legato all'event loop: lo creiamo nel loop che lo usa
+        self._async_semaphore = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.events: Dict[str, int] = {'calls': 0, 'retries': 0, 'throttled': 0, 'rejected': 0, 'failed': 0}
+
+    def _event(self, event: str):
+        with self._lock:
+            self.events[event] += 1
+        UPSTREAM_EVENTS.labels(self.name, event).inc()
+
+    def _started(self, delta: int):
+        with self._lock:
+            self.in_flight += delta
+
+    def backoff(self, attempt: int) -> float:
+        """Attesa prima del tentativo attempt + 1 (full jitter: uniforme tra 0 e il tetto esponenziale)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _reserve_token(self, deadline_at: float) -> float:
+        wait = self.bucket.reserve(min(self.queue_timeout, deadline_at - time.monotonic()))
+        if wait is None:
+            self._event('rejected')
+            raise UpstreamBusy(self.name, max(1.0, 1.0 / max(self.bucket.rate, 1e-9)))
+        if wait > 0:
+            self._event('throttled')
+        return wait
+
+    def _slot_timeout(self, deadline_at: float) -> float:
+        return max(0.0, min(self.queue_timeout, deadline_at - time.monotonic()))
+
+    @contextmanager
+    def slot(self, deadline_at: Optional[float] = None):
+        """Occupa uno slot (dopo aver preso un token) per la durata del blocco"""
+        deadline_at = deadline_at or time.monotonic() + self.deadline
+        time.sleep(self._reserve_token(deadline_at))
+        if not self._semaphore.acquire(timeout=self._slot_timeout(deadline_at)):
+            self._event('rejected')
+            raise UpstreamBusy(self.name)
+        self._started(1)
+        self._event('calls')
+        try:
+            yield
+        finally:
+            self._started(-1)
+            self._semaphore.release()
+
+    def _retry_delay(self, error: Exception, attempt: int, deadline_at: float) -> float:
+        """Attesa prima del prossimo tentativo; rilancia l'errore se non va ritentato"""
+        if attempt >= self.max_retries or not is_retryable(error):
+            self._event('failed')
+            raise error
+        delay = self.backoff(attempt)
+        if time.monotonic() + delay >= deadline_at:
+            self._event('failed')
+            raise error
+        self._event('retries')
+        print(f"🔁 {self.name}: tentativo {attempt + 2} tra {delay * 1000:.0f}ms ({error})")
+        return delay
+
+    def call(self, fn: Callable[[], T], deadline: Optional[float] = None) -> T:
+        """
+        Esegue fn() con i limiti del servizio, ritentando gli errori temporanei
+
+        Raises:
+            UpstreamBusy: nessuno slot o token entro l'attesa massima
+            l'ultimo errore di fn() se non è temporaneo o i tentativi sono finiti
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            with self.slot(deadline_at):
+                try:
+                    return fn()
+                except Exception as e:
+                    error = e
+            time.sleep(self._retry_delay(error, attempt, deadline_at))
+            attempt += 1
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphore
+
+    @asynccontextmanager
+    async def slot_async(self, deadline_at: Optional[float] = None):
+        """Come slot(), senza bloccare l'event loop"""
+        deadline_at = deadline_at or time.monotonic() + self.deadline
+        wait = self._reserve_token(deadline_at)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        semaphore = self._get_async_semaphore()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self._slot_timeout(deadline_at))
+        except asyncio.TimeoutError:
+            self._event('rejected')
+            raise UpstreamBusy(self.name)
+        self._started(1)
+        self._event('calls')
+        try:
+            yield
+        finally:
+            self._started(-1)
+            semaphore.release()
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], deadline: Optional[float] = None) -> T:
+        """Come call(), ma fn() restituisce una coroutine"""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            async with self.slot_async(deadline_at):
+                try:
+                    return await fn()
+                except Exception as e:
+                    error = e
+            await asyncio.sleep(self._retry_delay(error, attempt, deadline_at))
+            attempt += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'max_concurrency': self.max_concurrency,
+                **self.events,
+            }
+
+
+class _Flight:
+    """Una chiamata in corso e il suo esito"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalescenza delle richieste identiche in corso
+
+    La prima richiesta per una chiave esegue la chiamata, quelle che arrivano mentre è
+    in corso ne ricevono il risultato (o l'errore). Non è una cache: appena la chiamata
+    finisce la chiave viene liberata.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: Optional[str], fn: Callable[[], T]) -> T:
+        if key is None:
+            return fn()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            UPSTREAM_EVENTS.labels(self.name, 'coalesced').inc()
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key: Optional[str], fn: Callable[[], Awaitable[T]]) -> T:
+        """Come do() per le coroutine (un solo event loop per processo)"""
+        if key is None:
+            return await fn()
+        future = self._futures.get(key)
+        if future is not None:
+            self.coalesced += 1
+            UPSTREAM_EVENTS.labels(self.name, 'coalesced').inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Annullata la richiesta che faceva la chiamata, non questa: la rifacciamo
+                if not future.cancelled():
+                    raise
+            return await self.do_async(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Segna l'errore come letto anche se nessuno aspettava
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'flights': len(self._flights) + len(self._futures),
+                    'leaders': self.leaders, 'coalesced': self.coalesced}
@@ -0,0 +1,83 @@
+"""
+Cache delle risposte del modello
+Evita di richiamare Gemini per domande già viste con lo stesso contesto
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from faq import normalize_message
+
+
+class ResponseCache:
+    """
+    Cache LRU con TTL, limitata in byte
+
+    La chiave include il messaggio normalizzato, il prompt di sistema e il contesto
+    del sito web: se uno dei due cambia le vecchie risposte non vengono più trovate
+    e spariscono per LRU/TTL.
+    """
+
+    def __init__(self, ttl: int = 3600, max_bytes: int = 2 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # chiave -> (risposta, scadenza, byte)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(message: str, system_prompt: str, website_context: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (normalize_message(message), system_prompt, website_context):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, response: str):
+        size = len(key) + len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, time.monotonic() + self.ttl, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._size -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,558 @@
+"""
+Archiviazione delle conversazioni vecchie (retention a due livelli)
+
+- caldo: le conversazioni degli ultimi RETENTION_HOT_DAYS giorni restano in MySQL
+- archivio: quelle più vecchie vengono spostate in file JSONL compressi con gzip
+  in ARCHIVE_DIR, a segmenti di ARCHIVE_SEGMENT_ROWS righe in ordine (timestamp, id);
+  manifest.json elenca i segmenti con la prima e l'ultima posizione di ciascuno e un
+  filtro di Bloom degli IP e delle sessioni che contiene
+- dopo RETENTION_ARCHIVE_DAYS giorni (0 = mai) anche i segmenti vengono eliminati
+
+Il job legge a blocchi con il cursore (timestamp, id) e cancella per id in transazioni
+brevi, con una pausa tra un blocco e l'altro: nessun lock lungo sulla tabella.
+Un segmento viene cancellato dal database solo dopo essere stato scritto su disco e
+registrato nel manifest; se il job si interrompe a metà, al giro successivo finisce
+le cancellazioni di quel segmento prima di archiviarne altri.
+
+/history continua negli archivi quando il database non ha più righe per i filtri
+richiesti, con lo stesso cursore. Con un filtro per session_id o user_ip vengono
+decompressi solo i segmenti il cui filtro di Bloom può contenere quel valore.
+
+Il job tiene il lock MySQL GET_LOCK e fa letture e cancellazioni sulla stessa
+connessione: funziona anche con DB_POOL_MAX_SIZE=1. Se il lock non si può verificare
+il giro viene saltato (mai due processi a spostare le stesse righe).
+
+Uso da riga di comando (es. da Cloud Scheduler o cron):
+    python retention.py [--dry-run]
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from config import Config
+from database import (HISTORY_COLUMNS, _conversation_row, decode_cursor, encode_cursor,
+                      get_conversations_page, iter_conversations, pooled_connection)
+from metrics import span
+
+MANIFEST = 'manifest.json'
+
+# Nome del lock MySQL: un solo processo alla volta sposta righe (più worker, più istanze)
+LOCK_NAME = 'chatbot_retention'
+
+
+def _key(row: dict) -> Tuple[datetime, int]:
+    """Posizione di una conversazione nell'ordine di /history"""
+    return datetime.fromisoformat(row['timestamp']), row['id']
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Le date nel database sono senza fuso: since/until con fuso vengono convertiti all'ora locale"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _matches(row: dict, since=None, until=None, user_ip=None, session_id=None) -> bool:
+    """Stessi filtri di database._history_filters() per le righe archiviate"""
+    timestamp = datetime.fromisoformat(row['timestamp'])
+    return ((since is None or timestamp >= since) and
+            (until is None or timestamp < until) and
+            (user_ip is None or row['user_ip'] == user_ip) and
+            (session_id is None or row['session_id'] == session_id))
+
+
+def _filter_keys(user_ip=None, session_id=None) -> List[str]:
+    """Chiavi dei filtri di Bloom per i filtri di /history indicati"""
+    keys = []
+    if user_ip is not None:
+        keys.append(f"ip:{user_ip}")
+    if session_id is not None:
+        keys.append(f"session:{session_id}")
+    return keys
+
+
+class BloomFilter:
+    """Filtro di Bloom compatto (nel manifest): nessun falso negativo, ~1% di falsi positivi"""
+
+    def __init__(self, bits: bytes, hashes: int):
+        self.bits = bits
+        self.hashes = hashes
+
+    @classmethod
+    def build(cls, keys: Iterable[str], error_rate: float = 0.01) -> "BloomFilter":
+        keys = set(keys)
+        size = max(64, math.ceil(-len(keys) * math.log(error_rate) / math.log(2) ** 2))
+        size = (size + 7) // 8 * 8
+        bloom = cls(bytes(size // 8), max(1, round(size / max(1, len(keys)) * math.log(2))))
+        bits = bytearray(bloom.bits)
+        for key in keys:
+            for position in bloom._positions(key):
+                bits[position >> 3] |= 1 << (position & 7)
+        bloom.bits = bytes(bits)
+        return bloom
+
+    def _positions(self, key: str) -> Iterator[int]:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        size = len(self.bits) * 8
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % size
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_dict(self) -> dict:
+        return {'bits': base64.b64encode(self.bits).decode('ascii'), 'hashes': self.hashes}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BloomFilter":
+        return cls(base64.b64decode(data['bits']), data['hashes'])
+
+
+class Segment:
+    """Un file dell'archivio, l'intervallo di posizioni che contiene e i suoi IP e sessioni"""
+
+    def __init__(self, file: str, rows: int, first: List, last: List, state: str = 'written',
+                 keys: Optional[dict] = None):
+        self.file = file
+        self.rows = rows
+        self.first = (datetime.fromisoformat(first[0]), first[1])
+        self.last = (datetime.fromisoformat(last[0]), last[1])
+        self.state = state   # 'written': ancora da cancellare dal database, 'deleted': spostato
+        # None nei manifest scritti prima dei filtri: il segmento va sempre letto
+        self.keys = BloomFilter.from_dict(keys) if keys else None
+
+    def may_contain(self, user_ip=None, session_id=None) -> bool:
+        """False se il segmento sicuramente non ha righe per questo IP o sessione"""
+        return self.keys is None or all(key in self.keys for key in _filter_keys(user_ip, session_id))
+
+    def to_dict(self) -> dict:
+        data = {
+            'file': self.file,
+            'rows': self.rows,
+            'first': [self.first[0].isoformat(), self.first[1]],
+            'last': [self.last[0].isoformat(), self.last[1]],
+            'state': self.state,
+        }
+        if self.keys is not None:
+            data['keys'] = self.keys.to_dict()
+        return data
+
+
+class ConversationArchive:
+    """
+    Segmenti gzip JSONL in una cartella, con manifest e lettura paginata
+
+    Args:
+        directory: cartella dell'archivio (su Cloud Run serve un volume persistente)
+        cache_segments: segmenti decompressi tenuti in memoria per le pagine successive
+    """
+
+    def __init__(self, directory: str, cache_segments: int = 4):
+        self.directory = directory
+        self.cache_segments = cache_segments
+        self._lock = threading.Lock()
+        self._segments: List[Segment] = []
+        self._manifest_mtime = None
+        self._cache: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self.decompressed = 0
+        self.skipped = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def segments(self) -> List[Segment]:
+        """Segmenti dal manifest (riletto solo se è cambiato, anche da un altro processo)"""
+        path = self._path(MANIFEST)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                with open(path, encoding='utf-8') as f:
+                    self._segments = [Segment(**entry) for entry in json.load(f)['segments']]
+                self._manifest_mtime = mtime
+            return list(self._segments)
+
+    def _save_manifest(self, segments: List[Segment]):
+        """Scrittura atomica del manifest (file temporaneo + rename)"""
+        path = self._path(MANIFEST)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'segments': [segment.to_dict() for segment in segments]}, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def add(self, segment: Segment):
+        segments = self.segments()
+        segments.append(segment)
+        self._save_manifest(segments)
+
+    def mark_deleted(self, segment: Segment):
+        segment.state = 'deleted'
+        self._save_manifest([segment if s.file == segment.file else s for s in self.segments()])
+
+    def remove(self, segment: Segment):
+        """Elimina un segmento scaduto (prima dal manifest, poi il file)"""
+        self._save_manifest([s for s in self.segments() if s.file != segment.file])
+        with self._lock:
+            self._cache.pop(segment.file, None)
+        try:
+            os.remove(self._path(segment.file))
+        except FileNotFoundError:
+            pass
+
+    def write_segment(self, rows: Iterator[dict]) -> Optional[Segment]:
+        """
+        Scrive le righe (in ordine crescente) in un nuovo segmento gzip e lo registra nel manifest
+        Restituisce None se non ci sono righe
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._path(f"segment-{os.getpid()}-{time.time_ns()}.tmp")
+        count, first, last = 0, None, None
+        keys = set()
+        with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=6) as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                first = first or row
+                last = row
+                count += 1
+                keys.update(_filter_keys(row['user_ip'], row['session_id']))
+        if count == 0:
+            os.remove(tmp)
+            return None
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        name = (f"conversations-{_key(first)[0]:%Y%m%dT%H%M%S}-{first['id']}-"
+                f"{_key(last)[0]:%Y%m%dT%H%M%S}-{last['id']}.jsonl.gz")
+        os.replace(tmp, self._path(name))
+        segment = Segment(name, count, [first['timestamp'], first['id']], [last['timestamp'], last['id']],
+                          keys=BloomFilter.build(keys).to_dict())
+        self.add(segment)
+        return segment
+
+    def read_segment(self, segment: Segment) -> List[dict]:
+        """Righe di un segmento in ordine crescente (i file non cambiano: cache LRU)"""
+        with self._lock:
+            rows = self._cache.get(segment.file)
+            if rows is not None:
+                self._cache.move_to_end(segment.file)
+                return rows
+        with gzip.open(self._path(segment.file), 'rt', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        with self._lock:
+            self.decompressed += 1
+            self._cache[segment.file] = rows
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        return rows
+
+    def _candidates(self, before=None, since=None, until=None,
+                    user_ip=None, session_id=None) -> List[Segment]:
+        """Segmenti che possono contenere righe prima di `before` con i filtri richiesti"""
+        segments = [s for s in self.segments()
+                    if (before is None or s.first < before) and
+                    (since is None or s.last[0] >= since) and
+                    (until is None or s.first[0] < until)]
+        matching = [s for s in segments if s.may_contain(user_ip, session_id)]
+        self.skipped += len(segments) - len(matching)
+        return sorted(matching, key=lambda s: s.last, reverse=True)
+
+    def read_page(self, limit: int, before=None, since=None, until=None,
+                  user_ip=None, session_id=None) -> List[dict]:
+        """
+        Fino a `limit` conversazioni archiviate, dalla più recente, strettamente prima di
+        `before` (posizione (timestamp, id) dell'ultima riga già restituita)
+        """
+        collected: List[dict] = []
+        for segment in self._candidates(before, since, until, user_ip, session_id):
+            # I segmenti sono ordinati per ultima posizione: se questo finisce prima della
+            # riga più vecchia già raccolta non può cambiare la pagina
+            if len(collected) >= limit and segment.last < _key(collected[-1]):
+                break
+            for row in reversed(self.read_segment(segment)):
+                if (before is None or _key(row) < before) and _matches(row, since, until, user_ip, session_id):
+                    collected.append(row)
+            collected.sort(key=_key, reverse=True)
+            del collected[limit:]
+        return collected
+
+    def iter_rows(self, since=None, until=None, user_ip=None, session_id=None) -> Iterator[dict]:
+        """Tutte le conversazioni archiviate filtrate, dalla più recente (per l'export NDJSON)"""
+        for segment in self._candidates(None, since, until, user_ip, session_id):
+            for row in reversed(self.read_segment(segment)):
+                if _matches(row, since, until, user_ip, session_id):
+                    yield row
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        size = 0
+        for segment in segments:
+            try:
+                size += os.path.getsize(self._path(segment.file))
+            except OSError:
+                pass
+        return {
+            'segments': len(segments),
+            'rows': sum(segment.rows for segment in segments),
+            'bytes': size,
+            'pending_delete': sum(1 for segment in segments if segment.state != 'deleted'),
+            'decompressed': self.decompressed,
+            'skipped_by_filter': self.skipped,
+        }
+
+
+class RetentionJob:
+    """
+    Sposta nell'archivio le conversazioni più vecchie di hot_days giorni
+
+    Args:
+        archive: ConversationArchive di destinazione
+        hot_days: giorni tenuti nel database (0 = job disattivato)
+        archive_days: giorni tenuti nell'archivio (0 = per sempre)
+        segment_rows: righe massime per file
+        chunk_rows: righe per SELECT e per DELETE (una transazione breve ciascuno)
+        pause: secondi di pausa tra due DELETE, per lasciare spazio alle richieste
+    """
+
+    def __init__(self, archive: ConversationArchive, hot_days: int = 90, archive_days: int = 0,
+                 segment_rows: int = 10000, chunk_rows: int = 500, pause: float = 0.05):
+        self.archive = archive
+        self.hot_days = hot_days
+        self.archive_days = archive_days
+        self.segment_rows = segment_rows
+        self.chunk_rows = chunk_rows
+        self.pause = pause
+        self._lock = threading.Lock()
+        # Metriche
+        self.runs = 0
+        self.moved = 0
+        self.last_run_s = 0.0
+        self.max_delete_ms = 0.0
+
+    def _select_chunk(self, conn, cutoff: datetime, after, limit: int) -> List[dict]:
+        """Righe più vecchie di cutoff dopo la posizione `after`, in ordine crescente (indice timestamp, id)"""
+        conditions, params = ["timestamp < %s"], [cutoff]
+        if after is not None:
+            conditions.append("(timestamp > %s OR (timestamp = %s AND id > %s))")
+            params += [after[0], after[0], after[1]]
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {HISTORY_COLUMNS} FROM conversations WHERE {' AND '.join(conditions)} "
+            f"ORDER BY timestamp, id LIMIT %s",
+            params + [limit]
+        )
+        rows = [_conversation_row(row) for row in cursor.fetchall()]
+        conn.rollback()  # chiude la transazione di sola lettura (il lock con nome resta)
+        return rows
+
+    def _rows_to_archive(self, conn, cutoff: datetime) -> Iterator[dict]:
+        after, count = None, 0
+        while count < self.segment_rows:
+            rows = self._select_chunk(conn, cutoff, after, min(self.chunk_rows, self.segment_rows - count))
+            if not rows:
+                return
+            yield from rows
+            count += len(rows)
+            after = _key(rows[-1])
+
+    def _delete_ids(self, conn, ids: List[int]):
+        """Cancella per chiave primaria, chunk_rows righe per transazione"""
+        for i in range(0, len(ids), self.chunk_rows):
+            chunk = ids[i:i + self.chunk_rows]
+            start = time.perf_counter()
+            with span('db_archive_delete'):
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"DELETE FROM conversations WHERE id IN ({', '.join(['%s'] * len(chunk))})", chunk
+                )
+                conn.commit()
+            self.max_delete_ms = max(self.max_delete_ms, (time.perf_counter() - start) * 1000)
+            if self.pause:
+                time.sleep(self.pause)
+
+    def _finish_segment(self, conn, segment: Segment):
+        ids = [row['id'] for row in self.archive.read_segment(segment)]
+        self._delete_ids(conn, ids)
+        self.archive.mark_deleted(segment)
+
+    def run_once(self, dry_run: bool = False) -> dict:
+        """Un giro completo: cancellazioni in sospeso, nuovi segmenti, segmenti scaduti"""
+        if self.hot_days <= 0:
+            return {'moved': 0, 'disabled': True}
+        # Una sola connessione per tutto il giro: quella che tiene il lock
+        with self._lock, pooled_connection() as conn:
+            if not self._get_named_lock(conn):
+                return {'moved': 0, 'skipped': True}
+            try:
+                return self._run_locked(conn, dry_run)
+            finally:
+                self._release_named_lock(conn)
+
+    def _run_locked(self, conn, dry_run: bool) -> dict:
+        start = time.perf_counter()
+        cutoff = datetime.now() - timedelta(days=self.hot_days)
+        moved, segments = 0, 0
+
+        # Segmenti scritti ma non ancora cancellati dal database (giro interrotto)
+        for segment in self.archive.segments():
+            if segment.state != 'deleted' and not dry_run:
+                print(f"Completo l'archiviazione di {segment.file}")
+                self._finish_segment(conn, segment)
+
+        if dry_run:
+            moved = sum(1 for _ in self._rows_to_archive(conn, cutoff))
+        else:
+            while True:
+                with span('archive_segment'):
+                    segment = self.archive.write_segment(self._rows_to_archive(conn, cutoff))
+                if segment is None:
+                    break
+                self._finish_segment(conn, segment)
+                moved += segment.rows
+                segments += 1
+                print(f"🗄️ Archiviate {segment.rows} conversazioni in {segment.file}")
+
+        expired = 0
+        if self.archive_days > 0 and not dry_run:
+            archive_cutoff = datetime.now() - timedelta(days=self.archive_days)
+            for segment in self.archive.segments():
+                if segment.last[0] < archive_cutoff:
+                    self.archive.remove(segment)
+                    expired += 1
+
+        self.runs += 1
+        self.moved += moved
+        self.last_run_s = time.perf_counter() - start
+        result = {'moved': moved, 'segments': segments, 'expired_segments': expired,
+                  'seconds': round(self.last_run_s, 2), 'dry_run': dry_run}
+        print(f"Archiviazione completata: {result}")
+        return result
+
+    @staticmethod
+    def _get_named_lock(conn) -> bool:
+        """
+        Lock MySQL GET_LOCK sulla connessione del giro
+
+        Se il lock non si può prendere o verificare il giro viene saltato: meglio
+        rimandare l'archiviazione che spostare le stesse righe da due processi
+        """
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (LOCK_NAME,))
+            acquired = cursor.fetchall()[0][0] == 1
+        except Exception as e:
+            print(f"⚠️ Lock di archiviazione non disponibile ({e}), salto il giro")
+            return False
+        if not acquired:
+            print("Archiviazione già in corso in un altro processo")
+        return acquired
+
+    @staticmethod
+    def _release_named_lock(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchall()
+        except Exception as e:
+            # Il lock MySQL si libera comunque quando la connessione viene chiusa
+            print(f"⚠️ Impossibile rilasciare il lock di archiviazione: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'runs': self.runs,
+            'moved': self.moved,
+            'last_run_s': round(self.last_run_s, 2),
+            'max_delete_ms': round(self.max_delete_ms, 2),
+            'hot_days': self.hot_days,
+        }
+
+
+conversation_archive = ConversationArchive(Config.ARCHIVE_DIR)
+retention_job = RetentionJob(
+    conversation_archive,
+    hot_days=Config.RETENTION_HOT_DAYS,
+    archive_days=Config.RETENTION_ARCHIVE_DAYS,
+    segment_rows=Config.ARCHIVE_SEGMENT_ROWS,
+    chunk_rows=Config.ARCHIVE_CHUNK_ROWS,
+    pause=Config.ARCHIVE_PAUSE
+)
+
+
+def get_history_page(limit=20, cursor=None, since=None, until=None, user_ip=None, session_id=None):
+    """
+    Come database.get_conversations_page(), ma quando il database non ha più righe
+    per i filtri la pagina continua nell'archivio (stesso cursore, stesso ordine)
+
+    Returns:
+        (lista di conversazioni, cursore della pagina successiva o None)
+    """
+    conversations, next_cursor = get_conversations_page(limit, cursor, since, until, user_ip, session_id)
+    if next_cursor is not None or not conversation_archive.segments():
+        return conversations, next_cursor
+
+    # Le righe archiviate sono tutte più vecchie di quelle nel database: si riparte dall'ultima restituita
+    since, until = _naive(since), _naive(until)
+    if conversations:
+        before = _key(conversations[-1])
+    else:
+        before = decode_cursor(cursor) if cursor else None
+    with span('archive_read'):
+        archived = conversation_archive.read_page(limit - len(conversations) + 1, before,
+                                                  since, until, user_ip, session_id)
+    conversations += archived
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        timestamp, conversation_id = _key(conversations[-1])
+        next_cursor = encode_cursor(timestamp, conversation_id)
+    return conversations, next_cursor
+
+
+def iter_history(since=None, until=None, user_ip=None, session_id=None) -> Iterator[dict]:
+    """Come database.iter_conversations(), seguito dalle conversazioni archiviate"""
+    yield from iter_conversations(since, until, user_ip, session_id)
+    yield from conversation_archive.iter_rows(_naive(since), _naive(until), user_ip, session_id)
+
+
+_retention_thread = None
+
+def start_retention_job(interval: int = Config.ARCHIVE_INTERVAL):
+    """
+    Avvia l'archiviazione in background: subito e poi ogni `interval` secondi
+    (con più worker gira in uno solo alla volta grazie al lock MySQL)
+    """
+    global _retention_thread
+    if _retention_thread is not None or retention_job.hot_days <= 0:
+        return
+
+    def retention_loop():
+        while True:
+            try:
+                retention_job.run_once()
+            except Exception as e:
+                print(f"Errore durante l'archiviazione delle conversazioni: {e}")
+            time.sleep(interval)
+
+    _retention_thread = threading.Thread(target=retention_loop, name="retention", daemon=True)
+    _retention_thread.start()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Archivia le conversazioni più vecchie di RETENTION_HOT_DAYS giorni")
+    parser.add_argument('--dry-run', action='store_true', help="conta le righe da archiviare senza spostarle")
+    args = parser.parse_args()
+    print(json.dumps(retention_job.run_once(dry_run=args.dry_run)))
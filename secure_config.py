@@ -4,55 +4,175 @@ Gestisce le credenziali in modo sicuro usando Google Cloud IAM
 """
 
 import os
-from google.cloud import secretmanager
-from google.auth import default
-from typing import Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from metrics import span
+
+# Segreti del database e relative variabili d'ambiente di fallback
+DATABASE_SECRETS = {
+    'db-host': 'DB_HOST',
+    'db-user': 'DB_USER',
+    'db-password': 'DB_PASSWORD',
+    'db-name': 'DB_NAME',
+}
 
 class SecureConfig:
     """
     Classe per gestire le configurazioni in modo sicuro
     Usa Google Cloud Secret Manager e autenticazione automatica
+    
+    I segreti vengono tenuti in cache in memoria per `cache_ttl` secondi;
+    i recuperi falliti vengono ricordati per `negative_ttl` secondi così da
+    non ripetere il timeout di Secret Manager a ogni richiesta.
     """
     
-    def __init__(self):
+    def __init__(self, client=None):
         self.project_id = os.environ.get('PROJECT_ID', 'tech-onboarding-470810')
         self.location = os.environ.get('LOCATION', 'europe-west1')
-        self._secrets_client = None
+        self.cache_ttl = int(os.environ.get('SECRET_CACHE_TTL', 3600))
+        self.negative_ttl = int(os.environ.get('SECRET_NEGATIVE_TTL', 60))
+        self.request_timeout = float(os.environ.get('SECRET_TIMEOUT', 5))
+        self._secrets_client = client  # Un client finto può essere passato per i test
+        self._injected_client = client is not None
+        self._client_failed = False
+        self._cache = {}  # secret_name -> (valore o None se fallito, scadenza)
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        self._refresh_thread = None
     
     def get_secret_client(self):
-        """Inizializza il client per Secret Manager"""
-        if not self._secrets_client:
-            try:
-                self._secrets_client = secretmanager.SecretManagerServiceClient()
-            except Exception as e:
-                print(f"Errore nell'inizializzazione Secret Manager: {e}")
-                print("Usando variabili d'ambiente come fallback...")
+        """
+        Inizializza il client per Secret Manager al primo uso
+        La libreria gRPC viene importata solo qui, così l'import del modulo resta veloce;
+        il lock evita che prefetch() crei un client per ogni thread
+        """
+        if self._secrets_client or self._client_failed:
+            return self._secrets_client
+        with self._client_lock:
+            if not self._secrets_client and not self._client_failed:
+                try:
+                    with span('secret_client_init'):
+                        from google.cloud import secretmanager
+                        self._secrets_client = secretmanager.SecretManagerServiceClient()
+                except Exception as e:
+                    # Non riproviamo a ogni richiesta: restiamo sulle variabili d'ambiente
+                    self._client_failed = True
+                    print(f"Errore nell'inizializzazione Secret Manager: {e}")
+                    print("Usando variabili d'ambiente come fallback...")
         return self._secrets_client
     
-    def get_secret(self, secret_name: str, fallback_env_var: str) -> str:
+    def reset_client(self):
         """
-        Recupera un segreto da Secret Manager o usa variabile d'ambiente come fallback
+        Scarta il client gRPC dopo un fork (Gunicorn): ogni worker ne crea uno suo
+        I valori già in cache restano validi
+        """
+        if not self._injected_client:
+            self._secrets_client = None
+            self._client_failed = False
+        self._refresh_thread = None
+    
+    def fetch_secret(self, secret_name: str) -> Optional[str]:
+        """
+        Legge un segreto direttamente da Secret Manager (senza cache)
         
-        Args:
-            secret_name: Nome del segreto in Secret Manager
-            fallback_env_var: Nome della variabile d'ambiente di fallback
-            
         Returns:
-            Valore del segreto o della variabile d'ambiente
+            Valore del segreto o None se non disponibile
         """
         try:
             client = self.get_secret_client()
             if client:
                 secret_path = f"projects/{self.project_id}/secrets/{secret_name}/versions/latest"
-                response = client.access_secret_version(request={"name": secret_path})
+                with span('secret_fetch'):
+                    response = client.access_secret_version(
+                        request={"name": secret_path}, timeout=self.request_timeout
+                    )
                 return response.payload.data.decode("UTF-8")
         except Exception as e:
             print(f"Errore nel recupero del segreto {secret_name}: {e}")
-            print(f"Usando variabile d'ambiente {fallback_env_var} come fallback...")
+        return None
+    
+    def _store(self, secret_name: str, value: Optional[str]):
+        ttl = self.cache_ttl if value is not None else self.negative_ttl
+        with self._lock:
+            previous = self._cache.get(secret_name)
+            if value is None and previous is not None and previous[0] is not None:
+                # Errore temporaneo: teniamo l'ultimo valore valido
+                value = previous[0]
+            self._cache[secret_name] = (value, time.monotonic() + ttl)
+    
+    def get_secret(self, secret_name: str, fallback_env_var: str) -> str:
+        """
+        Recupera un segreto da Secret Manager o usa variabile d'ambiente come fallback
+        
+        Args:
+            secret_name: Nome del segreto in Secret Manager
+            fallback_env_var: Nome della variabile d'ambiente di fallback
+            
+        Returns:
+            Valore del segreto o della variabile d'ambiente
+        """
+        with self._lock:
+            cached = self._cache.get(secret_name)
+        if cached is None or cached[1] <= time.monotonic():
+            self._store(secret_name, self.fetch_secret(secret_name))
+            with self._lock:
+                cached = self._cache[secret_name]
+        
+        value = cached[0]
+        if value is not None:
+            return value
         
         # Fallback alle variabili d'ambiente
         return os.environ.get(fallback_env_var, "")
     
+    def prefetch(self, secrets: Dict[str, str] = DATABASE_SECRETS):
+        """
+        Scarica in parallelo tutti i segreti indicati e li mette in cache
+        
+        Args:
+            secrets: dizionario nome segreto -> variabile d'ambiente di fallback
+        """
+        names = list(secrets)
+        if not names:
+            return
+        with ThreadPoolExecutor(max_workers=len(names) or 1) as executor:
+            values = list(executor.map(self.fetch_secret, names))
+        for name, value in zip(names, values):
+            self._store(name, value)
+        found = sum(1 for value in values if value is not None)
+        print(f"🔐 Segreti precaricati: {found}/{len(names)} da Secret Manager")
+    
+    def missing_secrets(self, secrets: Dict[str, str] = DATABASE_SECRETS) -> Dict[str, str]:
+        """Segreti non ancora in cache o scaduti (es. in un worker senza i valori del master)"""
+        now = time.monotonic()
+        with self._lock:
+            return {name: env for name, env in secrets.items()
+                    if name not in self._cache or self._cache[name][1] <= now}
+    
+    def start_background_refresh(self, secrets: Dict[str, str] = DATABASE_SECRETS):
+        """
+        Avvia un thread che aggiorna i segreti prima che scadano in cache
+        """
+        if self._refresh_thread is not None:
+            return
+        
+        def refresh_loop():
+            while True:
+                time.sleep(max(1, min(self.cache_ttl * 0.8, self.negative_ttl)))
+                now = time.monotonic()
+                with self._lock:
+                    expiring = [
+                        name for name in secrets
+                        if name not in self._cache or self._cache[name][1] - now < self.cache_ttl * 0.2
+                    ]
+                if expiring:
+                    self.prefetch({name: secrets[name] for name in expiring})
+        
+        self._refresh_thread = threading.Thread(target=refresh_loop, name="secret-refresh", daemon=True)
+        self._refresh_thread.start()
+    
     @property
     def db_host(self) -> str:
         """Host del database Cloud SQL"""
@@ -73,6 +193,15 @@ class SecureConfig:
         """Nome del database"""
         return self.get_secret("db-name", "DB_NAME")
     
+    def cache_stats(self) -> dict:
+        """Stato della cache dei segreti (senza i valori)"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {'found': value is not None, 'expires_in': round(expires - now, 1)}
+                for name, (value, expires) in self._cache.items()
+            }
+    
     def get_database_config(self) -> dict:
         """Restituisce la configurazione del database"""
         return {
@@ -90,6 +219,7 @@ class SecureConfig:
             True se l'autenticazione è valida, False altrimenti
         """
         try:
+            from google.auth import default
             # Prova a ottenere le credenziali di default
             credentials, project = default()
             print(f"✅ Autenticazione A2A verificata per progetto: {project}")
@@ -0,0 +1,231 @@
+"""
+Sessioni di conversazione: gli ultimi turni di ogni chat, da passare al modello
+
+- gli ultimi `window` turni restano testuali, quelli più vecchi vengono ridotti a una
+  riga ciascuno in un riassunto di lunghezza massima fissa: il prompt non cresce
+  con la lunghezza della conversazione
+- MemorySessionStore: in memoria nel processo, LRU limitato per numero di sessioni e byte
+- RedisSessionStore: condiviso tra worker e istanze (qualsiasi server compatibile Redis)
+"""
+
+import json
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import Config
+
+# ID generati da new_session_id(): accettiamo solo questo formato dal cookie
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def valid_session_id(session_id) -> bool:
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def session_secret() -> str:
+    """Chiave che firma il cookie di sessione: SESSION_SECRET, o una casuale per questo processo"""
+    if Config.SESSION_SECRET:
+        return Config.SESSION_SECRET
+    # Con preload_app la chiave è creata nel master e vale per tutti i worker, non per altre istanze
+    print("⚠️ SESSION_SECRET non impostato: chiave casuale, le sessioni non sopravvivono a un riavvio")
+    return secrets.token_hex(32)
+
+
+class SessionHistory(NamedTuple):
+    """Storia di una sessione: riassunto dei turni vecchi e ultimi turni (dal più vecchio)"""
+    summary: str = ""
+    turns: Tuple[Tuple[str, str], ...] = ()
+
+    def as_text(self) -> str:
+        """Testo della storia (per la chiave della cache delle risposte)"""
+        return self.summary + ''.join(f"\n{user}\n{assistant}" for user, assistant in self.turns)
+
+    def size(self) -> int:
+        return len(self.as_text().encode('utf-8'))
+
+
+def summarize_turn(user: str, assistant: str, max_chars: int = 160) -> str:
+    """Una riga per un turno uscito dalla finestra"""
+    def clip(text):
+        text = ' '.join(text.split())
+        return text if len(text) <= max_chars else text[:max_chars].rsplit(' ', 1)[0] + "…"
+    return f"- Utente: {clip(user)} → Assistente: {clip(assistant)}"
+
+
+def add_turn(history: SessionHistory, user: str, assistant: str,
+             window: int, summary_chars: int) -> SessionHistory:
+    """
+    Aggiunge un turno; i turni oltre la finestra passano nel riassunto,
+    che tiene solo le righe più recenti entro summary_chars caratteri
+    """
+    turns: List[Tuple[str, str]] = list(history.turns) + [(user, assistant)]
+    lines = history.summary.splitlines() if history.summary else []
+    while len(turns) > window:
+        lines.append(summarize_turn(*turns.pop(0)))
+    while lines and sum(len(line) + 1 for line in lines) > summary_chars:
+        lines.pop(0)
+    return SessionHistory('\n'.join(lines), tuple(turns))
+
+
+class MemorySessionStore:
+    """
+    Sessioni in memoria con eviction LRU
+
+    Args:
+        max_sessions: sessioni massime in memoria
+        max_bytes: memoria massima stimata per tutte le sessioni
+        window: turni tenuti testuali
+        summary_chars: lunghezza massima del riassunto dei turni vecchi
+        ttl: secondi di inattività dopo cui una sessione scade
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_bytes: int = 20 * 1024 * 1024,
+                 window: int = 6, summary_chars: int = 1200, ttl: int = 3600):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.window = window
+        self.summary_chars = summary_chars
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Tuple[SessionHistory, float, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, session_id: str) -> Optional[SessionHistory]:
+        """Storia della sessione, o None se sconosciuta o scaduta"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            history, last_seen, size = entry
+            if time.monotonic() - last_seen > self.ttl:
+                del self._sessions[session_id]
+                self._size -= size
+                return None
+            self._sessions.move_to_end(session_id)
+            return history
+
+    def put(self, session_id: str, history: SessionHistory):
+        with self._lock:
+            self._put(session_id, history)
+
+    def _put(self, session_id: str, history: SessionHistory):
+        size = history.size() + len(session_id)
+        old = self._sessions.pop(session_id, None)
+        if old is not None:
+            self._size -= old[2]
+        self._sessions[session_id] = (history, time.monotonic(), size)
+        self._size += size
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._size > self.max_bytes):
+            _, (_, _, evicted_size) = self._sessions.popitem(last=False)
+            self._size -= evicted_size
+            self.evicted += 1
+
+    def append(self, session_id: str, user: str, assistant: str) -> SessionHistory:
+        """Aggiunge un turno alla sessione (creandola se serve)"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            history = add_turn(entry[0] if entry else SessionHistory(), user, assistant,
+                               self.window, self.summary_chars)
+            self._put(session_id, history)
+        return history
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evicted': self.evicted,
+            }
+
+
+class RedisSessionStore:
+    """
+    Sessioni su Redis (JSON con scadenza), condivise da tutti i worker
+
+    Il limite di memoria e l'LRU sono quelli del server (maxmemory + allkeys-lru);
+    qui teniamo piccola ogni sessione con la stessa finestra e lo stesso riassunto.
+    append() legge e riscrive la sessione in una transazione WATCH/MULTI: due turni
+    concorrenti della stessa sessione (due tab, due worker) non si sovrascrivono.
+    """
+
+    def __init__(self, client, window: int = 6, summary_chars: int = 1200, ttl: int = 3600,
+                 prefix: str = "chatbot:session:"):
+        self.client = client
+        self.window = window
+        self.summary_chars = summary_chars
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = 0
+
+    @staticmethod
+    def _decode(raw) -> Optional[SessionHistory]:
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        return SessionHistory(data['summary'], tuple(tuple(turn) for turn in data['turns']))
+
+    @staticmethod
+    def _encode(history: SessionHistory) -> str:
+        return json.dumps({'summary': history.summary, 'turns': history.turns})
+
+    def get(self, session_id: str) -> Optional[SessionHistory]:
+        try:
+            raw = self.client.get(self.prefix + session_id)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Redis non disponibile per le sessioni: {e}")
+            return None
+        return self._decode(raw)
+
+    def put(self, session_id: str, history: SessionHistory):
+        try:
+            self.client.set(self.prefix + session_id, self._encode(history), ex=self.ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Impossibile salvare la sessione su Redis: {e}")
+
+    def append(self, session_id: str, user: str, assistant: str) -> SessionHistory:
+        key = self.prefix + session_id
+
+        def update(pipe):
+            # Eseguita di nuovo da transaction() se la chiave cambia tra WATCH ed EXEC
+            history = add_turn(self._decode(pipe.get(key)) or SessionHistory(), user, assistant,
+                               self.window, self.summary_chars)
+            pipe.multi()
+            pipe.set(key, self._encode(history), ex=self.ttl)
+            return history
+
+        try:
+            return self.client.transaction(update, key, value_from_callable=True)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Impossibile salvare la sessione su Redis: {e}")
+            return add_turn(SessionHistory(), user, assistant, self.window, self.summary_chars)
+
+    def stats(self) -> dict:
+        return {'backend': 'redis', 'errors': self.errors}
+
+
+def create_session_store():
+    """Store configurato con SESSION_BACKEND (memory o redis)"""
+    options = dict(window=Config.SESSION_WINDOW, summary_chars=Config.SESSION_SUMMARY_CHARS,
+                   ttl=Config.SESSION_TTL)
+    if Config.SESSION_BACKEND == 'redis':
+        try:
+            import redis
+            return RedisSessionStore(redis.Redis.from_url(Config.REDIS_URL), **options)
+        except ImportError:
+            print("⚠️ Pacchetto redis non installato, sessioni in memoria")
+    return MemorySessionStore(max_sessions=Config.SESSION_MAX_SESSIONS,
+                              max_bytes=Config.SESSION_MAX_BYTES, **options)
@@ -0,0 +1,182 @@
+"""
+Crawler del sito web per l'MCP scraper
+Segue i link dello stesso dominio fino a una profondità e un numero di pagine massimi,
+scaricando in parallelo con una sessione HTTP condivisa e rispettando robots.txt
+"""
+
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from urllib.robotparser import RobotFileParser
+
+from config import Config
+from html_extractor import CHUNK_SIZE, read_limited
+
+# Estensioni che non sono pagine HTML
+SKIPPED_EXTENSIONS = (
+    '.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.css', '.js',
+    '.zip', '.mp4', '.mp3', '.xml', '.json', '.woff', '.woff2',
+)
+
+def canonical_url(url: str) -> Optional[str]:
+    """
+    Forma canonica di un URL per la deduplicazione: senza frammento, host minuscolo,
+    senza porta di default, senza parametri utm_*, senza slash finale (tranne la root)
+    """
+    url, _ = urldefrag(url)
+    parts = urlparse(url)
+    if parts.scheme not in ('http', 'https'):
+        return None
+    host = (parts.hostname or '').lower()
+    if parts.port and not ((parts.scheme == 'http' and parts.port == 80) or
+                           (parts.scheme == 'https' and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path or '/'
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if not k.startswith('utm_')))
+    return urlunparse((parts.scheme, host, path, '', query, ''))
+
+
+class HostRateLimiter:
+    """Intervallo minimo tra due richieste allo stesso host"""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str, min_interval: float = 0.0):
+        interval = max(self.interval, min_interval)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, 0.0))
+            self._next[host] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CrawledPage:
+    """Una pagina scaricata dal crawler"""
+
+    def __init__(self, url: str, text: str, depth: int):
+        self.url = url
+        self.text = text
+        self.depth = depth
+
+
+class SiteCrawler:
+    """
+    Crawl limitato del sito a partire da start_url
+
+    Args:
+        start_url: pagina di partenza (anche un server locale per i test)
+        session: sessione requests condivisa (con pool di connessioni)
+        parse_page: funzione (html, base_url) -> (testo pulito, link assoluti)
+        max_pages: numero massimo di pagine scaricate
+        max_depth: profondità massima dei link seguiti (0 = solo start_url)
+        concurrency: download in parallelo
+        rate_per_host: richieste al secondo per host
+        max_bytes: byte letti al massimo per pagina (le pagine più grandi vengono troncate)
+    """
+
+    def __init__(self, start_url: str, session, parse_page: Callable[[bytes, str], Tuple[str, List[str]]],
+                 max_pages: int = 20, max_depth: int = 2, concurrency: int = 4,
+                 rate_per_host: float = 2.0, timeout: float = 10,
+                 max_bytes: int = Config.HTML_MAX_BYTES):
+        self.start_url = canonical_url(start_url)
+        self.session = session
+        self.parse_page = parse_page
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.rate_limiter = HostRateLimiter(rate_per_host)
+        self.host = urlparse(self.start_url).netloc
+        self.user_agent = session.headers.get('User-Agent', '*')
+        self._robots = None
+        self._crawl_delay = 0.0
+
+    def _load_robots(self):
+        """Scarica robots.txt; se manca o non è leggibile tutto è permesso"""
+        robots = RobotFileParser()
+        robots_url = urljoin(self.start_url, '/robots.txt')
+        try:
+            response = self.session.get(robots_url, timeout=self.timeout)
+            if response.status_code == 200:
+                robots.parse(response.text.splitlines())
+            else:
+                robots.parse([])
+        except Exception as e:
+            print(f"robots.txt non disponibile ({e}), procedo senza restrizioni")
+            robots.parse([])
+        self._robots = robots
+        self._crawl_delay = float(robots.crawl_delay(self.user_agent) or 0)
+
+    def allowed(self, url: str) -> bool:
+        parts = urlparse(url)
+        if parts.netloc != self.host:
+            return False
+        if parts.path.lower().endswith(SKIPPED_EXTENSIONS):
+            return False
+        return self._robots is None or self._robots.can_fetch(self.user_agent, url)
+
+    def _fetch(self, url: str) -> Optional[Tuple[str, List[str]]]:
+        self.rate_limiter.wait(self.host, self._crawl_delay)
+        try:
+            # In streaming: si scartano i file non HTML senza scaricarli e delle pagine
+            # enormi si leggono solo i primi max_bytes (+1 per sapere che sono troncate)
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                    return None
+                body, _ = read_limited(response.iter_content(CHUNK_SIZE), self.max_bytes + 1)
+                return self.parse_page(body, response.url)
+        except Exception as e:
+            print(f"Errore nel crawl di {url}: {e}")
+            return None
+
+    def crawl(self) -> List[CrawledPage]:
+        """
+        Visita il sito in ampiezza, un livello di profondità alla volta
+
+        Returns:
+            Le pagine scaricate, senza URL né contenuti duplicati
+        """
+        self._load_robots()
+        seen_urls = {self.start_url}
+        seen_content = set()
+        pages = []
+        frontier = [self.start_url] if self.allowed(self.start_url) else []
+        fetched = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for depth in range(self.max_depth + 1):
+                frontier = frontier[:self.max_pages - fetched]
+                if not frontier:
+                    break
+                results = list(executor.map(self._fetch, frontier))
+                fetched += len(frontier)
+
+                next_frontier = []
+                for url, result in zip(frontier, results):
+                    if result is None:
+                        continue
+                    text, links = result
+                    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                    if text and digest not in seen_content:
+                        seen_content.add(digest)
+                        pages.append(CrawledPage(url, text, depth))
+                    for link in links:
+                        link = canonical_url(link)
+                        if link and link not in seen_urls and self.allowed(link):
+                            seen_urls.add(link)
+                            next_frontier.append(link)
+                frontier = next_frontier
+
+        print(f"Crawl completato: {len(pages)} pagine da {self.start_url} ({fetched} scaricate)")
+        return pages
@@ -0,0 +1,113 @@
+"""
+Indice di ricerca sul contenuto del sito web
+Costruito una volta per versione del contenuto: frasi, indice invertito e punteggio BM25
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from faq import normalize_message
+
+# Parole troppo comuni per essere utili nella ricerca (italiano e inglese)
+STOPWORDS = {
+    'il', 'lo', 'la', 'i', 'gli', 'le', 'un', 'uno', 'una', 'di', 'da', 'in', 'con', 'su', 'per',
+    'tra', 'fra', 'del', 'della', 'dei', 'delle', 'al', 'alla', 'ai', 'nel', 'nella', 'sul', 'e',
+    'ed', 'o', 'che', 'chi', 'cosa', 'come', 'dove', 'quando', 'non', 'si', 'mi', 'ti', 'ci', 'vi',
+    'voi', 'noi', 'vostro', 'vostra', 'nostro', 'nostra', 'sono', 'siete', 'avete', 'ha', 'hanno',
+    'the', 'a', 'an', 'of', 'to', 'and', 'or', 'is', 'are', 'for', 'on', 'with', 'by', 'at', 'we',
+    'you', 'our', 'your', 'it', 'this', 'that', 'what', 'how', 'who', 'where', 'do', 'does',
+}
+
+# Fine frase o fine blocco (html_extractor mette un titolo, una voce di elenco o un paragrafo per riga)
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\s*\n\s*')
+
+def tokenize(text: str) -> List[str]:
+    """Parole normalizzate (minuscolo, senza accenti) esclusa la punteggiatura e le stopword"""
+    return [token for token in normalize_message(text).split() if token not in STOPWORDS]
+
+def split_passages(text: str, min_length: int = 20, max_length: int = 500) -> List[str]:
+    """
+    Divide il testo in frasi e blocchi; le frasi troppo corte vengono scartate,
+    quelle troppo lunghe spezzate a max_length caratteri
+    """
+    passages = []
+    for sentence in SENTENCE_SPLIT.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > max_length:
+            cut = sentence.rfind(' ', 0, max_length)
+            cut = cut if cut > 0 else max_length
+            passages.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if len(sentence) >= min_length:
+            passages.append(sentence)
+    return passages
+
+
+class SiteIndex:
+    """
+    Indice invertito con punteggio BM25
+
+    La ricerca visita solo le liste dei termini della query, quindi il costo
+    dipende dai documenti che contengono quei termini e non dalla lunghezza della pagina.
+    """
+
+    def __init__(self, passages: List[str], k1: float = 1.5, b: float = 0.75):
+        self.passages = []
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+
+        seen = set()
+        for passage in passages:
+            if passage in seen:
+                continue  # Frasi ripetute (menu, footer) indicizzate una sola volta
+            seen.add(passage)
+            doc_id = len(self.passages)
+            self.passages.append(passage)
+            counts = Counter(tokenize(passage))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((doc_id, tf))
+
+        self._postings = dict(self._postings)
+        total = len(self.passages)
+        self._avg_length = (sum(self._lengths) / total) if total else 0.0
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    @classmethod
+    def from_text(cls, text: str) -> "SiteIndex":
+        return cls(split_passages(text))
+
+    def __len__(self):
+        return len(self.passages)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, str]]:
+        """
+        Restituisce fino a top_k frasi più rilevanti per la query
+
+        Returns:
+            Lista di (punteggio, frase) in ordine di rilevanza
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.passages[doc_id]) for doc_id, score in best]
+
+    def size_estimate(self) -> int:
+        """Stima in byte della memoria occupata (frasi + liste dell'indice)"""
+        postings = sum(len(p) for p in self._postings.values())
+        return sum(len(p.encode('utf-8')) for p in self.passages) + 16 * postings + 64 * len(self._postings)
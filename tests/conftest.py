@@ -0,0 +1,66 @@
+"""
+Configurazione comune dei test: tutto gira offline con i sostituti di
+benchmarks/offline_stubs.py (modello finto, Secret Manager in memoria, SQLite al posto
+di MySQL, sito HTML locale), come i benchmark
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import warnings
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Config legge l'ambiente all'import: file locali dei test fuori dalla cartella del progetto
+_TMP = tempfile.mkdtemp(prefix='chatbot-tests-')
+os.environ.setdefault('WRITER_SPILL_PATH', os.path.join(_TMP, 'conversations_spill.jsonl'))
+os.environ.setdefault('ARCHIVE_DIR', os.path.join(_TMP, 'archive'))
+
+import offline_stubs  # noqa: E402
+
+offline_stubs.install()
+warnings.simplefilter('ignore', DeprecationWarning)  # adattatori datetime di sqlite3
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """Pool di database.py su un file SQLite nuovo per ogni test"""
+    pool = offline_stubs.use_sqlite(str(tmp_path / 'chatbot.db'))
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def chat_app(sqlite_db):
+    """app.py con il modello finto, cache vuote e senza rate limit verso il modello"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+    from mcp_web_scraper import page_cache
+
+    app.model = offline_stubs.StubGenerativeModel(system_instruction=app.SYSTEM_PROMPT)
+    app.model_upstream.bucket.rate = 0
+    app.response_cache.clear()
+    page_cache.clear()
+    yield app
+    app.conversation_writer.shutdown()
+    app.response_cache.clear()
+    page_cache.clear()
+
+
+@pytest.fixture
+def site():
+    """Sito locale con titoli, elenchi e paragrafi; lo scraper condiviso punta qui"""
+    import mcp_web_scraper
+
+    pages = {'/': offline_stubs.make_html(30, seed=3)}
+    with offline_stubs.FixtureSite(pages) as fixture:
+        previous = mcp_web_scraper._scraper
+        mcp_web_scraper._scraper = mcp_web_scraper.MCPWebScraper(fixture.url)
+        yield fixture
+        mcp_web_scraper._scraper = previous
@@ -0,0 +1,98 @@
+"""
+La versione asincrona (async_app.py) deve dare le stesse risposte di app.py
+e non fare mai download sincroni nell'event loop
+"""
+
+import asyncio
+import contextlib
+import io
+import threading
+
+import pytest
+
+QUESTIONS = [
+    "Quanto costa?",                          # FAQ esatta
+    "Cos'è il venture capital?",              # solo modello
+    "Quali servizi offrite alle aziende?",    # sito + modello
+    "Come gestite la sicurezza dei documenti?",
+]
+
+
+@pytest.fixture
+def async_app(chat_app):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import async_app
+    return async_app
+
+
+def ask_sync(chat_app, message):
+    response = chat_app.app.test_client().post('/chat', json={'message': message})
+    assert response.status_code == 200
+    return response.get_json()['response']
+
+
+async def ask_async(async_app, message):
+    response = await async_app.app.test_client().post('/chat', json={'message': message})
+    assert response.status_code == 200
+    return (await response.get_json())['response']
+
+
+def test_same_answers_as_sync_app(chat_app, async_app, site):
+    from mcp_web_scraper import page_cache
+
+    expected = [ask_sync(chat_app, message) for message in QUESTIONS]
+
+    # Cache vuote: la versione asincrona rifà routing, download del sito, prompt e chiamata al modello
+    chat_app.response_cache.clear()
+    page_cache.clear()
+    calls = chat_app.model.calls
+
+    async def run():
+        try:
+            return [await ask_async(async_app, message) for message in QUESTIONS]
+        finally:
+            await async_app.close_async_session()
+
+    assert asyncio.run(run()) == expected
+    assert chat_app.model.calls > calls
+    assert expected[0] == "Offriamo piani personalizzati in base al numero delle richieste/volume dell'azienda"
+
+
+def test_site_down_uses_fallback_without_sync_download(chat_app, async_app, monkeypatch):
+    import mcp_web_scraper
+
+    scraper = mcp_web_scraper.MCPWebScraper("http://127.0.0.1:9/")  # porta chiusa
+    monkeypatch.setattr(mcp_web_scraper, '_scraper', scraper)
+    monkeypatch.setattr(mcp_web_scraper, 'scraper_upstream',
+                        mcp_web_scraper.Upstream('scraper', max_retries=0))
+
+    def sync_download(*args, **kwargs):
+        raise AssertionError("download sincrono nell'event loop")
+
+    monkeypatch.setattr(scraper, 'get_page', sync_download)
+    monkeypatch.setattr(scraper, 'fetch_page', sync_download)
+
+    async def run():
+        try:
+            return await ask_async(async_app, "Quali servizi offrite alle aziende?")
+        finally:
+            await async_app.close_async_session()
+
+    # Il modello finto ripete la fine del prompt: contiene il contesto di fallback
+    answer = asyncio.run(run())
+    assert answer.startswith("Risposta di prova")
+
+
+def test_session_updates_run_off_the_event_loop(async_app, monkeypatch):
+    threads = []
+    monkeypatch.setattr(async_app, 'remember_turn', lambda *args: threads.append(threading.current_thread()))
+
+    async def run():
+        client = async_app.app.test_client()
+        await client.post('/chat', json={'message': "Quanto costa?"})
+        response = await client.post('/chat/stream', json={'message': "Quanto costa?"})
+        await response.get_data()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2 and loop_thread not in threads  # Redis (WATCH/MULTI) non blocca il loop
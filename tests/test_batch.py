@@ -0,0 +1,136 @@
+"""
+Domande in blocco (batch.py, /chat/batch, batch_runner.py): righe non valide e limiti,
+un errore non ferma le altre domande, ogni risultato porta l'indice della sua riga
+"""
+
+import json
+import sys
+import time
+
+import pytest
+
+import batch_runner
+from batch import BatchRun, parse_jsonl
+from offline_stubs import StubGenerativeModel
+from resilience import UpstreamBusy
+
+
+@pytest.fixture(autouse=True)
+def fast_model(monkeypatch):
+    # batch_runner --model-latency cambia la latenza del modello finto: la ripristiniamo dopo ogni test
+    monkeypatch.setattr(StubGenerativeModel, 'latency', 0.001)
+
+
+def run(batch, lines):
+    return list(batch.run(parse_jsonl(lines)))
+
+
+def test_parse_jsonl_validates_each_line():
+    lines = [
+        '{"id": 1, "message": "Quanto costa?"}',
+        '',
+        '{"question": "Dove siete?"}',
+        '"Che prodotto sviluppate?"',
+        '{"id": "x", "message": "  "}',
+        'non è json',
+        '[1, 2]',
+    ]
+
+    items = list(parse_jsonl(lines))
+
+    assert [item.index for item in items] == [0, 1, 2, 3, 4, 5]  # le righe vuote non contano
+    assert items[0].id == "1" and items[0].message == "Quanto costa?"
+    assert items[1].message == "Dove siete?" and items[2].message == "Che prodotto sviluppate?"
+    assert all(item.error and item.message is None for item in items[3:])
+
+
+def test_errors_are_isolated_per_item():
+    def answer(message):
+        if message == "rompi":
+            raise RuntimeError("modello non disponibile")
+        if message == "satura":
+            raise UpstreamBusy('model', retry_after=0.01)
+        return f"risposta a {message}"
+
+    batch = BatchRun(answer, workers=2, busy_retries=1)
+    results = run(batch, ['"uno"', '"rompi"', '"due"', 'rotta', '"satura"', '"tre"'])
+
+    by_index = {result['index']: result for result in results}
+    assert [by_index[i].get('response') for i in (0, 2, 5)] == ["risposta a uno", "risposta a due", "risposta a tre"]
+    assert "modello non disponibile" in by_index[1]['error']
+    assert "riga non valida" in by_index[3]['error']
+    assert "sovraccarico" in by_index[4]['error']
+    assert batch.stats()['ok'] == 3 and batch.stats()['errors'] == 3
+
+
+def test_busy_items_are_retried():
+    calls = []
+
+    def answer(message):
+        calls.append(message)
+        if len(calls) == 1:
+            raise UpstreamBusy('model', retry_after=0.01)
+        return "ok"
+
+    results = run(BatchRun(answer, workers=1, busy_retries=2), ['"Quanto costa?"'])
+
+    assert results[0]['response'] == "ok" and len(calls) == 2
+
+
+def test_results_carry_the_input_position():
+    # Le prime domande sono le più lente: escono per ultime, ma l'indice resta quello della riga
+    def answer(message):
+        time.sleep(0.05 - int(message) * 0.005)
+        return message
+
+    lines = [json.dumps({'id': f"q{i}", 'message': str(i)}) for i in range(10)]
+    results = run(BatchRun(answer, workers=4), lines)
+
+    assert [result['index'] for result in results] != list(range(10))
+    ordered = sorted(results, key=lambda result: result['index'])
+    assert [result['id'] for result in ordered] == [f"q{i}" for i in range(10)]
+    assert all(result['response'] == str(result['index']) for result in ordered)
+
+
+def post_batch(chat_app, lines, query=''):
+    return chat_app.app.test_client().post('/chat/batch' + query, data='\n'.join(lines))
+
+
+def test_endpoint_validates_parameters_and_size(chat_app, site, monkeypatch):
+    assert post_batch(chat_app, ['"Quanto costa?"'], '?workers=0').status_code == 400
+    assert post_batch(chat_app, ['"Quanto costa?"'], '?persist=forse').status_code == 400
+
+    monkeypatch.setattr(chat_app.Config, 'BATCH_MAX_QUESTIONS', 3)
+    response = post_batch(chat_app, ['"Quanto costa?"'] * 4)
+    assert response.status_code == 413
+    assert "Massimo 3" in response.get_json()['error']
+
+
+def test_endpoint_streams_one_line_per_question_then_summary(chat_app, site):
+    lines = ['{"id": "a", "message": "Quanto costa?"}', 'rotta', '{"id": "c", "message": "Cos\'è una startup?"}']
+
+    response = post_batch(chat_app, lines, '?workers=2&persist=false')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+    assert rows[-1]['summary']['done'] == 3 and rows[-1]['summary']['errors'] == 1
+    by_index = {row['index']: row for row in rows[:-1]}
+    assert by_index[0]['id'] == "a" and by_index[0]['response'].startswith("Offriamo piani")
+    assert 'error' in by_index[1]
+    assert by_index[2]['id'] == "c" and by_index[2]['response'].startswith("Risposta di prova")
+
+
+def test_batch_runner_writes_one_line_per_question(chat_app, site, tmp_path, monkeypatch):
+    questions = tmp_path / 'domande.jsonl'
+    questions.write_text('{"id": "a", "message": "Quanto costa?"}\nrotta\n"Dove siete?"\n', encoding='utf-8')
+    output = tmp_path / 'risposte.jsonl'
+    monkeypatch.setattr(sys, 'argv', ['batch_runner.py', str(questions), '-o', str(output),
+                                      '--stub-model', '--workers', '2', '--model-latency', '0'])
+
+    batch_runner.main()
+
+    rows = sorted((json.loads(line) for line in output.read_text(encoding='utf-8').splitlines()),
+                  key=lambda row: row['index'])
+    assert [row['index'] for row in rows] == [0, 1, 2]
+    assert rows[0]['id'] == "a" and 'response' in rows[0]
+    assert 'error' in rows[1] and 'response' in rows[2]
@@ -0,0 +1,182 @@
+"""
+/chat/stream (Flask e Quart): formato dei frame SSE, ordine degli eventi (token, poi un
+solo done), salvataggio solo a risposta completa, evento error a metà stream
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import re
+
+import pytest
+
+from offline_stubs import StubGenerativeModel, _StubResponse
+
+
+# Righe ammesse in un frame: il nome dell'evento e i dati JSON (come li legge la pagina)
+FRAME_LINE = re.compile(r'^(event: (done|error)|data: \{.*\})$')
+
+
+def parse_frame(raw):
+    """(evento, dati) di un frame SSE, verificandone il formato"""
+    name, payload = 'message', ''
+    for line in raw.split('\n'):
+        assert FRAME_LINE.match(line), f"riga SSE non valida: {line!r}"
+        if line.startswith('event: '):
+            name = line[7:]
+        if line.startswith('data: '):
+            payload += line[6:]
+    return name, json.loads(payload)
+
+
+def read_events(response):
+    """(evento, dati) man mano che arrivano dallo stream"""
+    buffer = ''
+    for chunk in response.response:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        *events, buffer = buffer.split('\n\n')
+        for raw in events:
+            yield parse_frame(raw)
+    assert buffer == ''  # ogni frame termina con una riga vuota
+
+
+def parse_events(body):
+    """Eventi di uno stream già letto per intero"""
+    *events, rest = body.split('\n\n')
+    assert rest == ''
+    return [parse_frame(raw) for raw in events]
+
+
+def assert_tokens_then_done(events):
+    """Almeno un token, poi un solo done alla fine con il testo completo"""
+    names = [name for name, _ in events]
+    assert names.count('done') == 1 and names[-1] == 'done'
+    assert len(names) >= 2 and set(names[:-1]) == {'message'}
+    done = events[-1][1]
+    assert done['response'] == ''.join(data['token'] for _, data in events[:-1])
+    return done
+
+
+@pytest.fixture
+def saved(chat_app, monkeypatch):
+    """Turni passati a remember_turn (sessione + database)"""
+    turns = []
+    monkeypatch.setattr(chat_app, 'remember_turn', lambda *args: turns.append(args))
+    return turns
+
+
+def stream(chat_app, message):
+    return chat_app.app.test_client().post('/chat/stream', json={'message': message}, buffered=False)
+
+
+def test_tokens_then_done_and_saved_once(chat_app, saved):
+    events = []
+    for name, data in read_events(stream(chat_app, "Cos'è il venture capital?")):
+        if name != 'done':
+            assert saved == []  # niente salvataggio finché la risposta non è completa
+        events.append((name, data))
+
+    done = assert_tokens_then_done(events)
+    assert len(events) > 2  # il modello finto risponde in più chunk
+    assert done['response'].startswith("Risposta di prova")
+    assert [turn[1:3] for turn in saved] == [("Cos'è il venture capital?", done['response'])]
+    assert 'session_id' not in done  # la sessione viaggia solo nel cookie
+
+
+def test_cached_answer_is_one_token_then_done(chat_app, saved):
+    events = list(read_events(stream(chat_app, "Quanto costa?")))  # FAQ
+
+    assert [name for name, _ in events] == ['message', 'done']
+    assert_tokens_then_done(events)
+    assert len(saved) == 1
+
+
+class FailingModel(StubGenerativeModel):
+    """Due chunk, poi la connessione con Vertex si interrompe"""
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        def chunks():
+            yield _StubResponse("Prima parte ")
+            yield _StubResponse("della risposta")
+            raise ConnectionError("stream interrotto")
+        return chunks()
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        async def chunks():
+            for chunk in self.generate_content(prompt, stream=True):
+                yield chunk
+        return chunks()
+
+
+def test_error_event_when_model_fails_mid_stream(chat_app, saved):
+    chat_app.model = FailingModel()
+
+    events = list(read_events(stream(chat_app, "Cos'è il venture capital?")))
+
+    assert [name for name, _ in events] == ['message', 'message', 'error']
+    assert "stream interrotto" in events[-1][1]['error']
+    assert saved == []
+    assert chat_app.response_cache.stats()['entries'] == 0  # risposta parziale mai in cache
+
+
+def test_home_page_never_injects_html(chat_app):
+    page = chat_app.app.test_client().get('/').get_data(as_text=True)
+
+    assert 'innerHTML' not in page
+    assert 'textContent = text' in page
+    assert 'sendButton.disabled = true' in page
+
+
+def test_busy_model_sends_error_event_with_retry_after(chat_app, saved, monkeypatch):
+    upstream = chat_app.model_upstream
+    monkeypatch.setattr(upstream, 'queue_timeout', 0.01)
+    with contextlib.ExitStack() as slots:
+        for _ in range(upstream.max_concurrency):
+            slots.enter_context(upstream.slot())  # Gemini saturo da altre richieste
+        events = list(read_events(stream(chat_app, "Cos'è il venture capital?")))
+
+    assert [name for name, _ in events] == ['error']
+    assert events[0][1]['retry_after'] >= 1
+    assert saved == []
+
+
+@pytest.fixture
+def async_app(chat_app):
+    with contextlib.redirect_stdout(io.StringIO()):
+        import async_app
+    return async_app
+
+
+@pytest.fixture
+def async_saved(async_app, monkeypatch):
+    """Turni passati a remember_turn dalla versione asincrona"""
+    turns = []
+    monkeypatch.setattr(async_app, 'remember_turn', lambda *args: turns.append(args))
+    return turns
+
+
+def stream_async(async_app, message):
+    async def run():
+        response = await async_app.app.test_client().post('/chat/stream', json={'message': message})
+        assert response.mimetype == 'text/event-stream'
+        return await response.get_data(as_text=True)
+    return parse_events(asyncio.run(run()))
+
+
+def test_async_stream_tokens_then_done(async_app, async_saved):
+    events = stream_async(async_app, "Cos'è il venture capital?")
+
+    done = assert_tokens_then_done(events)
+    assert done['response'].startswith("Risposta di prova")
+    assert [turn[1:3] for turn in async_saved] == [("Cos'è il venture capital?", done['response'])]
+
+
+def test_async_stream_error_event_mid_stream(chat_app, async_app, async_saved):
+    chat_app.model = FailingModel()
+
+    events = stream_async(async_app, "Cos'è il venture capital?")
+
+    assert [name for name, _ in events] == ['message', 'message', 'error']
+    assert "stream interrotto" in events[-1][1]['error']
+    assert async_saved == []
@@ -0,0 +1,100 @@
+"""
+File di spill del ConversationWriter: reinserimento, righe non valide, errori non temporanei
+"""
+
+import json
+import os
+
+import pymysql
+
+from conversation_writer import ConversationWriter
+
+
+class FakeDatabase:
+    def __init__(self, fail=None):
+        self.rows = []
+        self.fail = fail
+
+    def write_batch(self, batch):
+        for record in batch:
+            if self.fail and self.fail(record):
+                raise pymysql.err.DataError(1406, "Data too long")
+        self.rows.extend(batch)
+
+
+def record(n):
+    return {'user_message': f"domanda {n}", 'ai_response': f"risposta {n}",
+            'user_ip': '127.0.0.1', 'session_id': 's', 'timestamp': '2026-01-01 10:00:00'}
+
+
+def make_writer(tmp_path, db, **kwargs):
+    return ConversationWriter(write_batch=db.write_batch, batch_size=2, max_retries=0,
+                              spill_path=str(tmp_path / 'spill.jsonl'), **kwargs)
+
+
+def test_replay_quarantines_bad_lines(tmp_path):
+    db = FakeDatabase()
+    writer = make_writer(tmp_path, db)
+    with open(writer.spill_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(record(1)) + '\n')
+        f.write('{"user_message": "tronca\n')
+        f.write(json.dumps(record(2)) + '\n')
+
+    writer.replay_spill()
+
+    assert [row['user_message'] for row in db.rows] == ["domanda 1", "domanda 2"]
+    assert sorted(os.listdir(tmp_path)) == ['spill.jsonl.bad', 'spill.jsonl.lock']
+    with open(writer.bad_path, encoding='utf-8') as f:
+        assert f.read() == '{"user_message": "tronca\n'
+
+
+def test_replay_finishes_leftover_replay_file(tmp_path):
+    db = FakeDatabase()
+    writer = make_writer(tmp_path, db)
+    # Reinserimento interrotto da un processo precedente, poi un nuovo spill
+    with open(writer.spill_path + '.replay.123.1', 'w', encoding='utf-8') as f:
+        f.write(json.dumps(record(1)) + '\n')
+    with open(writer.spill_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(record(2)) + '\n')
+
+    writer.replay_spill()
+
+    assert sorted(row['user_message'] for row in db.rows) == ["domanda 1", "domanda 2"]
+    assert sorted(os.listdir(tmp_path)) == ['spill.jsonl.lock']
+
+
+def test_rejected_records_are_not_spilled(tmp_path):
+    db = FakeDatabase(fail=lambda r: r['user_message'] == "domanda 2")
+    writer = make_writer(tmp_path, db)
+
+    writer._flush([record(1), record(2), record(3)])
+
+    assert [row['user_message'] for row in db.rows] == ["domanda 1", "domanda 3"]
+    assert not os.path.exists(writer.spill_path)
+    assert writer.rejected == 1
+    with open(writer.bad_path, encoding='utf-8') as f:
+        assert json.loads(f.read())['user_message'] == "domanda 2"
+
+
+def test_transient_errors_are_spilled(tmp_path):
+    def down(batch):
+        raise pymysql.err.OperationalError(2003, "Can't connect")
+
+    writer = ConversationWriter(write_batch=down, max_retries=0, spill_path=str(tmp_path / 'spill.jsonl'))
+    writer._flush([record(1)])
+
+    assert writer.spilled == 1
+    with open(writer.spill_path, encoding='utf-8') as f:
+        assert json.loads(f.read())['user_message'] == "domanda 1"
+
+
+def test_atexit_registered_once(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr('conversation_writer.atexit.register', registered.append)
+    writer = make_writer(tmp_path, FakeDatabase(), flush_interval=0.01)
+
+    for _ in range(3):
+        writer.start()
+        writer.shutdown()
+
+    assert registered == [writer.shutdown]
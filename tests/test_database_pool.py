@@ -0,0 +1,156 @@
+"""
+ConnectionPool su SQLite (offline_stubs): checkout e rilascio, timeout a pool esaurito,
+chiusura delle connessioni inattive, scadute o morte, rollback al rilascio
+"""
+
+import threading
+import time
+
+import pytest
+
+from database import ConnectionPool, PoolExhaustedError
+from offline_stubs import SQLiteConnection
+
+
+@pytest.fixture
+def make_pool(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    setup = SQLiteConnection(path)
+    setup.cursor().execute("CREATE TABLE items (name TEXT)")
+    setup.commit()
+    setup.close()
+    pools = []
+
+    def make(**options):
+        pool = ConnectionPool(lambda: SQLiteConnection(path), **options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def count_items(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM items")
+    return cursor.fetchall()[0][0]
+
+
+def test_checkout_and_release_reuse_the_connection(make_pool):
+    pool = make_pool(min_size=1, max_size=3)
+
+    first = pool.acquire()
+    assert pool.stats()['in_use'] == 1
+    pool.release(first)
+    second = pool.acquire()
+    pool.release(second)
+
+    assert second is first
+    stats = pool.stats()
+    assert stats['created'] == 1 and stats['checkouts'] == 2
+    assert stats['in_use'] == 0 and stats['idle'] == 1
+
+
+def test_timeout_when_exhausted(make_pool):
+    pool = make_pool(max_size=2, timeout=0.1)
+    held = [pool.acquire(), pool.acquire()]
+
+    start = time.monotonic()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+
+    assert 0.1 <= time.monotonic() - start < 1
+    assert pool.stats()['exhausted'] == 1 and pool.stats()['size'] == 2
+    for conn in held:
+        pool.release(conn)
+
+
+def test_waiter_gets_released_connection(make_pool):
+    pool = make_pool(max_size=1, timeout=2)
+    held = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(held,)).start()
+
+    conn = pool.acquire()
+
+    assert conn is held
+    assert pool.stats()['waits'] == 1 and pool.stats()['created'] == 1
+    pool.release(conn)
+
+
+def test_reap_closes_idle_connections_down_to_min_size(make_pool):
+    pool = make_pool(min_size=1, max_size=3, idle_timeout=0.05)
+    held = [pool.acquire() for _ in range(3)]
+    for conn in held:
+        pool.release(conn)
+
+    pool.reap()
+    assert pool.stats()['size'] == 3  # ancora recenti
+
+    time.sleep(0.1)
+    pool.reap()
+    assert pool.stats()['size'] == 1 and pool.stats()['discarded'] == 2
+
+
+def test_reap_closes_expired_connections(make_pool):
+    pool = make_pool(min_size=1, max_size=2, max_lifetime=0.05)
+    pool.release(pool.acquire())
+
+    time.sleep(0.1)
+    pool.reap()
+
+    assert pool.stats()['size'] == 0 and pool.stats()['discarded'] == 1
+
+
+def test_dead_connection_is_replaced_at_checkout(make_pool):
+    pool = make_pool(max_size=2, health_check_interval=0)
+    dead = pool.acquire()
+    pool.release(dead)
+    dead._conn.close()  # il server ha chiuso la connessione mentre era inattiva
+
+    conn = pool.acquire()
+
+    assert conn is not dead
+    assert count_items(conn) == 0
+    assert pool.stats()['discarded'] == 1 and pool.stats()['size'] == 1
+    pool.release(conn)
+
+
+def test_broken_connection_is_not_reused(make_pool):
+    pool = make_pool(max_size=2)
+    broken = pool.acquire()
+    pool.release(broken, broken=True)
+
+    conn = pool.acquire()
+
+    assert conn is not broken
+    assert pool.stats()['discarded'] == 1
+    pool.release(conn)
+
+
+def test_release_rolls_back_open_transaction(make_pool):
+    pool = make_pool(max_size=1)
+    conn = pool.acquire()
+    conn.cursor().execute("INSERT INTO items (name) VALUES (%s)", ("mai confermato",))
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert count_items(conn) == 0
+    pool.release(conn)
+
+
+def test_connection_context_rolls_back_on_error(make_pool):
+    pool = make_pool(max_size=1)
+
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.cursor().execute("INSERT INTO items (name) VALUES (%s)", ("a metà",))
+            raise RuntimeError("errore durante la transazione")
+
+    with pool.connection() as conn:
+        assert count_items(conn) == 0
+        conn.cursor().execute("INSERT INTO items (name) VALUES (%s)", ("confermato",))
+        conn.commit()
+    with pool.connection() as conn:
+        assert count_items(conn) == 1
+    assert pool.stats()['in_use'] == 0
@@ -0,0 +1,167 @@
+"""
+Cronologia: paginazione a cursore senza righe ripetute o saltate anche con timestamp
+uguali, migrazioni dello schema idempotenti
+"""
+
+import contextlib
+import io
+import sqlite3
+from datetime import datetime, timedelta
+
+import pymysql
+import pytest
+
+import database
+from offline_stubs import SQLiteConnection
+
+NOW = datetime(2026, 3, 1, 12, 0, 0)
+
+
+def seed():
+    """30 righe: 20 con lo stesso timestamp, in mezzo a righe più vecchie e più nuove"""
+    timestamps = ([NOW - timedelta(minutes=m) for m in range(5, 0, -1)] + [NOW] * 20 +
+                  [NOW + timedelta(minutes=m) for m in range(1, 6)])
+    records = [(f"Domanda {i}", f"Risposta {i}", timestamp, "10.0.0.1" if i % 2 else "10.0.0.2", None)
+               for i, timestamp in enumerate(timestamps)]
+    with database.pooled_connection() as conn:
+        conn.cursor().executemany(
+            "INSERT INTO conversations (user_message, ai_response, timestamp, user_ip, session_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            records
+        )
+        conn.commit()
+    return len(records)
+
+
+def walk(limit, **filters):
+    """Tutte le pagine di get_conversations_page() seguendo il cursore"""
+    rows, cursor = [], None
+    while True:
+        page, cursor = database.get_conversations_page(limit=limit, cursor=cursor, **filters)
+        assert len(page) <= limit
+        rows += page
+        if cursor is None:
+            return rows
+
+
+@pytest.mark.parametrize('limit', [1, 3, 7, 20, 50])
+def test_pages_never_repeat_or_skip_rows_with_equal_timestamps(sqlite_db, limit):
+    total = seed()
+
+    rows = walk(limit)
+
+    ids = [row['id'] for row in rows]
+    assert len(ids) == len(set(ids)) == total
+    keys = [(row['timestamp'], row['id']) for row in rows]
+    assert keys == sorted(keys, reverse=True)  # dalla più recente, a parità di timestamp per id
+
+
+def test_pages_with_filter_and_equal_timestamps(sqlite_db):
+    seed()
+
+    rows = walk(4, user_ip="10.0.0.1")
+
+    assert len(rows) == 15 and len({row['id'] for row in rows}) == 15
+    assert {row['user_ip'] for row in rows} == {"10.0.0.1"}
+
+
+def test_history_endpoint_follows_cursor(chat_app):
+    total = seed()
+    client = chat_app.app.test_client()
+
+    messages, cursor = [], None
+    while True:
+        query = '?limit=6' + (f'&cursor={cursor}' if cursor else '')
+        body = client.get('/history' + query).get_json()
+        messages += [row['user_message'] for row in body['conversations']]
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(messages) == len(set(messages)) == total
+    assert client.get('/history?cursor=non-valido').status_code == 400
+
+
+class MySQLErrors:
+    """Connessione SQLite che solleva gli errori di pymysql per indici e colonne già presenti"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        conn_cursor = self._conn.cursor()
+
+        class Cursor:
+            def execute(self, sql, params=()):
+                try:
+                    return conn_cursor.execute(sql, params)
+                except sqlite3.OperationalError as e:
+                    if 'duplicate column' in str(e):
+                        raise pymysql.err.OperationalError(1060, str(e))
+                    if 'already exists' in str(e) and 'INDEX' in sql:
+                        raise pymysql.err.OperationalError(1061, str(e))
+                    raise
+
+            def __getattr__(self, name):
+                return getattr(conn_cursor, name)
+
+        return Cursor()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def old_schema(tmp_path):
+    """Database con la tabella conversations originale, senza migrazioni"""
+    conn = SQLiteConnection(str(tmp_path / 'schema.db'))
+    conn.cursor().execute('''
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_message TEXT NOT NULL,
+            ai_response TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            user_ip VARCHAR(45)
+        )
+    ''')
+    conn.commit()
+    yield MySQLErrors(conn)
+    conn.close()
+
+
+def migrate(conn):
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        database.run_migrations(conn)
+    return log.getvalue()
+
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def test_migrations_are_idempotent(old_schema):
+    first = migrate(old_schema)
+    second = migrate(old_schema)
+
+    versions = [version for version, _, _ in database.MIGRATIONS]
+    assert applied_versions(old_schema) == versions
+    assert all(f"Migrazione {version}" in first for version in versions)
+    assert "Migrazione" not in second
+    cursor = old_schema.cursor()
+    cursor.execute("SELECT session_id FROM conversations")  # colonna aggiunta una volta sola
+    assert cursor.fetchall() == []
+
+
+def test_interrupted_migration_is_completed(old_schema):
+    # Avvio precedente interrotto dopo l'ALTER TABLE, prima di registrare la migrazione 2
+    migrate(old_schema)
+    old_schema.cursor().execute("DELETE FROM schema_migrations WHERE version = 2")
+    old_schema.commit()
+
+    log = migrate(old_schema)
+
+    assert "Migrazione 2" in log
+    assert applied_versions(old_schema) == [1, 2]
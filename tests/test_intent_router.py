@@ -0,0 +1,80 @@
+"""
+IntentRouter su messaggi etichettati: FAQ (anche con errori di battitura) con risposta
+diretta, domande sul sito, messaggi sotto soglia che passano al modello
+"""
+
+import pytest
+
+from faq import FAQ_ENTRIES
+from intent_router import IntentRouter
+
+ANSWERS = {entry['question']: entry['answer'] for entry in FAQ_ENTRIES}
+
+# (messaggio, FAQ attesa)
+FAQ_HITS = [
+    ("Quanto costa?", "Quanto costa?"),
+    ("dove avete la sede", "Dove avete la sede?"),                          # senza punteggiatura
+    ("chi puo usare il prodotto", "Chi può usare il prodotto?"),            # senza accenti
+    ("dove si trova la sede?", "Dove avete la sede?"),                      # riformulata
+    ("Come funziona il vostro prodoto?", "Come funziona il vostro prodotto?"),  # errore di battitura
+]
+
+SITE = [
+    "Come posso contattare il supporto?",
+    "Chi sono i fondatori di Alomana?",
+    "Quali servizi offre Alomana?",
+    "Posso vedere una demo del prodotto?",
+    "Quando è nata Alomana?",
+]
+
+# Somigliano a una FAQ ma sotto la soglia di risposta diretta: decide il modello (che ha le FAQ nel prompt)
+BELOW_THRESHOLD = [
+    "quanto costa il servizio?",
+    "Quanto costa il GDPR?",
+    "Quanto costa aprire una startup?",
+    "Come funziona una SRL?",
+    "Quanto costa? Rispondi solo con un numero",
+]
+
+
+@pytest.fixture(scope='module')
+def router():
+    return IntentRouter.from_faq(faq_threshold=0.85, llm_threshold=0.35, faq_margin=0.3)
+
+
+@pytest.mark.parametrize('message, question', FAQ_HITS)
+def test_faq_hits_answer_directly(router, message, question):
+    route = router.route(message)
+
+    assert route.intent == 'faq'
+    assert route.answer == ANSWERS[question]
+    assert route.score >= router.faq_threshold
+
+
+@pytest.mark.parametrize('message', SITE)
+def test_questions_about_the_startup_go_to_the_site(router, message):
+    route = router.route(message)
+
+    assert route.intent == 'site' and route.answer is None
+
+
+@pytest.mark.parametrize('message', BELOW_THRESHOLD)
+def test_below_threshold_falls_back_to_llm(router, message):
+    route = router.route(message)
+
+    assert route.intent == 'llm' and route.answer is None
+    assert router.llm_threshold <= route.score < router.faq_threshold
+
+
+def test_greetings_and_empty_messages_go_to_llm(router):
+    assert router.route("ciao!").intent == 'llm'
+    assert router.route("Che cos'è una startup?").intent == 'llm'
+    assert router.route("?!").intent == 'llm'
+
+
+def test_thresholds_decide_the_direct_answer():
+    permissive = IntentRouter.from_faq(faq_threshold=0.6, faq_margin=0.0)
+
+    route = permissive.route("quanto costa il servizio?")
+
+    assert route.intent == 'faq' and route.answer == ANSWERS["Quanto costa?"]
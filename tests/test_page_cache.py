@@ -0,0 +1,90 @@
+"""
+PageCache: un sito che non risponde non viene riscaricato a ogni richiesta
+"""
+
+import asyncio
+
+import pytest
+
+import page_cache as page_cache_module
+from page_cache import CachedPage, PageCache
+
+URL = "https://alomana.com/"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(page_cache_module.time, 'monotonic', clock)
+    return clock
+
+
+class Site:
+    """fetch() finto: None finché il sito è giù"""
+
+    def __init__(self):
+        self.up = False
+        self.calls = 0
+
+    def fetch(self, previous):
+        self.calls += 1
+        return CachedPage(URL, "Alomana sviluppa soluzioni AI", {}) if self.up else None
+
+    async def fetch_async(self, previous):
+        return self.fetch(previous)
+
+
+def test_failed_download_is_not_retried_within_negative_ttl(clock):
+    cache = PageCache(ttl=300, stale_ttl=3600, negative_ttl=30)
+    site = Site()
+
+    assert cache.get(URL, site.fetch) is None
+    assert cache.get(URL, site.fetch) is None
+    assert site.calls == 1
+    assert cache.stats()['negative_hits'] == 1
+
+    site.up = True
+    clock.now += 31
+    assert cache.get(URL, site.fetch).text == "Alomana sviluppa soluzioni AI"
+    assert site.calls == 2
+
+
+def test_old_copy_served_while_site_is_down(clock):
+    cache = PageCache(ttl=300, stale_ttl=3600, negative_ttl=30)
+    site = Site()
+    site.up = True
+    old = cache.get(URL, site.fetch)
+
+    site.up = False
+    clock.now += 3601  # oltre stale_ttl: servirebbe un download sincrono
+    assert cache.get(URL, site.fetch) is old
+    assert cache.get(URL, site.fetch) is old
+    assert site.calls == 2
+
+
+def test_async_path_uses_negative_cache(clock):
+    cache = PageCache(negative_ttl=30)
+    site = Site()
+
+    async def run():
+        return [await cache.get_async(URL, site.fetch_async) for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert site.calls == 1
+
+
+def test_negative_ttl_zero_always_retries(clock):
+    cache = PageCache(negative_ttl=0)
+    site = Site()
+
+    cache.get(URL, site.fetch)
+    cache.get(URL, site.fetch)
+    assert site.calls == 2
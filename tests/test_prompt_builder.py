@@ -0,0 +1,76 @@
+"""
+PromptBuilder: storia della sessione tagliata al budget (turni recenti prima, in ordine
+cronologico nel prompt), contesto del sito entro il budget, istruzioni fisse solo
+come system_instruction
+"""
+
+from prompt_builder import CONTEXT_HEADER, PromptBuilder, estimate_tokens
+from session_store import SessionHistory
+
+SYSTEM = "Rispondi solo alle FAQ della startup. " * 20
+
+
+def history(turns, summary=""):
+    return SessionHistory(summary, tuple((f"Domanda {i}", f"Risposta numero {i}") for i in range(turns)))
+
+
+def test_history_trimmed_to_budget_keeps_latest_turns():
+    builder = PromptBuilder(SYSTEM, history_budget=40)
+
+    built = builder.build("Ultima domanda", history=history(10))
+
+    assert built.tokens['history'] <= 40 + estimate_tokens("Conversazione recente:\n")
+    assert "Domanda 9" in built.text and "Domanda 8" in built.text
+    assert "Domanda 0" not in built.text
+
+
+def test_history_turns_from_oldest_to_newest():
+    builder = PromptBuilder(SYSTEM, history_budget=500)
+
+    text = builder.build("Ultima domanda", history=history(4)).text
+
+    positions = [text.index(f"Domanda {i}") for i in range(4)]
+    assert positions == sorted(positions)
+    assert text.index("Domanda 3") < text.index("Utente: Ultima domanda") and text.endswith("Assistente:")
+
+
+def test_summary_only_when_it_fits():
+    summary = "- Utente: prezzi → Assistente: dipende dal volume"
+    roomy = PromptBuilder(SYSTEM, history_budget=500).build("Ciao", history=history(2, summary)).text
+    tight = PromptBuilder(SYSTEM, history_budget=20).build("Ciao", history=history(2, summary)).text
+
+    assert roomy.index(summary) < roomy.index("Domanda 0")
+    assert summary not in tight and "Domanda 1" in tight
+
+
+def test_context_within_budget_and_most_relevant_first():
+    builder = PromptBuilder(SYSTEM, context_budget=30)
+    context = "Servizi:\n" + "\n".join([
+        "Il team lavora a Milano da cinque anni.",
+        "I prezzi dipendono dal volume di richieste.",
+        "I prezzi dipendono dal volume di richieste.",
+        "Organizziamo eventi per la community tecnologica italiana ogni mese.",
+    ])
+
+    built = builder.build("Quali sono i prezzi?", context)
+
+    selected = built.text.split(CONTEXT_HEADER + "\n")[1].split("\n\n")[0].splitlines()
+    assert selected[0] == "I prezzi dipendono dal volume di richieste."
+    assert len(selected) == len(set(selected))
+    assert built.tokens['context'] <= 30
+
+
+def test_system_prompt_not_in_prompt_text():
+    built = PromptBuilder(SYSTEM).build("Quanto costa?", "I prezzi dipendono dal volume.", history(1))
+
+    assert "Rispondi solo alle FAQ" not in built.text
+    assert built.tokens['system'] == estimate_tokens(SYSTEM)
+
+
+def test_model_gets_system_instruction(chat_app, monkeypatch):
+    monkeypatch.setattr(chat_app, 'model', None)
+
+    model = chat_app.get_model()
+
+    assert model.kwargs['system_instruction'] == chat_app.SYSTEM_PROMPT
+    assert chat_app.SYSTEM_PROMPT.strip() not in chat_app.build_prompt("Quanto costa?")
@@ -0,0 +1,198 @@
+"""
+Upstream e SingleFlight: retry sugli errori temporanei, deadline, chiamate identiche
+condivise (anche l'errore) e UpstreamBusy quando slot o token sono finiti
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from resilience import SingleFlight, Upstream, UpstreamBusy
+
+
+class Flaky:
+    """Fallisce `failures` volte con `error`, poi risponde"""
+
+    def __init__(self, failures, error=ConnectionError("connessione persa")):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def test_retry_then_success():
+    upstream = Upstream('test', max_retries=3, backoff_base=0.001)
+    fn = Flaky(2)
+
+    assert upstream.call(fn) == "ok"
+    assert fn.calls == 3
+    assert upstream.stats()['retries'] == 2 and upstream.stats()['failed'] == 0
+
+
+def test_permanent_error_is_not_retried():
+    upstream = Upstream('test', max_retries=3, backoff_base=0.001)
+    fn = Flaky(5, ValueError("richiesta non valida"))
+
+    with pytest.raises(ValueError):
+        upstream.call(fn)
+    assert fn.calls == 1
+
+
+def test_deadline_exceeded_stops_retrying(monkeypatch):
+    upstream = Upstream('test', max_retries=10, deadline=0.2)
+    monkeypatch.setattr(upstream, 'backoff', lambda attempt: 0.5)  # il prossimo tentativo cadrebbe oltre
+    fn = Flaky(10)
+
+    start = time.monotonic()
+    with pytest.raises(ConnectionError):
+        upstream.call(fn)
+
+    assert fn.calls == 1
+    assert time.monotonic() - start < 0.2
+    assert upstream.stats()['failed'] == 1
+
+
+def test_deadline_exceeded_async(monkeypatch):
+    upstream = Upstream('test', max_retries=10, deadline=0.2)
+    monkeypatch.setattr(upstream, 'backoff', lambda attempt: 0.5)
+    fn = Flaky(10)
+
+    async def call():
+        fn()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(upstream.call_async(call))
+    assert fn.calls == 1
+
+
+def test_busy_when_slots_are_full():
+    upstream = Upstream('test', max_concurrency=1, queue_timeout=0.05)
+
+    with upstream.slot():
+        start = time.monotonic()
+        with pytest.raises(UpstreamBusy):
+            upstream.call(lambda: "ok")
+        assert time.monotonic() - start < 1
+
+    assert upstream.stats()['rejected'] == 1 and upstream.stats()['in_flight'] == 0
+    assert upstream.call(lambda: "ok") == "ok"  # slot di nuovo libero
+
+
+def test_busy_when_slots_are_full_async():
+    upstream = Upstream('test', max_concurrency=1, queue_timeout=0.05)
+
+    async def run():
+        async with upstream.slot_async():
+            with pytest.raises(UpstreamBusy):
+                async with upstream.slot_async():
+                    pass
+
+    asyncio.run(run())
+    assert upstream.stats()['rejected'] == 1
+
+
+def test_busy_when_rate_is_exhausted():
+    upstream = Upstream('test', rate=0.5, burst=1, queue_timeout=0.01)
+
+    assert upstream.call(lambda: "ok") == "ok"
+    with pytest.raises(UpstreamBusy) as busy:
+        upstream.call(lambda: "ok")
+    assert busy.value.retry_after == 2.0
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condizione non raggiunta"
+        time.sleep(0.001)
+
+
+def run_concurrently(flight, fn, callers):
+    """Un chiamante esegue fn() e si ferma; gli altri arrivano mentre è in corso"""
+    outcomes = []
+    lock = threading.Lock()
+
+    def caller():
+        try:
+            outcome = flight.do('stessa-chiave', fn)
+        except Exception as e:
+            outcome = e
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    threads[0].start()
+    wait_until(lambda: flight.stats()['flights'] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.stats()['coalesced'] == callers - 1)
+    return threads, outcomes
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(2)
+        return "risposta"
+
+    threads, outcomes = run_concurrently(flight, fn, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert outcomes == ["risposta"] * 5
+    assert flight.stats() == {'flights': 0, 'leaders': 1, 'coalesced': 4}
+
+
+def test_concurrent_callers_share_the_exception():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    error = ConnectionError("Vertex non risponde")
+
+    def fn():
+        release.wait(2)
+        raise error
+
+    threads, outcomes = run_concurrently(flight, fn, 5)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(outcomes) == 5 and all(outcome is error for outcome in outcomes)
+    assert flight.do('stessa-chiave', lambda: "di nuovo") == "di nuovo"  # la chiave è libera
+
+
+def test_concurrent_coroutines_share_one_call_and_exception():
+    flight = SingleFlight('test')
+    calls = []
+
+    async def ok():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "risposta"
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ConnectionError("Vertex non risponde")
+
+    async def run(fn):
+        return await asyncio.gather(*(flight.do_async('stessa-chiave', fn) for _ in range(5)),
+                                    return_exceptions=True)
+
+    assert asyncio.run(run(ok)) == ["risposta"] * 5
+    errors = asyncio.run(run(failing))
+    assert len(calls) == 2
+    assert all(error is errors[0] for error in errors) and isinstance(errors[0], ConnectionError)
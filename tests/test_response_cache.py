@@ -0,0 +1,85 @@
+"""
+ResponseCache: chiave con domanda, prompt di sistema e contesto del sito (versione della
+pagina), scadenza dopo il TTL, limite in byte con eviction LRU
+"""
+
+import pytest
+
+import response_cache as response_cache_module
+from response_cache import ResponseCache
+from session_store import SessionHistory
+
+SYSTEM = "Rispondi solo alle FAQ della startup."
+PAGE_V1 = "I prezzi dipendono dal volume di richieste."
+PAGE_V2 = "I prezzi partono da 99 euro al mese."
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache_module.time, 'monotonic', clock)
+    return clock
+
+
+def test_key_includes_prompt_and_page_version():
+    key = ResponseCache.make_key("Quanto costa?", SYSTEM, PAGE_V1)
+
+    assert ResponseCache.make_key("  quanto COSTA ", SYSTEM, PAGE_V1) == key  # stessa domanda normalizzata
+    assert ResponseCache.make_key("Quanto costa?", SYSTEM + " Sii breve.", PAGE_V1) != key
+    assert ResponseCache.make_key("Quanto costa?", SYSTEM, PAGE_V2) != key
+    assert ResponseCache.make_key("Dove siete?", SYSTEM, PAGE_V1) != key
+
+
+def test_new_page_version_misses_old_answer(chat_app):
+    message = "Quali sono i prezzi dei piani?"
+    _, _, key_v1 = chat_app.cached_lookup(message, PAGE_V1)
+    chat_app.response_cache.put(key_v1, "Dipende dal volume")
+
+    assert chat_app.cached_lookup(message, PAGE_V1)[0] == "Dipende dal volume"
+    assert chat_app.cached_lookup(message, PAGE_V2)[0] is None
+    # Stessa domanda in un'altra conversazione: la storia fa parte della chiave
+    other = SessionHistory("", (("Ciao", "Ciao! Come posso aiutarti?"),))
+    assert chat_app.cached_lookup(message, PAGE_V1, other)[0] is None
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.put('k', "risposta")
+
+    clock.now += 59
+    assert cache.get('k') == "risposta"
+    clock.now += 2
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_byte_bound_evicts_least_recently_used(clock):
+    answer = "x" * 100
+    entry_size = len('a') + len(answer)
+    cache = ResponseCache(max_bytes=3 * entry_size)
+    for key in 'abc':
+        cache.put(key, answer)
+
+    cache.get('a')  # 'a' diventa la più recente: esce 'b'
+    cache.put('d', answer)
+
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acd'] == [answer] * 3
+    assert cache.stats()['bytes'] <= 3 * entry_size
+
+
+def test_answer_larger_than_cache_is_not_stored():
+    cache = ResponseCache(max_bytes=50)
+    cache.put('piccola', "ok")
+    cache.put('enorme', "x" * 100)
+
+    assert cache.get('enorme') is None
+    assert cache.get('piccola') == "ok"
@@ -0,0 +1,122 @@
+"""
+Archiviazione: una sola connessione per giro, lock che fallisce chiuso, segmenti
+saltati con i filtri per IP e sessione
+"""
+
+import contextlib
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+import offline_stubs
+import retention
+
+
+@pytest.fixture
+def single_connection_db(tmp_path):
+    pool = offline_stubs.use_sqlite(str(tmp_path / 'chatbot.db'), max_size=1)
+    pool.timeout = 1
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    archive = retention.ConversationArchive(str(tmp_path / 'archive'))
+    monkeypatch.setattr(retention, 'conversation_archive', archive)
+    return archive
+
+
+def seed(sessions=6, turns=5, days_old=200):
+    """Sessioni vecchie, una dopo l'altra, con IP diversi"""
+    start = datetime.now().replace(microsecond=0) - timedelta(days=days_old)
+    records = [(f"Domanda {s}-{t}", f"Risposta {s}-{t}", start + timedelta(minutes=s * 60 + t),
+                f"10.0.0.{s}", f"sessione-{s:04d}")
+               for s in range(sessions) for t in range(turns)]
+    with database.pooled_connection() as conn:
+        conn.cursor().executemany(
+            "INSERT INTO conversations (user_message, ai_response, timestamp, user_ip, session_id) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            records
+        )
+        conn.commit()
+
+
+def run(job):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return job.run_once()
+
+
+def test_job_runs_with_one_pooled_connection(single_connection_db, archive):
+    seed()
+    job = retention.RetentionJob(archive, hot_days=90, segment_rows=10, chunk_rows=4, pause=0)
+
+    result = run(job)
+
+    assert result['moved'] == 30 and result['segments'] == 3
+    assert database.get_conversations_page(limit=50) == ([], None)
+    assert single_connection_db.stats()['exhausted'] == 0
+
+
+def test_job_skips_when_lock_is_held_elsewhere(sqlite_db, archive):
+    seed()
+    job = retention.RetentionJob(archive, hot_days=90, pause=0)
+    with database.pooled_connection() as other:
+        cursor = other.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (retention.LOCK_NAME,))
+        cursor.fetchall()
+        assert run(job) == {'moved': 0, 'skipped': True}
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (retention.LOCK_NAME,))
+        cursor.fetchall()
+
+    assert run(job)['moved'] == 30
+
+
+def test_job_fails_closed_when_lock_errors(sqlite_db, archive, tmp_path, monkeypatch):
+    seed()
+    job = retention.RetentionJob(archive, hot_days=90, pause=0)
+
+    class NoNamedLocks(offline_stubs.SQLiteConnection):
+        """Database in cui GET_LOCK fallisce"""
+
+        def cursor(self, *args):
+            cursor = super().cursor(*args)
+            execute = cursor.execute
+
+            def guarded(sql, params=()):
+                if 'GET_LOCK' in sql:
+                    raise RuntimeError("FUNCTION GET_LOCK does not exist")
+                return execute(sql, params)
+            cursor.execute = guarded
+            return cursor
+
+    pool = database.ConnectionPool(lambda: NoNamedLocks(str(tmp_path / 'chatbot.db')), max_size=1)
+    monkeypatch.setattr(database, '_pool', pool)
+    try:
+        assert run(job) == {'moved': 0, 'skipped': True}
+        assert len(database.get_conversations_page(limit=50)[0]) == 30
+        assert archive.segments() == []
+    finally:
+        pool.close()
+
+
+def test_filtered_history_skips_segments(sqlite_db, archive, monkeypatch):
+    seed()
+    run(retention.RetentionJob(archive, hot_days=90, segment_rows=5, pause=0))
+    # Un altro processo: manifest dal disco e nessun segmento in cache
+    archive = retention.ConversationArchive(archive.directory)
+    monkeypatch.setattr(retention, 'conversation_archive', archive)
+    assert len(archive.segments()) == 6
+
+    rows, cursor = retention.get_history_page(limit=20, session_id='sessione-0003')
+
+    assert [row['user_message'] for row in rows] == [f"Domanda 3-{t}" for t in reversed(range(5))]
+    assert cursor is None
+    assert archive.decompressed == 1
+    assert archive.skipped == 5
+
+    rows = list(retention.iter_history(user_ip='10.0.0.1'))
+    assert {row['session_id'] for row in rows} == {'sessione-0001'}
+    assert archive.decompressed == 2
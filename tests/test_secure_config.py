@@ -0,0 +1,117 @@
+"""
+Cache dei segreti di SecureConfig con il Secret Manager in memoria di offline_stubs
+"""
+
+import contextlib
+import io
+
+import pytest
+
+import secure_config as secure_config_module
+from offline_stubs import FakeSecretManager
+from secure_config import DATABASE_SECRETS, SecureConfig
+
+SECRETS = {'db-host': '10.1.2.3', 'db-user': 'chatbot', 'db-password': 's3greta', 'db-name': 'alomana'}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(secure_config_module.time, 'monotonic', clock)
+    return clock
+
+
+def make_config(monkeypatch, secrets=SECRETS, cache_ttl=3600, negative_ttl=60):
+    monkeypatch.setenv('SECRET_CACHE_TTL', str(cache_ttl))
+    monkeypatch.setenv('SECRET_NEGATIVE_TTL', str(negative_ttl))
+    client = FakeSecretManager(dict(secrets), latency=0)
+    return SecureConfig(client=client), client
+
+
+def quiet(function, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def test_secret_cached_until_ttl(monkeypatch, clock):
+    config, client = make_config(monkeypatch, cache_ttl=100)
+
+    assert config.db_host == '10.1.2.3'
+    assert config.db_host == '10.1.2.3'
+    assert client.calls == 1
+
+    client.secrets['db-host'] = '10.9.9.9'
+    clock.now += 99
+    assert config.db_host == '10.1.2.3'
+    clock.now += 2
+    assert config.db_host == '10.9.9.9'
+    assert client.calls == 2
+
+
+def test_missing_secret_uses_env_and_negative_cache(monkeypatch, clock):
+    monkeypatch.setenv('DB_NAME', 'dal-env')
+    config, client = make_config(monkeypatch, secrets={}, negative_ttl=30)
+
+    assert quiet(lambda: config.db_name) == 'dal-env'
+    assert quiet(lambda: config.db_name) == 'dal-env'
+    assert client.calls == 1  # il fallimento è ricordato: nessun nuovo timeout
+    assert config.cache_stats()['db-name'] == {'found': False, 'expires_in': 30}
+
+    client.secrets['db-name'] = 'da-secret-manager'
+    clock.now += 31
+    assert config.db_name == 'da-secret-manager'
+    assert client.calls == 2
+
+
+def test_failed_refresh_keeps_last_value(monkeypatch, clock):
+    config, client = make_config(monkeypatch, cache_ttl=100, negative_ttl=10)
+    assert config.db_password == 's3greta'
+
+    del client.secrets['db-password']
+    clock.now += 101
+    assert quiet(lambda: config.db_password) == 's3greta'
+    assert config.cache_stats()['db-password']['expires_in'] == 10
+
+
+def test_prefetch_fills_cache(monkeypatch, clock):
+    config, client = make_config(monkeypatch, secrets={k: v for k, v in SECRETS.items() if k != 'db-user'})
+    monkeypatch.setenv('DB_USER', 'utente-env')
+
+    quiet(config.prefetch)
+
+    assert client.calls == len(DATABASE_SECRETS)
+    assert config.missing_secrets() == {}
+    assert quiet(config.get_database_config) == {
+        'host': '10.1.2.3', 'user': 'utente-env', 'password': 's3greta', 'database': 'alomana',
+    }
+    assert client.calls == len(DATABASE_SECRETS)
+
+
+def test_missing_secrets_after_expiry(monkeypatch, clock):
+    config, _ = make_config(monkeypatch, cache_ttl=100)
+    quiet(config.prefetch)
+
+    clock.now += 101
+    assert config.missing_secrets() == DATABASE_SECRETS
+
+
+def test_env_fallback_without_secret_manager(monkeypatch, clock):
+    from google.cloud import secretmanager
+
+    def no_credentials():
+        raise RuntimeError("credenziali non trovate")
+
+    monkeypatch.setattr(secretmanager, 'SecretManagerServiceClient', no_credentials)
+    monkeypatch.setenv('DB_HOST', 'localhost')
+    config = SecureConfig()
+
+    assert quiet(lambda: config.db_host) == 'localhost'
+    assert config.get_secret_client() is None  # il client non viene ricreato a ogni richiesta
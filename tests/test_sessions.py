@@ -0,0 +1,170 @@
+"""
+Sessioni: cookie firmato, nessuna lettura dal database per le sessioni appena create,
+lettura con tempo massimo, turni concorrenti su Redis
+"""
+
+import json
+import threading
+import time
+
+import database
+from session_store import RedisSessionStore, SessionHistory
+
+
+def cookie_session(client, chat_app):
+    """Contenuto del cookie di sessione firmato"""
+    cookie = client.get_cookie('chat_session')
+    return chat_app.app.session_interface.get_signing_serializer(chat_app.app).loads(cookie.value)
+
+
+def test_session_lives_in_signed_cookie(chat_app, monkeypatch):
+    client = chat_app.app.test_client()
+    sessions = chat_app.session_store.stats()['sessions']
+    client.get('/')
+    assert chat_app.session_store.stats()['sessions'] == sessions  # aprire la pagina non crea sessioni
+
+    def restore(*args, **kwargs):
+        raise AssertionError("storia cercata nel database per una sessione nuova")
+
+    monkeypatch.setattr(chat_app, 'get_conversations_page', restore)
+    response = client.post('/chat', json={'message': "Quanto costa?"})
+
+    assert 'session_id' not in response.get_json()
+    header = response.headers['Set-Cookie']
+    assert 'HttpOnly' in header and 'SameSite=Lax' in header
+    session_id = cookie_session(client, chat_app)['id']
+    assert chat_app.session_store.get(session_id).turns[-1][0] == "Quanto costa?"
+
+    client.post('/chat', json={'message': "Come posso contattarvi?"})
+    assert len(chat_app.session_store.get(session_id).turns) == 2
+
+
+def test_session_cannot_be_taken_from_body_or_forged_cookie(chat_app):
+    victim = chat_app.app.test_client()
+    victim.post('/chat', json={'message': "Quanto costa?"})
+    victim_id = cookie_session(victim, chat_app)['id']
+
+    attacker = chat_app.app.test_client()
+    attacker.post('/chat', json={'message': "Come posso contattarvi?", 'session_id': victim_id})
+    assert cookie_session(attacker, chat_app)['id'] != victim_id
+
+    forger = chat_app.app.test_client()
+    forger.set_cookie('chat_session', victim_id)  # cookie senza firma valida
+    forger.post('/chat', json={'message': "Come posso contattarvi?"})
+    assert cookie_session(forger, chat_app)['id'] != victim_id
+
+    assert len(chat_app.session_store.get(victim_id).turns) == 1
+
+
+def test_history_returns_only_public_fields(chat_app):
+    with database.pooled_connection() as conn:
+        conn.cursor().execute(
+            "INSERT INTO conversations (user_message, ai_response, user_ip, session_id) VALUES (%s, %s, %s, %s)",
+            ("Quanto costa?", "Dipende dal piano", "10.0.0.1", "sessione-segreta-0001")
+        )
+        conn.commit()
+    client = chat_app.app.test_client()
+
+    rows = client.get('/history').get_json()['conversations']
+    rows += [json.loads(line) for line in client.get('/history?format=ndjson').get_data(as_text=True).splitlines()]
+
+    assert len(rows) == 2
+    # Né l'ID di sessione né l'IP: /history è pubblico
+    assert all(set(row) == {'user_message', 'ai_response', 'timestamp'} for row in rows)
+    assert rows[0]['user_message'] == "Quanto costa?"
+    assert len(client.get('/history?ip=10.0.0.1').get_json()['conversations']) == 1
+    assert client.get('/history?ip=10.0.0.2').get_json()['conversations'] == []
+
+
+def test_restore_gives_up_after_timeout(chat_app, monkeypatch):
+    release = threading.Event()
+
+    def slow_restore(*args, **kwargs):
+        release.wait(5)  # MySQL che non risponde
+        return [], None
+
+    monkeypatch.setattr(chat_app, 'get_conversations_page', slow_restore)
+    monkeypatch.setattr(chat_app.Config, 'SESSION_RESTORE_TIMEOUT', 0.1)
+    try:
+        start = time.monotonic()
+        history = chat_app.load_history('sessione-sconosciuta-1234')
+        elapsed = time.monotonic() - start
+    finally:
+        release.set()
+
+    assert history == SessionHistory()
+    assert elapsed < 1
+    assert chat_app.session_store.get('sessione-sconosciuta-1234') is None  # si riprova al prossimo messaggio
+
+
+def test_restored_history_is_cached(chat_app, monkeypatch):
+    calls = []
+
+    def restore(*args, **kwargs):
+        calls.append(kwargs['session_id'])
+        return [{'user_message': "seconda", 'ai_response': "due"},
+                {'user_message': "prima", 'ai_response': "uno"}], None
+
+    monkeypatch.setattr(chat_app, 'get_conversations_page', restore)
+    history = chat_app.load_history('sessione-da-riprendere-1')
+
+    assert history.turns == (("prima", "uno"), ("seconda", "due"))
+    assert chat_app.load_history('sessione-da-riprendere-1') == history
+    assert calls == ['sessione-da-riprendere-1']
+
+
+class FakeRedis:
+    """Client Redis minimo: GET, SET e transaction() con WATCH ottimistico"""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.before_exec = None
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        while True:
+            seen = {key: self.versions.get(key, 0) for key in watches}
+            pipe = FakePipeline(self)
+            value = func(pipe)
+            if self.before_exec:
+                hook, self.before_exec = self.before_exec, None
+                hook()
+            if any(self.versions.get(key, 0) != version for key, version in seen.items()):
+                continue  # WatchError: la chiave è cambiata, si riprova
+            for key, raw, ex in pipe.commands:
+                self.set(key, raw, ex)
+            return value if value_from_callable else None
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def multi(self):
+        pass
+
+    def set(self, key, value, ex=None):
+        self.commands.append((key, value, ex))
+
+
+def test_redis_append_keeps_concurrent_turns():
+    client = FakeRedis()
+    store = RedisSessionStore(client)
+    store.append('s', "prima", "uno")
+
+    # Un altro worker aggiunge un turno tra la lettura e la scrittura
+    client.before_exec = lambda: RedisSessionStore(client).append('s', "concorrente", "due")
+    store.append('s', "seconda", "tre")
+
+    assert [user for user, _ in store.get('s').turns] == ["prima", "concorrente", "seconda"]
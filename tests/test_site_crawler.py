@@ -0,0 +1,116 @@
+"""
+SiteCrawler su un sito locale (offline_stubs.FixtureSite): limiti di profondità e di
+pagine, robots.txt, URL canonici, pagine duplicate e restrizione allo stesso host
+"""
+
+import contextlib
+import io
+
+import pytest
+import requests
+
+from html_extractor import create_extractor
+from offline_stubs import FixtureSite, make_html
+from site_crawler import SiteCrawler, canonical_url
+
+
+def parse_page(html, base_url):
+    extracted = create_extractor('stdlib').extract(html, base_url)
+    return extracted.text, extracted.links
+
+
+@pytest.fixture
+def site():
+    pages = {'/robots.txt': b"User-agent: *\nDisallow: /private\n"}
+    with FixtureSite(pages) as fixture:
+        other_host = fixture.url.replace('127.0.0.1', 'localhost')
+        pages.update({
+            '/': make_html(5, links=[
+                '/a', '/a#contatti', '/a?utm_source=newsletter', '/b/', 'b',
+                '/dup', '/private/secret', '/brochure.pdf', other_host + 'other',
+            ], seed=1),
+            '/a': make_html(5, links=['/a/deep'], seed=2),
+            '/b': make_html(5, links=['/'], seed=3),
+            '/dup': make_html(5, seed=2),  # stesso testo di /a con un altro URL
+            '/a/deep': make_html(5, links=['/a/deep/deeper'], seed=4),
+            '/a/deep/deeper': make_html(5, seed=5),
+            '/private/secret': make_html(5, seed=6),
+            '/other': make_html(5, seed=7),
+        })
+        yield fixture
+
+
+def crawl(site, **options):
+    session = requests.Session()
+    crawler = SiteCrawler(site.url, session, parse_page, rate_per_host=0, **options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        pages = crawler.crawl()
+    session.close()
+    return {page.url.rsplit(str(site.server.server_port), 1)[1]: page.depth for page in pages}
+
+
+def fetched(site):
+    return [path for path in site.paths if path != '/robots.txt']
+
+
+def test_depth_limit(site):
+    assert crawl(site, max_depth=0) == {'/': 0}
+    assert crawl(site, max_depth=1) == {'/': 0, '/a': 1, '/b': 1}
+    assert crawl(site, max_depth=2) == {'/': 0, '/a': 1, '/b': 1, '/a/deep': 2}
+
+
+def test_page_limit(site):
+    pages = crawl(site, max_pages=2, max_depth=5)
+
+    assert len(fetched(site)) == 2
+    assert list(pages) == ['/', '/a']
+
+
+def test_robots_txt_is_respected(site):
+    crawl(site, max_depth=3)
+
+    assert '/robots.txt' in site.paths
+    assert not any(path.startswith('/private') for path in site.paths)
+
+
+def test_canonical_urls_fetched_once(site):
+    crawl(site, max_depth=3)
+
+    paths = fetched(site)
+    assert sorted(paths) == sorted(set(paths))
+    assert paths.count('/a') == 1 and paths.count('/b') == 1
+    assert canonical_url('HTTP://Example.com:80/a/?utm_source=x&b=2#top') == 'http://example.com/a?b=2'
+
+
+def test_duplicate_content_indexed_once(site):
+    pages = crawl(site, max_depth=1)
+
+    assert '/dup' in fetched(site)
+    assert '/dup' not in pages and '/a' in pages
+
+
+def test_same_host_only(site):
+    crawl(site, max_depth=3)
+
+    assert '/other' not in site.paths
+    assert '/brochure.pdf' not in site.paths
+
+
+def test_large_pages_are_read_up_to_max_bytes(site):
+    huge = make_html(20000, seed=8)
+    site.pages['/b'] = huge
+    received = {}
+
+    def parse_and_measure(html, base_url):
+        received[base_url.rsplit('/', 1)[1]] = len(html)
+        return parse_page(html, base_url)
+
+    session = requests.Session()
+    crawler = SiteCrawler(site.url, session, parse_and_measure, max_depth=1, rate_per_host=0, max_bytes=64 * 1024)
+    with contextlib.redirect_stdout(io.StringIO()):
+        crawler.crawl()
+    session.close()
+
+    assert len(huge) > 1024 * 1024
+    assert received['b'] == 64 * 1024 + 1  # un byte oltre il limite: l'estrattore segnala il troncamento
+    assert received['a'] < 64 * 1024
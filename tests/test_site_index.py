@@ -0,0 +1,57 @@
+"""
+SiteIndex (BM25): la frase più pertinente viene prima, query vuote o senza
+corrispondenze non restituiscono nulla, l'indice conta nella dimensione della pagina
+"""
+
+from page_cache import CachedPage
+from site_index import SiteIndex, split_passages
+
+TEXT = """Alomana sviluppa soluzioni di intelligenza artificiale per le aziende.
+I nostri prezzi dipendono dal volume di richieste e dal piano scelto.
+Il team lavora a Milano e segue i clienti dall'analisi all'integrazione.
+Per il supporto tecnico scrivete a supporto@alomana.com.
+Alomana sviluppa soluzioni di intelligenza artificiale per le aziende.
+Sicurezza dei documenti: i dati dei clienti restano cifrati nel cloud."""
+
+
+def test_best_matching_passage_ranks_first():
+    index = SiteIndex.from_text(TEXT)
+
+    results = index.search("Quanto costano i piani? Dipende dal volume?")
+
+    assert results[0][1].startswith("I nostri prezzi")
+    scores = [score for score, _ in results]
+    assert scores == sorted(scores, reverse=True)
+    assert index.search("sicurezza dei documenti dei clienti", top_k=1)[0][1].startswith("Sicurezza")
+
+
+def test_accents_and_case_do_not_matter():
+    index = SiteIndex(["L'AZIENDA è a Milano e lavora con la città"])
+
+    assert index.search("citta milano")
+
+
+def test_duplicate_passages_indexed_once():
+    index = SiteIndex.from_text(TEXT)
+
+    assert len(index) == len(set(split_passages(TEXT))) == 5
+
+
+def test_empty_or_unmatched_query_returns_nothing():
+    index = SiteIndex.from_text(TEXT)
+
+    assert index.search("") == []
+    assert index.search("il di che come") == []  # solo stopword
+    assert index.search("blockchain criptovalute") == []
+    assert SiteIndex([]).search("prezzi") == []
+
+
+def test_index_size_counted_in_cached_page():
+    index = SiteIndex.from_text(TEXT)
+    info = {'email': "supporto@alomana.com"}
+
+    without_index = CachedPage("https://alomana.com/", TEXT, info)
+    with_index = CachedPage("https://alomana.com/", TEXT, info, index=index)
+
+    assert index.size_estimate() > sum(len(p.encode('utf-8')) for p in index.passages)
+    assert with_index.size == without_index.size + index.size_estimate()
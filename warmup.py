@@ -0,0 +1,119 @@
+"""
+Avvio rapido del chatbot
+Misura il tempo di import dell'app e prepara in background le risorse lente
+(modello Gemini, segreti, pool database, pagina del sito) invece che all'import:
+/ready riporta lo stato di ogni fase, così il cold start si può misurare
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Riferimento per i tempi di avvio: questo modulo è il primo importato da app.py
+PROCESS_START = time.perf_counter()
+
+
+class WarmUp:
+    """
+    Fasi di riscaldamento eseguite in thread in background
+
+    Le fasi indipendenti partono insieme; `after` fa attendere una fase
+    (es. il pool database aspetta i segreti). Una fase fallita non blocca
+    le altre: l'app funziona comunque con i fallback e /ready la segnala.
+    """
+
+    def __init__(self):
+        self._steps: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.import_ms = None
+        self.started_at = None
+        self.finished_at = None
+
+    def imported(self, name: str = 'app'):
+        """Registra la fine dell'import dell'applicazione"""
+        self.import_ms = (time.perf_counter() - PROCESS_START) * 1000
+        print(f"⏱️ Import di {name} completato in {self.import_ms:.0f}ms")
+
+    def add(self, name: str, step: Callable[[], object], after: Optional[str] = None):
+        self._steps[name] = {'fn': step, 'after': after, 'status': 'pending',
+                             'ms': None, 'error': None, 'done': threading.Event()}
+
+    def start(self):
+        """Avvia le fasi in background (una sola volta per processo)"""
+        with self._lock:
+            if self.started_at is not None:
+                return
+            self.started_at = time.perf_counter()
+        if not self._steps:
+            self._finish()
+            return
+        for name in self._steps:
+            threading.Thread(target=self._run_step, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+    def _run_step(self, name: str):
+        step = self._steps[name]
+        if step['after'] in self._steps:
+            self._steps[step['after']]['done'].wait()
+        step['status'] = 'running'
+        start = time.perf_counter()
+        try:
+            step['fn']()
+            step['status'] = 'ok'
+        except Exception as e:
+            step['status'] = 'failed'
+            step['error'] = str(e)
+            print(f"⚠️ Warm-up {name} fallito: {e}")
+        step['ms'] = round((time.perf_counter() - start) * 1000, 1)
+        step['done'].set()
+        if all(s['done'].is_set() for s in self._steps.values()):
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self.finished_at = time.perf_counter()
+            self._done.set()
+        failed = [name for name, s in self._steps.items() if s['status'] == 'failed']
+        print(f"🔥 Warm-up completato in {(self.finished_at - self.started_at) * 1000:.0f}ms"
+              + (f" (fallite: {', '.join(failed)})" if failed else ""))
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def status(self) -> dict:
+        """Stato per /ready"""
+        warmup_ms = None
+        if self.started_at is not None:
+            end = self.finished_at if self.finished_at is not None else time.perf_counter()
+            warmup_ms = round((end - self.started_at) * 1000, 1)
+        return {
+            'ready': self.ready,
+            'import_ms': round(self.import_ms, 1) if self.import_ms is not None else None,
+            'warmup_ms': warmup_ms,
+            'ready_ms': round((self.finished_at - PROCESS_START) * 1000, 1) if self.finished_at else None,
+            'steps': {
+                name: {'status': s['status'], 'ms': s['ms'], 'error': s['error']}
+                for name, s in self._steps.items()
+            },
+        }
+
+    def stats(self) -> dict:
+        """Valori numerici per /metrics"""
+        status = self.status()
+        return {
+            'ready': int(status['ready']),
+            'import_ms': status['import_ms'] or 0,
+            'warmup_ms': status['warmup_ms'] or 0,
+            'failed_steps': sum(1 for s in status['steps'].values() if s['status'] == 'failed'),
+        }
+
+
+# Istanza globale per il processo (ogni worker Gunicorn fa il suo warm-up dopo il fork)
+warmup = WarmUp()